@@ -0,0 +1,243 @@
+import gzip
+import hashlib
+import io
+import json
+from functools import wraps
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_login import current_user
+
+from bulk import FORMATS, FORMAT_BY_MIMETYPE, export_records, import_records, read_records
+from catalog import CatalogError, TTLCache
+from drinks import Drink
+from local_catalog import active_catalog
+from models import FavoriteDrink, read_replica
+from passwords import password_hasher
+from pagination import by_name, paginate
+from recommendations import recommendations
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always offered
+    brotli = None
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Compressed bodies by (ETag, encoding), so a popular response is only compressed once
+_compressed = TTLCache(maxsize=512)
+
+
+def project_drink(drink):
+    """Return the compact form of a Drink: id, name, thumb and ingredients"""
+    return {
+        'id': drink.id,
+        'name': drink.name,
+        'thumb': drink.thumb,
+        'ingredients': [{'name': name, 'measure': measure} for name, measure in drink.ingredients],
+    }
+
+
+def _encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def _compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=current_app.config['API_BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=current_app.config['API_GZIP_LEVEL'])
+
+
+def api_response(payload, cache_control=None, conditional=True):
+    """Serialize a payload compactly, answer If-None-Match with 304 and compress the body
+
+    The ETag is a hash of the uncompressed JSON; compressed variants get
+    the encoding appended so caches never mix them up.
+    """
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    encoding = None
+    if len(body) >= current_app.config['API_COMPRESS_MIN_SIZE']:
+        encoding = request.accept_encodings.best_match(_encodings())
+
+    headers = {'Vary': 'Accept-Encoding'}
+    headers['Cache-Control'] = cache_control or f"private, max-age={current_app.config['API_CACHE_MAX_AGE']}"
+
+    etag = None
+    if conditional:
+        etag = hashlib.sha1(body).hexdigest()
+        if encoding:
+            etag = f'{etag}-{encoding}'
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304, headers=headers)
+            response.set_etag(etag)
+            return response
+
+    if encoding:
+        compressed = _compressed.get((etag, encoding))[0] if etag else None
+        if compressed is None:
+            compressed = _compress(body, encoding)
+            if etag:
+                _compressed.set((etag, encoding), compressed, current_app.config['API_CACHE_MAX_AGE'])
+        body = compressed
+        headers['Content-Encoding'] = encoding
+
+    response = Response(body, mimetype='application/json', headers=headers)
+    if etag:
+        response.set_etag(etag)
+    return response
+
+
+def api_error(message, status):
+    return jsonify({'error': message}), status
+
+
+# Every API route needs a logged-in user; answer with 401 instead of redirecting to the login page
+@bp.before_request
+def require_login():
+    if not current_user.is_authenticated:
+        return api_error('Authentication required.', 401)
+
+
+# The catalog being down is a 503 for API clients
+@bp.errorhandler(CatalogError)
+def catalog_unavailable(error):
+    return api_error('The cocktail catalog is unavailable right now. Please try again shortly.', 503)
+
+
+# Search drinks by name
+@bp.route('/drinks/search')
+def search_drinks():
+    name = request.args.get('name', '').strip()
+    if not name:
+        return api_error('Pass a drink name to search for.', 400)
+
+    drinks = active_catalog().search_drinks(name) or []
+    return api_response({'drinks': [project_drink(drink) for drink in drinks]})
+
+
+# Drinks whose name starts with a letter
+@bp.route('/drinks/letter/<letter>')
+def drinks_by_letter(letter):
+    if len(letter) != 1 or not letter.isalpha():
+        return api_error('Pass a single letter.', 400)
+
+    drinks = active_catalog().drinks_by_letter(letter) or []
+    return api_response({'drinks': [project_drink(drink) for drink in drinks]})
+
+
+# One page of the alcoholic or non-alcoholic drinks (sorted by name), with their ingredients filled in
+@bp.route('/drinks/filter/<type>')
+def filter_by_alcoholic(type):
+    if type not in ['Alcoholic', 'Non_Alcoholic']:
+        return api_error('Filter by "Alcoholic" or "Non_Alcoholic".', 400)
+
+    drinks = active_catalog().filter_by_alcoholic(type) or []
+    page = paginate(by_name(drinks), request.args.get('page', 1, type=int), current_app.config['LISTING_PAGE_SIZE'])
+    if page is None:
+        return api_error('No such page.', 404)
+
+    # filter.php only returns names and thumbnails, so fetch the details of this page in one batch
+    details = active_catalog().lookup_drinks(drink.id for drink in page.items)
+    return api_response({
+        'drinks': [project_drink(details.get(drink.id, drink)) for drink in page.items],
+        'page': page.page,
+        'pages': page.pages,
+        'total': page.total,
+        'next_page': page.next_num,
+    })
+
+
+# A random drink; never cached
+@bp.route('/drinks/random')
+def random_drink():
+    drink = active_catalog().random_drink()
+    if not drink:
+        return api_error('No drink found.', 404)
+    return api_response({'drink': project_drink(drink)}, cache_control='no-store', conditional=False)
+
+
+def project_recommendation(recommendation):
+    """Return a Recommendation as a compact drink and its score"""
+    drink = Drink(recommendation.drink_id, recommendation.drink_name, recommendation.drink_thumb)
+    return {'drink': project_drink(drink), 'score': recommendation.score}
+
+
+# Drinks most often favorited by the users who favorited this one
+@bp.route('/drinks/<drink_id>/similar')
+def similar_drinks(drink_id):
+    limit = max(0, min(request.args.get('limit', 10, type=int), current_app.config['RECOMMENDATIONS_NEIGHBORS']))
+    similar = recommendations.similar(drink_id, limit)
+    return api_response({'drinks': [project_recommendation(recommendation) for recommendation in similar]})
+
+
+# Drinks the user is most likely to favorite next, from the drinks they have favorited
+@bp.route('/recommendations')
+@read_replica()
+def recommended_drinks():
+    limit = max(0, min(request.args.get('limit', 10, type=int), current_app.config['RECOMMENDATIONS_NEIGHBORS']))
+    recommended = recommendations.for_user(current_user.id, limit)
+    return api_response({'drinks': [project_recommendation(recommendation) for recommendation in recommended]},
+                        cache_control='private, no-cache')
+
+
+# One keyset page of the user's favorites
+@bp.route('/favorites')
+@read_replica()
+def favorites():
+    after = request.args.get('after', type=int)
+    favorites, next_cursor = FavoriteDrink.page_for_user(current_user.id, after, current_app.config['FAVORITES_PAGE_SIZE'])
+    details = active_catalog().lookup_drinks(favorite.drink_id for favorite in favorites)
+
+    items = []
+    for favorite in favorites:
+        drink = details.get(favorite.drink_id)
+        if drink is None:
+            drink = Drink(favorite.drink_id, favorite.drink_name, favorite.drink_thumb)
+        items.append({'id': favorite.id, 'drink': project_drink(drink)})
+
+    # Favorites change under the user, so revalidate every time (still cheap with the ETag)
+    return api_response({'favorites': items, 'next_cursor': next_cursor}, cache_control='private, no-cache')
+
+
+def admin_required(view):
+    """Answer 403 unless the user's email is one of the ADMIN_EMAILS"""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        if current_user.email not in current_app.config['ADMIN_EMAILS']:
+            return api_error('Only admins can do that.', 403)
+        return view(*args, **kwargs)
+    return wrapped
+
+
+# Import users or favorites from a CSV or JSONL request body, streamed in batches
+# (users only with a PASSWORD_HASH_POOL; large member lists are better run with `flask bulk import`)
+@bp.route('/admin/import/<any(users, favorites):kind>', methods=['POST'])
+@admin_required
+def import_bulk(kind):
+    format = request.args.get('format') or FORMAT_BY_MIMETYPE.get(request.mimetype)
+    if format not in FORMATS:
+        return api_error('Send text/csv or application/x-ndjson, or pass format=csv or format=jsonl.', 400)
+
+    if kind == 'users' and password_hasher.executor is None:
+        # Every row is a bcrypt hash; without a pool they'd all run on (and hold up) this worker
+        return api_error('Importing users needs PASSWORD_HASH_POOL set; use `flask bulk import users` instead.', 400)
+
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    # Passwords are hashed on the PASSWORD_HASH_POOL, never on processes forked from this worker
+    result = import_records(kind, read_records(stream, format), current_app.config['BULK_IMPORT_BATCH_SIZE'])
+    return api_response(result.to_dict(), cache_control='no-store', conditional=False)
+
+
+# Every user (without password hashes) or favorite as CSV or JSONL, streamed a batch at a time
+@bp.route('/admin/export/<any(users, favorites):kind>')
+@admin_required
+def export_bulk(kind):
+    format = request.args.get('format', 'csv')
+    if format not in FORMATS:
+        return api_error('Pass format=csv or format=jsonl.', 400)
+
+    chunks = export_records(kind, format, current_app.config['BULK_IMPORT_BATCH_SIZE'])
+    return Response(stream_with_context(chunks), mimetype=FORMATS[format], headers={
+        'Content-Disposition': f'attachment; filename={kind}.{format}',
+        'Cache-Control': 'no-store',
+    })
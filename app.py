@@ -1,51 +1,179 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify
-from flask_debugtoolbar import DebugToolbarExtension
-from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from models import connect_db, db, User, FavoriteDrink
-from forms import RegisterUserForm, LoginForm, IngredientSearchForm, EditProfileForm, ChangePasswordForm, DeleteAccountForm
-import requests
-from flask_wtf.csrf import CSRFProtect
-
-app = Flask(__name__)
-
-# Configuration settings for the app
-app.config['SQLALCHEMY_DATABASE_URI'] = 'postgresql:///whatsyourpoison'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = "Sharapova1"
-app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False  
+import os
 
-# Enable debugging toolbar
-toolbar = DebugToolbarExtension(app)
+import click
+from flask import Blueprint, Flask, Response, abort, current_app, render_template, redirect, url_for, flash, request, jsonify, send_file, stream_with_context, get_flashed_messages
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+from models import connect_db, db, read_replica, User, FavoriteDrink
+from forms import RegisterUserForm, LoginForm, IngredientSearchForm, EditProfileForm, ChangePasswordForm, DeleteAccountForm, WhatCanIMakeForm
+from catalog import catalog, CatalogError, rank_by_ingredients
+from async_catalog import async_catalog
+from cache_warmer import cache_warmer
+from local_catalog import active_catalog, catalog_cli
+from ingredient_index import ingredient_index, ensure_loaded
+from suggest_index import suggest_index
+from thumbs import THUMB_SIZES, ThumbnailError, thumb_cache
+from passwords import password_hasher
+from metrics import metrics
+from user_cache import user_cache
+from config import configs
+from api import bp as api_bp
+from fragments import fragment_cache, splice
+from pagination import by_name, paginate
+from leaderboard import leaderboard, leaderboard_cli
+from recommendations import recommendations
+from bulk import bulk_cli
+from markupsafe import Markup
+from flask_wtf.csrf import CSRFProtect, generate_csrf
+from asgiref.sync import sync_to_async
+
+bp = Blueprint('main', __name__)
 
 # Set up Login Manager
-login_manager = LoginManager(app)
-login_manager.login_view = 'login'
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
 login_manager.login_message = "Please log in to access this page."
 login_manager.login_message_category = "info"
 
-# Enable CSRF protection
+# CSRF protection
 csrf = CSRFProtect()
-csrf.init_app(app)
 
-# Connect to the database and create tables if they don't exist
-with app.app_context():
+
+def create_app(config=None):
+    """Create and configure the app
+
+    `config` is a config class or the name of one in config.configs; it
+    defaults to the FLASK_ENV environment variable. Nothing here touches
+    the database, so workers, tests and CLI commands start quickly; use
+    `flask create-db` to create the tables.
+    """
+    if config is None:
+        config = os.environ.get('FLASK_ENV', 'production')
+    if isinstance(config, str):
+        config = configs[config]
+
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    # Enable the debugging toolbar in development only
+    if app.debug:
+        from flask_debugtoolbar import DebugToolbarExtension
+        DebugToolbarExtension(app)
+
+    # Time every request (first, so the other hooks are counted too) and serve /metrics
+    metrics.init_app(app)
+
+    login_manager.init_app(app)
+
+    # Set up password hashing
+    password_hasher.init_app(app)
+
+    # Cache logged-in users per process
+    user_cache.init_app(app)
+
+    # Enable CSRF protection
+    csrf.init_app(app)
+
+    # Cache rendered result lists between requests
+    fragment_cache.init_app(app)
+
+    # Keep drink thumbnails on local disk instead of hot-linking the upstream CDN
+    thumb_cache.init_app(app)
+
+    # Set up the cached CocktailDB client and the `flask catalog` commands
+    catalog.init_app(app)
+    # Refresh the hot catalog queries before they go stale
+    cache_warmer.init_app(app)
+    # Awaitable lookups on a shared async HTTP client, for the async views
+    async_catalog.init_app(app)
+    app.cli.add_command(catalog_cli)
+    # Cache the most favorited drinks and add the `flask leaderboard` commands
+    leaderboard.init_app(app)
+    app.cli.add_command(leaderboard_cli)
+    # Rebuild the typeahead index in the background whenever the catalog changes
+    suggest_index.init_app(app)
+    # Rebuild the "also liked" recommendations from the favorites now and then
+    recommendations.init_app(app)
+    app.cli.add_command(create_db_command)
+    # `flask bulk import` and `flask bulk export` for users and favorites
+    app.cli.add_command(bulk_cli)
+
+    # Keep the pantry index current with every page of drinks fetched from the API
+    catalog.add_listener(ingredient_index.update)
+
+    # Connect to the database (lazily; no connection is made until it is used)
     connect_db(app)
+
+    app.register_blueprint(bp)
+    app.register_blueprint(api_bp)
+    if app.config['ASYNC_VIEWS']:
+        use_async_views(app)
+    return app
+
+
+def use_async_views(app):
+    """Serve the upstream-bound routes from their async variants (see asgi.py)"""
+    app.config['ASYNC_VIEWS'] = True
+    app.view_functions.update(ASYNC_VIEWS)
+
+
+# Command to create the database tables if they don't exist
+@click.command('create-db')
+@click.option('--replica', is_flag=True, help="Also create them on the read replica (a local stand-in, not a real replica).")
+def create_db_command(replica):
+    """Create the database tables."""
     db.create_all()
+    if replica:
+        db.Model.metadata.create_all(db.get_engine(bind='replica'))
+    click.echo("Created the database tables.")
+
+# Render a template as a stream of chunks instead of one big string
+def stream_template(template_name, **context):
+    # The session cookie goes out before the body, so anything the template
+    # would store in the session (CSRF token, consumed flashes) is done up front
+    generate_csrf()
+    get_flashed_messages(with_categories=True)
+
+    current_app.update_template_context(context)
+    stream = current_app.jinja_env.get_template(template_name).stream(context)
+    stream.enable_buffering(current_app.config['TEMPLATE_STREAM_BUFFER'])
+    return Response(stream_with_context(stream))
+
+# Where stream_page() puts the slow part of a page
+STREAM_SLOT = '<!--stream-slot-->'
+
+# Send a page's frame (head, navigation, heading) straight away and the slow middle when it's ready
+def stream_page(template_name, body, **context):
+    # Rendering the frame up front also stores the CSRF token and consumes the
+    # flashes before the session cookie goes out
+    generate_csrf()
+    head, tail = render_template(template_name, body=Markup(STREAM_SLOT), **context).split(STREAM_SLOT, 1)
+
+    def generate():
+        yield head
+        yield body()
+        yield tail
+
+    return Response(stream_with_context(generate()))
+
+# The drinks on a page the current user has already favorited
+def favorite_ids(drinks):
+    return FavoriteDrink.drink_ids_for_user(current_user.id, [drink.id for drink in drinks])
 
 # Load user by ID for authentication
 @login_manager.user_loader
+@read_replica()
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.load(int(user_id))
 
 # Route for the home page (registration page)
-@app.route('/', methods=['GET', 'POST'])
+@bp.route('/', methods=['GET', 'POST'])
 def index():
     form = RegisterUserForm()
     if form.validate_on_submit():
         # Check if the phone number or email already exists
         if User.is_phone_number_email_duplicate(form.phone_number.data, form.email.data):
             flash('Phone number or email already exists. Please use different ones.', 'danger')
-            return redirect(url_for('index'))
+            return redirect(url_for('main.index'))
 
         # Create new user instance
         user = User(
@@ -66,18 +194,17 @@ def index():
         db.session.commit()
 
         flash('Your account has been created successfully!', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
 
     return render_template('index.html', form=form)
 
 # Route to edit the user's profile
-@app.route('/edit-profile', methods=['GET', 'POST'])
+@bp.route('/edit-profile', methods=['GET', 'POST'])
 @login_required
 def edit_profile():
     form = EditProfileForm(obj=current_user)  # Prefill form with current user's data
 
     if form.validate_on_submit():
-        print("Form submitted and validated!")  # Debugging log
         # Update user information with new values from the form
         current_user.first_name = form.first_name.data
         current_user.last_name = form.last_name.data
@@ -90,15 +217,17 @@ def edit_profile():
         current_user.email = form.email.data
         
         db.session.commit()
+        user_cache.mark_changed(current_user.id)
         flash('Your profile has been updated successfully!', 'success')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
 
     # Log form errors if validation fails
-    print("Form not submitted or did not validate. Errors:", form.errors)  # Debugging log
+    if form.errors:
+        current_app.logger.debug("Edit profile form did not validate: %s", form.errors)
     return render_template('edit_profile.html', form=form)
 
 # Route to delete the user account
-@app.route('/delete-account', methods=['GET', 'POST'])
+@bp.route('/delete-account', methods=['GET', 'POST'])
 @login_required
 def delete_account():
     form = DeleteAccountForm()
@@ -107,19 +236,24 @@ def delete_account():
         # Check if the provided password matches the current user's password
         if not current_user.check_password(form.password.data):
             flash('Incorrect password. Please try again.', 'danger')
-            return redirect(url_for('delete_account'))
+            return redirect(url_for('main.delete_account'))
 
         # Delete the user account from the database
+        user_id = current_user.id
+        # Delete the favorites this way first so they come off the leaderboard too
+        FavoriteDrink.remove_all_for_user(user_id)
         db.session.delete(current_user)
         db.session.commit()
+        user_cache.invalidate(user_id)
+        logout_user()
 
         flash('Your account has been deleted successfully.', 'success')
-        return redirect(url_for('index'))  # Redirect to homepage or sign-up page
+        return redirect(url_for('main.index'))  # Redirect to homepage or sign-up page
 
     return render_template('delete_account.html', form=form)
 
 # Route for logging in users
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
@@ -128,20 +262,25 @@ def login():
         if user:
             # Verify the password
             if user.check_password(form.password.data):
+                # Upgrade the hash if the configured cost has changed since it was made
+                if user.password_needs_rehash():
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                    user_cache.mark_changed(user.id)
                 login_user(user)
                 flash('Logged in successfully!', 'success')
-                return redirect(url_for('profile'))
+                return redirect(url_for('main.profile'))
             else:
                 flash('Incorrect password. Please try again.', 'danger')
         else:
             # User not found, prompt to register
             flash('No account found with that email. Please register an account.', 'warning')
-            return redirect(url_for('index'))  # Redirect to registration page
+            return redirect(url_for('main.index'))  # Redirect to registration page
 
     return render_template('login.html', form=form)
 
 # Route to change the password
-@app.route('/change-password', methods=['GET', 'POST'])
+@bp.route('/change-password', methods=['GET', 'POST'])
 @login_required
 def change_password():
     form = ChangePasswordForm()
@@ -150,124 +289,262 @@ def change_password():
         # Verify current password
         if not current_user.check_password(form.current_password.data):
             flash('Current password is incorrect.', 'danger')
-            return redirect(url_for('change_password'))
+            return redirect(url_for('main.change_password'))
 
         # Update with the new password
         current_user.set_password(form.new_password.data)
         db.session.commit()
+        user_cache.mark_changed(current_user.id)
         flash('Your password has been updated successfully!', 'success')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
 
     return render_template('change_password.html', form=form)
 
 # Route to log out the user
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('You have been logged out.', 'success')
-    return redirect(url_for('index'))
+    return redirect(url_for('main.index'))
 
 # Route for displaying the user's profile
-@app.route('/profile')
+@bp.route('/profile')
 @login_required
+@read_replica()
 def profile():
     return render_template('profile.html', user=current_user)
 
 # Route for drink search page
-@app.route('/drink-search')
+@bp.route('/drink-search')
 @login_required  
 def drink_search():
     return render_template('drink_search.html')
 
 # Route for handling drink search results
-@app.route('/search-drink-results', methods=['GET'])
+@bp.route('/search-drink-results', methods=['GET'])
 @login_required
 def search_drink_results():
     drink_name = request.args.get('drink_name')
     
     if not drink_name:
         flash('Please enter a drink name to search.', 'warning')
-        return redirect(url_for('drink_search'))
-
-    # Call external API to search for drinks
-    api_url = f"https://www.thecocktaildb.com/api/json/v1/1/search.php?s={drink_name}"
-    response = requests.get(api_url)
-    data = response.json()
-
-    if data and data.get('drinks'):
-        return render_template('search_drink_results.html', drinks=data['drinks'])
+        return redirect(url_for('main.drink_search'))
+
+    # Search the cocktail catalog (served from cache when possible)
+    backend = active_catalog()
+    return drink_results_page(drink_name, backend.search_drinks(drink_name), backend)
+
+# Render the drinks found by a search
+def drink_results_page(drink_name, drinks, backend):
+    if drinks:
+        html = fragment_cache.render('fragments/search_drink_results.html', drink_name.strip().lower(),
+                                     backend.catalog_version(), lambda: {'drinks': drinks})
+        return render_template('search_drink_results.html', drinks_html=splice(html, favorite_ids(drinks)))
     else:
         flash('No drinks found. Try searching for something else!', 'danger')
-        return redirect(url_for('drink_search'))
+        return redirect(url_for('main.drink_search'))
+
+# search_drink_results() on the shared async client (swapped in by ASYNC_VIEWS)
+@login_required
+async def search_drink_results_async():
+    drink_name = request.args.get('drink_name')
+
+    if not drink_name:
+        flash('Please enter a drink name to search.', 'warning')
+        return redirect(url_for('main.drink_search'))
+
+    drinks = await async_catalog.search_drinks(drink_name)
+    return await sync_to_async(drink_results_page)(drink_name, drinks, active_catalog())
 
 # Route to fetch cocktails by the first letter
-@app.route('/cocktails-by-letter/<letter>', methods=['GET'])
+@bp.route('/cocktails-by-letter/<letter>', methods=['GET'])
 @login_required
 def cocktails_by_letter(letter):
     # Ensure the letter is a single character
     if len(letter) != 1 or not letter.isalpha():
         flash("Please provide a single valid letter.", "danger")
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    # Call the external API to fetch cocktails by the first letter
-    api_url = f"https://www.thecocktaildb.com/api/json/v1/1/search.php?f={letter}"
-    response = requests.get(api_url)
-    data = response.json()
-
-    # Check if the API returned any drinks
-    if data and data.get('drinks'):
-        return render_template('cocktails_by_letter.html', drinks=data['drinks'], letter=letter)
+    # Fetch cocktails by the first letter from the catalog
+    backend = active_catalog()
+    drinks = backend.drinks_by_letter(letter)
+
+    # Check if the catalog returned any drinks
+    if drinks:
+        return letter_page(letter, listing_page(drinks), backend)
+    else:
+        flash("No cocktails found starting with that letter.", "warning")
+        return redirect(url_for('main.cocktails_by_letter'))
+
+# The requested page of a listing, sorted by name (404 past the last page)
+def listing_page(drinks):
+    page = paginate(by_name(drinks), request.args.get('page', 1, type=int), current_app.config['LISTING_PAGE_SIZE'])
+    if page is None:
+        abort(404)
+    return page
+
+# Stream one page of the drinks starting with a letter
+def letter_page(letter, page, backend):
+    version = backend.catalog_version()
+
+    def drinks_html():
+        html = fragment_cache.render('fragments/cocktails_by_letter.html', (letter.lower(), page.page, page.per_page),
+                                     version, lambda: {'drinks': page.items})
+        return splice(html, favorite_ids(page.items))
+
+    return stream_page('cocktails_by_letter.html', drinks_html, page=page, letter=letter)
+
+# cocktails_by_letter() on the shared async client (swapped in by ASYNC_VIEWS)
+@login_required
+async def cocktails_by_letter_async(letter):
+    if len(letter) != 1 or not letter.isalpha():
+        flash("Please provide a single valid letter.", "danger")
+        return redirect(url_for('main.index'))
+
+    drinks = await async_catalog.drinks_by_letter(letter)
+
+    if drinks:
+        return await sync_to_async(letter_page)(letter, listing_page(drinks), active_catalog())
     else:
         flash("No cocktails found starting with that letter.", "warning")
-        return redirect(url_for('cocktails_by_letter'))
+        return redirect(url_for('main.cocktails_by_letter'))
 
 # Route to filter cocktails by type (Alcoholic/Non-Alcoholic)
-@app.route('/filter-by-alcoholic/<type>', methods=['GET'])
+@bp.route('/filter-by-alcoholic/<type>', methods=['GET'])
 @login_required
 def filter_by_alcoholic(type):
     if type not in ['Alcoholic', 'Non_Alcoholic']:
         flash('Invalid filter type. Please choose "Alcoholic" or "Non_Alcoholic".', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
-    api_url = f"https://www.thecocktaildb.com/api/json/v1/1/filter.php?a={type}"
-    response = requests.get(api_url)
-    data = response.json()
+    backend = active_catalog()
+    drinks = backend.filter_by_alcoholic(type)
+
+    if drinks:
+        page = listing_page(drinks)
+        # filter.php only returns names and thumbnails, so fetch the details of this page in one batch
+        # (only when the page has to be rendered again, and after the frame has gone out)
+        return alcoholic_page(type, page, backend, lambda: backend.lookup_drinks(drink.id for drink in page.items))
+    else:
+        flash(f'No {type.lower()} drinks found.', 'warning')
+        return redirect(url_for('main.index'))
+
+# Stream one page of the Alcoholic or Non_Alcoholic drinks; `details` returns the page's drink details
+def alcoholic_page(type, page, backend, details):
+    version = backend.catalog_version()
 
-    if data and data.get('drinks'):
-        return render_template('filter_by_alcoholic.html', drinks=data['drinks'], type=type)
+    def drinks_html():
+        html = fragment_cache.render('fragments/filter_by_alcoholic.html', (type, page.page, page.per_page), version,
+                                     lambda: {'drinks': page.items, 'details': details()})
+        return splice(html, favorite_ids(page.items))
+
+    return stream_page('filter_by_alcoholic.html', drinks_html, page=page, type=type)
+
+# filter_by_alcoholic() on the shared async client (swapped in by ASYNC_VIEWS)
+@login_required
+async def filter_by_alcoholic_async(type):
+    if type not in ['Alcoholic', 'Non_Alcoholic']:
+        flash('Invalid filter type. Please choose "Alcoholic" or "Non_Alcoholic".', 'danger')
+        return redirect(url_for('main.index'))
+
+    drinks = await async_catalog.filter_by_alcoholic(type)
+
+    if drinks:
+        page = listing_page(drinks)
+        # The details are gathered up front, concurrently; cached ones cost a dict lookup each
+        details = await async_catalog.lookup_drinks(drink.id for drink in page.items)
+        return await sync_to_async(alcoholic_page)(type, page, active_catalog(), lambda: details)
     else:
         flash(f'No {type.lower()} drinks found.', 'warning')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
 # Route to add a drink to favorites
-@app.route('/add-favorite/<drink_id>', methods=['POST'])
+@bp.route('/add-favorite/<drink_id>', methods=['POST'])
 @login_required
 def add_favorite(drink_id):
     drink_name = request.form.get('drink_name')
     drink_thumb = request.form.get('drink_thumb')
 
-    # Check if this drink is already a favorite for the user
-    existing_favorite = FavoriteDrink.query.filter_by(user_id=current_user.id, drink_id=drink_id).first()
-    if existing_favorite:
+    # Insert the favorite unless the user already has it (one round trip, no race)
+    added = FavoriteDrink.add_for_user(current_user.id, [
+        {'drink_id': drink_id, 'drink_name': drink_name, 'drink_thumb': drink_thumb},
+    ])
+    db.session.commit()
+
+    if not added:
         return jsonify({'success': False, 'message': 'This drink is already in your favorites!'})
 
-    # Create a new favorite entry
-    new_favorite = FavoriteDrink(user_id=current_user.id, drink_name=drink_name, drink_id=drink_id, drink_thumb=drink_thumb)
-    db.session.add(new_favorite)
+    return jsonify({'success': True})
+
+# Route to add several drinks to favorites in one transaction
+@bp.route('/favorites/bulk-add', methods=['POST'])
+@login_required
+def bulk_add_favorites():
+    payload = request.get_json(silent=True) or {}
+    drinks = payload.get('drinks')
+
+    if not isinstance(drinks, list) or len(drinks) > current_app.config['BULK_FAVORITES_LIMIT']:
+        return jsonify({'success': False, 'message': f"Send a list of at most {current_app.config['BULK_FAVORITES_LIMIT']} drinks."}), 400
+    if not all(isinstance(drink, dict) and drink.get('drink_id') and drink.get('drink_name') for drink in drinks):
+        return jsonify({'success': False, 'message': 'Every drink needs a drink_id and drink_name.'}), 400
+
+    added = FavoriteDrink.add_for_user(current_user.id, [
+        {'drink_id': str(drink['drink_id']), 'drink_name': drink['drink_name'], 'drink_thumb': drink.get('drink_thumb')}
+        for drink in drinks
+    ])
     db.session.commit()
 
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'added': added})
+
+# Route to remove several drinks from favorites in one transaction
+@bp.route('/favorites/bulk-remove', methods=['POST'])
+@login_required
+def bulk_remove_favorites():
+    payload = request.get_json(silent=True) or {}
+    drink_ids = payload.get('drink_ids')
+
+    if not isinstance(drink_ids, list) or len(drink_ids) > current_app.config['BULK_FAVORITES_LIMIT']:
+        return jsonify({'success': False, 'message': f"Send a list of at most {current_app.config['BULK_FAVORITES_LIMIT']} drink ids."}), 400
+
+    removed = FavoriteDrink.remove_for_user(current_user.id, [str(drink_id) for drink_id in drink_ids])
+    db.session.commit()
+
+    return jsonify({'success': True, 'removed': removed})
 
 # Route to display user's favorite drinks
-@app.route('/favorites')
+@bp.route('/favorites')
 @login_required
+@read_replica()
 def favorites():
-    favorites = FavoriteDrink.query.filter_by(user_id=current_user.id).all()
-    return render_template('favorites.html', favorites=favorites)
+    after = request.args.get('after', type=int)
+    favorites, next_cursor = FavoriteDrink.page_for_user(current_user.id, after, current_app.config['FAVORITES_PAGE_SIZE'])
+    details = active_catalog().lookup_drinks(favorite.drink_id for favorite in favorites)
+    # Suggestions only go on the first page
+    recommended = recommendations.for_user(current_user.id, current_app.config['RECOMMENDATIONS_SHOWN']) if after is None else []
+    return stream_template('favorites.html', favorites=favorites, details=details, next_cursor=next_cursor,
+                           recommended=recommended)
+
+# Route returning one page of the user's favorites as JSON (for infinite scroll)
+@bp.route('/favorites.json')
+@login_required
+@read_replica()
+def favorites_json():
+    after = request.args.get('after', type=int)
+    favorites, next_cursor = FavoriteDrink.page_for_user(current_user.id, after, current_app.config['FAVORITES_PAGE_SIZE'])
+    # The same recipe details the server-rendered page shows, so scrolled-in items look the same
+    details = active_catalog().lookup_drinks(favorite.drink_id for favorite in favorites)
+    items = []
+    for favorite in favorites:
+        item = favorite.to_dict()
+        detail = details.get(favorite.drink_id)
+        item['ingredients'] = [{'name': name, 'measure': measure} for name, measure in detail.ingredients] if detail else []
+        item['instructions'] = detail.instructions if detail else None
+        items.append(item)
+    return jsonify({'favorites': items, 'next_cursor': next_cursor})
 
 # Route to remove a favorite drink
-@app.route('/remove-favorite/<int:favorite_id>', methods=['POST'])
+@bp.route('/remove-favorite/<int:favorite_id>', methods=['POST'])
 @login_required
 def remove_favorite(favorite_id):
     favorite = FavoriteDrink.query.get_or_404(favorite_id)
@@ -276,27 +553,41 @@ def remove_favorite(favorite_id):
     if favorite.user_id != current_user.id:
         return jsonify({'success': False, 'message': 'You do not have permission to remove this favorite.'})
 
-    # Remove the favorite from the database
-    db.session.delete(favorite)
+    # Remove the favorite from the database (and the leaderboard)
+    FavoriteDrink.remove_for_user(current_user.id, [favorite.drink_id])
     db.session.commit()
 
     return jsonify({'success': True, 'favorite_id': favorite_id})
 
+# Route for the most favorited drinks
+@bp.route('/popular')
+@login_required
+def popular():
+    return render_template('popular.html', drinks=leaderboard.top())
+
 # Route to fetch a random cocktail
-@app.route('/random-cocktail', methods=['GET'])
+@bp.route('/random-cocktail', methods=['GET'])
 @login_required
 def random_cocktail():
-    response = requests.get('https://www.thecocktaildb.com/api/json/v1/1/random.php')
-    
-    if response.status_code == 200:
-        data = response.json()
-        drink = data['drinks'][0] if data['drinks'] else None
-        return render_template('random_cocktail.html', drink=drink)
-    else:
+    try:
+        drink = active_catalog().random_drink()
+    except CatalogError:
+        return jsonify({"error": "Failed to retrieve random cocktail."}), 500
+
+    return render_template('random_cocktail.html', drink=drink)
+
+# random_cocktail() on the shared async client (swapped in by ASYNC_VIEWS)
+@login_required
+async def random_cocktail_async():
+    try:
+        drink = await async_catalog.random_drink()
+    except CatalogError:
         return jsonify({"error": "Failed to retrieve random cocktail."}), 500
 
+    return await sync_to_async(render_template)('random_cocktail.html', drink=drink)
+
 # Route to search for cocktails by ingredient
-@app.route('/ingredient-search', methods=['GET', 'POST'])
+@bp.route('/ingredient-search', methods=['GET', 'POST'])
 @login_required
 def ingredient_search():
     form = IngredientSearchForm()
@@ -305,23 +596,139 @@ def ingredient_search():
         
         if not ingredient_name:
             flash('Please enter an ingredient name to search.', 'warning')
-            return redirect(url_for('ingredient_search'))
+            return redirect(url_for('main.ingredient_search'))
         
-        api_url = f"https://www.thecocktaildb.com/api/json/v1/1/search.php?i={ingredient_name}"
-        response = requests.get(api_url)
-        data = response.json()
+        ingredients = active_catalog().search_ingredients(ingredient_name)
 
-        if data and data.get('ingredients'):
-            return render_template('ingredient_details.html', ingredients=data['ingredients'])
+        if ingredients:
+            return render_template('ingredient_details.html', ingredients=ingredients)
         else:
             flash('No ingredients found. Try searching for something else!', 'danger')
-            return redirect(url_for('ingredient_search'))
+            return redirect(url_for('main.ingredient_search'))
 
     return render_template('ingredient_search.html', form=form)
 
+# ingredient_search() on the shared async client (swapped in by ASYNC_VIEWS)
+@login_required
+async def ingredient_search_async():
+    form = IngredientSearchForm()
+    if form.validate_on_submit():
+        ingredient_name = form.ingredient_name.data
+
+        if not ingredient_name:
+            flash('Please enter an ingredient name to search.', 'warning')
+            return redirect(url_for('main.ingredient_search'))
+
+        ingredients = await async_catalog.search_ingredients(ingredient_name)
+
+        if ingredients:
+            return await sync_to_async(render_template)('ingredient_details.html', ingredients=ingredients)
+        else:
+            flash('No ingredients found. Try searching for something else!', 'danger')
+            return redirect(url_for('main.ingredient_search'))
+
+    return await sync_to_async(render_template)('ingredient_search.html', form=form)
+
+# Route to find drinks that can be made from several ingredients
+@bp.route('/what-can-i-make', methods=['GET', 'POST'])
+@login_required
+def what_can_i_make():
+    form = WhatCanIMakeForm()
+    if form.validate_on_submit():
+        ingredient_names = form.ingredient_names(limit=current_app.config['MAX_PANTRY_INGREDIENTS'])
+
+        # Look every ingredient up at once rather than one after another
+        drinks_by_ingredient = active_catalog().filter_by_ingredients(ingredient_names)
+        results = rank_by_ingredients(drinks_by_ingredient)
+
+        if results:
+            return render_template('what_can_i_make.html', form=form, results=results, ingredient_names=ingredient_names)
+        else:
+            flash('No drinks use those ingredients. Try some others!', 'warning')
+            return redirect(url_for('main.what_can_i_make'))
+
+    return render_template('what_can_i_make.html', form=form, results=None)
+
+# Route to list the drinks a pantry can make, or nearly make
+@bp.route('/pantry', methods=['GET', 'POST'])
+@login_required
+def pantry():
+    form = WhatCanIMakeForm()
+    if form.validate_on_submit():
+        ingredient_names = form.ingredient_names(limit=current_app.config['MAX_PANTRY_INDEX_INGREDIENTS'])
+        index = ensure_loaded(ingredient_index, active_catalog())
+        results = index.missing(ingredient_names, max_missing=2)
+        return render_template('pantry.html', form=form, results=results, ingredient_names=ingredient_names)
+
+    return render_template('pantry.html', form=form, results=None)
+
+# Route suggesting drink and ingredient names as the user types (from memory, never calling the API per keystroke)
+@bp.route('/suggest')
+@login_required
+def suggest():
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 8, type=int), current_app.config['SUGGEST_MAX_RESULTS']))
+    try:
+        # Only loads here when no refresh thread is running; otherwise answered from memory as it is
+        index = suggest_index.ready(active_catalog())
+    except CatalogError:
+        index = suggest_index
+
+    type = request.args.get('type')
+    suggestions = index.suggest(query, limit, type if type in ('drink', 'ingredient') else None)
+    response = jsonify({'suggestions': [suggestion._asdict() for suggestion in suggestions]})
+    response.headers['Cache-Control'] = 'private, max-age=300'
+    return response
+
+# Route serving a drink's thumbnail from the local disk cache (fetched from upstream once)
+@bp.route('/thumb/<drink_id>')
+@login_required
+def thumb(drink_id):
+    size = request.args.get('size', 'small')
+    if not drink_id.isdigit() or size not in THUMB_SIZES:
+        abort(404)
+
+    found = thumb_cache.cached(drink_id, size)
+    if found is None:
+        try:
+            # Unknown ids aren't cached, so probing them can't push hot pages out of the catalog cache
+            drink = active_catalog().lookup_drink(drink_id, cache_misses=False)
+        except CatalogError:
+            abort(503)
+        if drink is None or not drink.thumb:
+            abort(404)
+        try:
+            found = thumb_cache.get(drink_id, size, drink.thumb)
+        except ThumbnailError:
+            # Better the upstream image than a broken one
+            return redirect(drink.thumb + THUMB_SIZES[size])
+
+    path, digest = found
+    # Drink thumbnails never change upstream, so browsers and proxies may keep them for good
+    response = send_file(path, mimetype='image/jpeg', etag=digest, max_age=current_app.config['THUMB_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+# Fail fast with a friendly message when the cocktail API is down and nothing is cached
+@bp.app_errorhandler(CatalogError)
+def catalog_unavailable(error):
+    flash('The cocktail database is not responding right now. Please try again in a moment.', 'danger')
+    return redirect(url_for('main.drink_search'))
+
+# The async variants use_async_views() swaps in: they wait on the shared async
+# client instead of blocking on requests, and render on the request thread
+ASYNC_VIEWS = {
+    'main.search_drink_results': search_drink_results_async,
+    'main.cocktails_by_letter': cocktails_by_letter_async,
+    'main.filter_by_alcoholic': filter_by_alcoholic_async,
+    'main.random_cocktail': random_cocktail_async,
+    'main.ingredient_search': ingredient_search_async,
+}
+
 # Run the app
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app('development').run(debug=True)
 
 
         
@@ -0,0 +1,38 @@
+"""ASGI entry point, e.g. `uvicorn asgi:app --workers 4`
+
+Serves the app with the async views on (ASYNC_VIEWS). Flask is a WSGI
+framework, so every request still runs on a thread of its own, taken
+from a pool of ASGI_THREADS (default 32); asgiref's plain WsgiToAsgi
+would run them all on one thread. While an async view waits on the
+cocktail API its upstream calls share one connection pool and fan out
+concurrently on the catalog's event loop.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import SyncToAsync
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+
+from app import create_app, use_async_views
+
+
+class ThreadedWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi that runs each request on a thread pool instead of one shared thread"""
+
+    def __init__(self, wsgi_application, threads=32):
+        super().__init__(wsgi_application)
+        executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+        class Instance(WsgiToAsgiInstance):
+            run_wsgi_app = SyncToAsync(WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False,
+                                       executor=executor)
+
+        self.instance_class = Instance
+
+    async def __call__(self, scope, receive, send):
+        await self.instance_class(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+flask_app = create_app()
+use_async_views(flask_app)
+app = ThreadedWsgiToAsgi(flask_app, threads=int(os.environ.get('ASGI_THREADS', 32)))
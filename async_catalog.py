@@ -0,0 +1,237 @@
+import asyncio
+import threading
+
+from asgiref.sync import sync_to_async
+
+from catalog import CatalogError, CatalogUnavailable, RETRY_STATUSES, catalog
+from local_catalog import active_catalog
+from metrics import timed
+
+try:
+    import httpx
+except ImportError:  # httpx is only needed with ASYNC_VIEWS on
+    httpx = None
+
+
+class AsyncCatalog:
+    """Awaitable catalog lookups for the async views
+
+    Upstream calls go through one httpx.AsyncClient running on a background
+    event loop. Flask gives every async view an event loop that only lasts
+    for the request, so a client opened there couldn't keep connections
+    alive between requests; views hand their calls to the shared loop
+    instead. Results go through the sync client's cache, circuit breaker
+    and listeners, so both kinds of view share warm data. With
+    CATALOG_SOURCE=local the LocalCatalog is called on the request thread.
+    """
+
+    def __init__(self, client=catalog, max_connections=20, pool_timeout=5):
+        self.client = client
+        self.max_connections = max_connections
+        self.pool_timeout = pool_timeout
+        self.retries = 2
+        self.backoff = 0.3
+        self._loop = None
+        self._http = None
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the client from the app's config (after the catalog's)"""
+        app.config.setdefault('ASYNC_VIEWS', False)
+        app.config.setdefault('ASYNC_CATALOG_MAX_CONNECTIONS', 20)
+        # Seconds a call waits for a free pooled connection
+        app.config.setdefault('ASYNC_CATALOG_POOL_TIMEOUT', 5)
+        if app.config['ASYNC_VIEWS'] and httpx is None:
+            raise RuntimeError("ASYNC_VIEWS needs httpx installed")
+        self.max_connections = app.config['ASYNC_CATALOG_MAX_CONNECTIONS']
+        self.pool_timeout = app.config['ASYNC_CATALOG_POOL_TIMEOUT']
+        self.retries = app.config['CATALOG_RETRIES']
+        self.backoff = app.config['CATALOG_RETRY_BACKOFF']
+        # The next lookup opens a pool with the new settings
+        self.close()
+        app.extensions['async_catalog'] = self
+
+    def _start(self):
+        """Return the shared loop, starting it and its HTTP client on first use"""
+        with self._lock:
+            if self._loop is None:
+                connect, read = self.client.timeout
+                self._http = httpx.AsyncClient(
+                    timeout=httpx.Timeout(read, connect=connect, pool=self.pool_timeout),
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                )
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._run, args=(self._loop,), name='async-catalog', daemon=True).start()
+            return self._loop
+
+    @staticmethod
+    def _run(loop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+        loop.close()
+
+    def close(self):
+        """Close the shared client's connections and stop its loop"""
+        with self._lock:
+            loop, http = self._loop, self._http
+            self._loop = self._http = None
+            self._flights = {}
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(http.aclose(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+
+    async def _on_loop(self, coro_fn, *args):
+        """Run coro_fn(*args) on the shared loop and wait for it from the request's loop"""
+        future = asyncio.run_coroutine_threadsafe(coro_fn(*args), self._start())
+        with timed('upstream'):
+            return await asyncio.wrap_future(future)
+
+    async def _get(self, path, params):
+        """Make the HTTP call, retrying the statuses the sync session retries"""
+        url = f"{self.client.base_url}/{path}"
+        for attempt in range(self.retries + 1):
+            try:
+                response = await self._http.get(url, params=params)
+            except httpx.HTTPError as e:
+                raise CatalogError(f"Could not reach the cocktail API: {e}") from e
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                return self.client._decode(response)
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def _fetch(self, path, params=None):
+        """Call the API through the circuit breaker and return the decoded JSON"""
+        breaker = self.client.breaker
+        if not breaker.allow():
+            raise CatalogUnavailable("The cocktail API is unavailable, not retrying yet")
+
+        try:
+            data = await self._get(path, params)
+        except CatalogError as e:
+            if isinstance(e.__cause__, httpx.PoolTimeout):
+                # Our own pool being full says nothing about upstream's health
+                breaker.release()
+            else:
+                breaker.record_failure()
+            raise
+
+        breaker.record_success()
+        return data
+
+    async def _fetch_once(self, endpoint, key, path, params):
+        """Fetch and cache a query, sharing one call between concurrent callers (on the shared loop)"""
+        task = self._flights.get(key)
+        if task is None:
+            task = self._flights[key] = asyncio.ensure_future(self._fetch_and_store(endpoint, key, path, params))
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.client.flights.coalesced += 1
+        # One caller giving up mustn't cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    async def _fetch_and_store(self, endpoint, key, path, params):
+        return self.client._store(endpoint, key, await self._fetch(path, params))
+
+    async def _cached(self, endpoint, path, params):
+        """Serve a lookup from the shared cache, fetching or refreshing it as needed"""
+        client = self.client
+        key = client._key(path, params)
+        value, state = client.cache.get(key)
+
+        if state == 'fresh':
+            return value
+        if state == 'stale':
+            client._refresh_in_background(endpoint, key, path, params)
+            return value
+
+        try:
+            return await self._on_loop(self._fetch_once, endpoint, key, path, params)
+        except CatalogError:
+            if state == 'expired':
+                return value
+            raise
+
+    def _local(self):
+        """Return the LocalCatalog when lookups are served from the mirrored tables, else None"""
+        backend = active_catalog()
+        return None if backend is self.client else backend
+
+    async def search_drinks(self, name):
+        """Return the drinks whose name matches the search term"""
+        local = self._local()
+        if local:
+            return await sync_to_async(local.search_drinks)(name)
+        term = name.strip().lower()
+        self.client._count_search(term)
+        return await self._cached('search', 'search.php', {'s': term})
+
+    async def drinks_by_letter(self, letter):
+        """Return the drinks whose name starts with the given letter"""
+        local = self._local()
+        if local:
+            return await sync_to_async(local.drinks_by_letter)(letter)
+        return await self._cached('letter', 'search.php', {'f': letter.lower()})
+
+    async def filter_by_alcoholic(self, type):
+        """Return the (id, name, thumb only) drinks for Alcoholic or Non_Alcoholic"""
+        local = self._local()
+        if local:
+            return await sync_to_async(local.filter_by_alcoholic)(type)
+        return await self._cached('filter', 'filter.php', {'a': type})
+
+    async def search_ingredients(self, name):
+        """Return the ingredient details matching the search term"""
+        local = self._local()
+        if local:
+            return await sync_to_async(local.search_ingredients)(name)
+        return await self._cached('ingredient', 'search.php', {'i': name.strip().lower()})
+
+    async def lookup_drink(self, drink_id):
+        """Return the full details of one drink, or None if it doesn't exist"""
+        local = self._local()
+        if local:
+            return await sync_to_async(local.lookup_drink)(drink_id)
+        drinks = await self._cached('lookup', 'lookup.php', {'i': str(drink_id)})
+        return drinks[0] if drinks else None
+
+    async def lookup_drinks(self, drink_ids):
+        """Return {drink id: details} for many drinks at once
+
+        The misses are fetched concurrently, at most as many at a time as
+        the client's pool has connections, so a long page doesn't queue
+        up past the pool timeout. Drinks that can't be fetched are left
+        out rather than failing the whole page.
+        """
+        local = self._local()
+        if local:
+            return await sync_to_async(local.lookup_drinks)(drink_ids)
+        drink_ids = list(dict.fromkeys(str(drink_id) for drink_id in drink_ids))
+        semaphore = asyncio.Semaphore(self.max_connections)
+
+        async def bounded_lookup(drink_id):
+            async with semaphore:
+                return await self.lookup_drink(drink_id)
+
+        results = await asyncio.gather(*(bounded_lookup(drink_id) for drink_id in drink_ids),
+                                       return_exceptions=True)
+        details = {}
+        for drink_id, drink in zip(drink_ids, results):
+            if isinstance(drink, CatalogError):
+                continue
+            if isinstance(drink, BaseException):
+                raise drink
+            if drink:
+                details[drink_id] = drink
+        return details
+
+    async def random_drink(self):
+        """Return a random drink; never cached"""
+        local = self._local()
+        if local:
+            return await sync_to_async(local.random_drink)()
+        drinks = self.client._parse('random', await self._on_loop(self._fetch, 'random.php'))
+        return drinks[0] if drinks else None
+
+
+async_catalog = AsyncCatalog()
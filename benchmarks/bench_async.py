@@ -0,0 +1,87 @@
+"""Compare the async views with the sync ones on the upstream-bound routes.
+
+Starts the app in-process with ASYNC_VIEWS off, then again with it on,
+each against a FakeCocktailDB that adds --latency seconds to every call,
+and drives the routes that have async variants with concurrent
+logged-in users (see bench_load.py). The catalog and fragment caches are
+turned off so every request waits on the upstream; --cached leaves them
+on to compare the warm path instead.
+
+    python benchmarks/bench_async.py [--users 32] [--duration 10] [--latency 0.1] [--cached]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_load import SCENARIOS, VirtualUser, percentile, start_local_app  # noqa: E402
+from catalog import DEFAULT_TTLS  # noqa: E402
+
+ASYNC_ROUTES = ['GET /search-drink-results', 'GET /cocktails-by-letter', 'GET /filter-by-alcoholic',
+                'GET /random-cocktail', 'GET /ingredient-search', 'POST /ingredient-search']
+
+
+def run(args, async_views):
+    """Load the routes with ASYNC_VIEWS on or off; returns {route: sorted latencies} and error counts"""
+    config = {'ASYNC_VIEWS': async_views}
+    if not args.cached:
+        config.update(CATALOG_CACHE_TTLS={endpoint: 0 for endpoint in DEFAULT_TTLS}, CATALOG_CACHE_STALE_TTL=0,
+                      FRAGMENT_CACHE_TTL=0)
+    base_url = start_local_app(args, **config)
+
+    run_id = int(time.time())
+    users = [VirtualUser(base_url, n, args.seed + n) for n in range(args.users)]
+    for user in users:
+        user.sign_up(run_id)
+
+    scenarios = [scenario for scenario in SCENARIOS if scenario[0] in ASYNC_ROUTES]
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    record_after = time.perf_counter() + args.warmup
+    stop_at = record_after + args.duration
+    threads = [threading.Thread(target=user.run, args=(stop_at, record_after, samples, errors, scenarios))
+               for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {route: sorted(times) for route, times in samples.items()}, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10, help="seconds to record for, per mode")
+    parser.add_argument('--warmup', type=float, default=2, help="seconds to run before recording")
+    parser.add_argument('--latency', type=float, default=0.1, help="seconds the fake upstream adds to each call")
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--cached', action='store_true', help="leave the catalog and fragment caches on")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    # start_local_app() reads these too
+    args.error_rate = 0
+    args.database_url = None
+
+    results = {mode: run(args, mode == 'async') for mode in ('sync', 'async')}
+
+    print(f"{args.users} users, {args.latency * 1000:.0f} ms upstream latency, "
+          f"caches {'on' if args.cached else 'off'}")
+    print(f"{'route':<28}{'mode':>6}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}")
+    for route in ASYNC_ROUTES:
+        for mode, (samples, errors) in results.items():
+            times = samples.get(route)
+            if not times:
+                continue
+            p50, p95 = (percentile(times, p) * 1000 for p in (50, 95))
+            print(f"{route:<28}{mode:>6}{len(times):>9}{errors[route]:>8}{len(times) / args.duration:>8.1f}"
+                  f"{p50:>9.1f}{p95:>9.1f}")
+    for mode, (samples, errors) in results.items():
+        print(f"total {mode}: {sum(map(len, samples.values())) / args.duration:.1f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Benchmark importing users in bulk against registering them one at a time.
+
+Registers the same synthetic member list twice into a fresh SQLite
+database: once the way index() does (a duplicate-check query, a bcrypt
+hash and a commit per user) and once with import_users() (set-based
+duplicate checks, bcrypt across a process pool, one insert and commit per
+batch). Then streams the users back out with export_users() and reports
+the peak memory it took. Bcrypt dominates, so the import's speedup grows
+with --workers, up to the machine's cores.
+
+    python benchmarks/bench_bulk.py [--users 500] [--rounds 10] [--workers 4] [--batch-size 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from app import create_app  # noqa: E402
+from bulk import export_users, import_users  # noqa: E402
+from config import TestingConfig  # noqa: E402
+from models import db, User  # noqa: E402
+
+
+def member_list(count):
+    return [(line, {
+        'first_name': 'Member', 'last_name': f'No{n}', 'dob': '1990-01-01', 'address': f'{n} Main St',
+        'city': 'Springfield', 'state': 'IL', 'zip': '62701', 'phone_number': f'555{n:07d}',
+        'email': f'member{n}@example.com', 'password': f'secret-{n}',
+    }) for line, n in enumerate(range(count), 2)]
+
+
+def register_one_at_a_time(records):
+    for line, record in records:
+        if User.is_phone_number_email_duplicate(record['phone_number'], record['email']):
+            continue
+        user = User(**{field: value for field, value in record.items() if field != 'password'})
+        user.dob = date.fromisoformat(record['dob'])
+        user.set_password(record['password'])
+        db.session.add(user)
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=10, help="bcrypt work factor (production uses 12)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-bulk-')
+
+    class BenchConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        BCRYPT_LOG_ROUNDS = args.rounds
+
+    app = create_app(BenchConfig)
+    records = member_list(args.users)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        register_one_at_a_time(records)
+        one_at_a_time = time.perf_counter() - started
+
+        db.drop_all()
+        db.create_all()
+        started = time.perf_counter()
+        with ProcessPoolExecutor(args.workers) as pool:
+            result = import_users(iter(records), args.batch_size, pool)
+        bulk = time.perf_counter() - started
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in export_users('csv', args.batch_size))
+        export = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    print(f"{args.users} users, bcrypt cost {args.rounds}, {args.workers} workers, {os.cpu_count()} CPUs")
+    print(f"one at a time:  {one_at_a_time:8.2f} s  {args.users / one_at_a_time:8.1f} users/s")
+    print(f"bulk import:    {bulk:8.2f} s  {result.imported / bulk:8.1f} users/s")
+    print(f"export:         {export:8.2f} s  {size / 1024:8.1f} KiB, peak {peak / 1024:.0f} KiB allocated")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Benchmark how long a fresh process takes to import, build and serve the app.
+
+Each run starts a new interpreter so nothing is warm, and reports the
+time spent importing the app module, in create_app() and on the first
+request to a page that doesn't need the catalog. Cold start is what a
+new worker (or a test run) pays before it can serve anything.
+
+    python benchmarks/bench_cold_start.py [--runs 5] [--config testing]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app(sys.argv[1])
+created = time.perf_counter()
+with app.app_context():
+    from models import db
+    db.create_all()
+ready = time.perf_counter()
+response = app.test_client().get('/login')
+served = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - ready}))
+'''
+
+
+def run_once(config):
+    output = subprocess.run([sys.executable, '-c', PROBE, config], cwd=ROOT,
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--config', default='testing')
+    args = parser.parse_args()
+
+    runs = [run_once(args.config) for _ in range(args.runs)]
+    print(f"{'phase':<15}{'median ms':>12}{'max ms':>10}")
+    for phase in ('import', 'create_app', 'first_request'):
+        times = [run[phase] * 1000 for run in runs]
+        print(f'{phase:<15}{statistics.median(times):>12.1f}{max(times):>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""Measure how much memory 1k drinks take as raw API dicts vs. Drinks.
+
+Builds a catalog by repeating the drinks of a dump (the fixture by
+default), decoding each copy separately so no strings are shared, the
+way they arrive one API response at a time. Then measures with
+tracemalloc what stays allocated: the decoded dicts, and the Drinks
+built from them once the dicts are dropped.
+
+    python benchmarks/bench_drink_memory.py [--dump catalog.json] [--drinks 1000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from drinks import Drink  # noqa: E402
+
+FIXTURE_DUMP = os.path.join(os.path.dirname(__file__), '..', 'fixtures', 'cocktaildb_dump.json')
+
+
+def retained(build):
+    """Return (result, bytes still allocated once build() returns)"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dump', default=FIXTURE_DUMP, help="catalog dump written by `flask catalog sync --dump`")
+    parser.add_argument('--drinks', type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(args.dump) as f:
+        source = json.load(f)['drinks']
+    pages = [json.dumps([dict(data, idDrink=str(n)) for data in source])
+             for n in range(0, args.drinks, len(source))]
+
+    def decode():
+        return [data for page in pages for data in json.loads(page)][:args.drinks]
+
+    raw, raw_size = retained(decode)
+    del raw
+    drinks, drink_size = retained(lambda: [Drink.from_api(data) for data in decode()])
+
+    per_k = 1000 / len(drinks)
+    print(f"{len(drinks)} drinks ({len(source)} distinct recipes)")
+    print(f"raw API dicts:  {raw_size * per_k / 1024:9.1f} KiB per 1k drinks")
+    print(f"Drink objects:  {drink_size * per_k / 1024:9.1f} KiB per 1k drinks")
+    print(f"saving:         {(1 - drink_size / raw_size) * 100:9.1f} %")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark pantry queries on the bitset ingredient index.
+
+Runs against a full catalog dump (from `flask catalog sync --dump`) when
+one is given, otherwise against a synthetic catalog the size of
+CocktailDB's (~640 drinks over ~490 ingredients, popularity skewed the
+way real recipes are). Compares the index with a plain Python loop over
+every drink's recipe.
+
+    python benchmarks/bench_ingredient_index.py [--dump catalog.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from drinks import Drink  # noqa: E402
+from ingredient_index import IngredientIndex, recipe_keys  # noqa: E402
+
+
+def synthetic_catalog(drink_count=640, ingredient_count=490, seed=1):
+    rng = random.Random(seed)
+    ingredients = [f'Ingredient {n}' for n in range(ingredient_count)]
+    # A few spirits and juices show up in most recipes
+    weights = [1 / (rank + 1) for rank in range(ingredient_count)]
+    drinks = []
+    for n in range(drink_count):
+        recipe = set(rng.choices(ingredients, weights, k=rng.randint(2, 7)))
+        drinks.append(Drink(str(10000 + n), f'Drink {n}', ingredients=[(name, None) for name in recipe]))
+    return drinks
+
+
+def naive_missing(recipes, pantry, max_missing=2):
+    results = {n: [] for n in range(max_missing + 1)}
+    for drink, recipe in recipes:
+        missing = len(recipe - pantry)
+        if missing <= max_missing:
+            results[missing].append(drink)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dump', help="catalog dump written by `flask catalog sync --dump`")
+    parser.add_argument('--pantry-size', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    if args.dump:
+        with open(args.dump) as f:
+            drinks = [Drink.from_api(data) for data in json.load(f)['drinks']]
+    else:
+        drinks = synthetic_catalog()
+
+    index = IngredientIndex()
+    build = timeit.timeit(lambda: IngredientIndex().update(drinks), number=5) / 5
+    index.update(drinks)
+
+    recipes = [(drink, recipe_keys(drink)) for drink in drinks]
+    ingredients = sorted({key for drink, recipe in recipes for key in recipe})
+    rng = random.Random(2)
+    # Pantries are mostly popular ingredients, like real home bars
+    pantries = [set(rng.sample(ingredients[:60], args.pantry_size)) for _ in range(50)]
+
+    def per_query(fn):
+        total = timeit.timeit(lambda: [fn(pantry) for pantry in pantries], number=max(1, args.repeat // 50))
+        return total / (max(1, args.repeat // 50) * len(pantries)) * 1e6
+
+    counts_only = per_query(lambda pantry: index._missing_counts(pantry, 2))
+    full = per_query(lambda pantry: index.missing(pantry, 2))
+    naive = per_query(lambda pantry: naive_missing(recipes, pantry, 2))
+
+    print(f"catalog: {len(drinks)} drinks, {len(ingredients)} ingredients, pantry of {args.pantry_size}")
+    print(f"index build:                     {build * 1e3:8.2f} ms")
+    print(f"bitset counts (missing 0-2):     {counts_only:8.1f} us/query")
+    print(f"bitset counts + result lists:    {full:8.1f} us/query")
+    print(f"python loop over every recipe:   {naive:8.1f} us/query")
+
+
+if __name__ == '__main__':
+    main()
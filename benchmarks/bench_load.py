@@ -0,0 +1,280 @@
+"""Load-test every route with concurrent logged-in users and compare to a baseline.
+
+By default the app runs in-process on a local HTTP server, backed by a
+throwaway SQLite file and a FakeCocktailDB serving the fixture dump, so
+the run needs no network and no Postgres. Use --url to drive an already
+running deployment instead (it must have CSRF enabled or disabled
+consistently; tokens are scraped from the pages either way).
+
+Each virtual user signs up, logs in, then loops over a weighted mix of
+requests for the length of the run. Requests that would end the session
+(logout, deleting the account, changing the password) are left out.
+Per route it reports throughput and p50/p95/p99 latency, and compares
+p95 and throughput with the stored baseline for the same settings.
+
+    python benchmarks/bench_load.py [--users 8] [--duration 20] [--latency 0.05 --error-rate 0.01]
+    python benchmarks/bench_load.py --save-baseline     # after an intended change
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fake_cocktaildb import FakeCocktailDB, QuietRequestHandler  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baselines', 'bench_load.json')
+
+CSRF_TOKEN = re.compile(r'csrf_token"[^>]*?value="([^"]+)"')
+
+LETTERS = 'abdmnotw'
+DRINK_IDS = ['11007', '11118', '12528', '11000', '11001', '11003', '11004', '11005', '11006', '11008', '12560']
+SEARCHES = ['margarita', 'russian', 'martini', 'sour', 'mojito']
+PANTRIES = ['Vodka, Coffee liqueur', 'Gin, Campari, Sweet Vermouth', 'Tequila, Lime juice, Triple sec, Salt',
+            'Light rum, Lime, Sugar', 'Bourbon, Sugar, Water']
+
+# (route, weight, request builder) -- the builder returns (method, path, keyword arguments)
+SCENARIOS = [
+    ('GET /', 1, lambda u: ('GET', '/', {})),
+    ('GET /login', 1, lambda u: ('GET', '/login', {})),
+    ('GET /profile', 4, lambda u: ('GET', '/profile', {})),
+    ('GET /edit-profile', 1, lambda u: ('GET', '/edit-profile', {})),
+    ('GET /change-password', 1, lambda u: ('GET', '/change-password', {})),
+    ('GET /delete-account', 1, lambda u: ('GET', '/delete-account', {})),
+    ('GET /drink-search', 2, lambda u: ('GET', '/drink-search', {})),
+    ('GET /search-drink-results', 8, lambda u: ('GET', '/search-drink-results',
+                                                {'params': {'drink_name': u.rng.choice(SEARCHES)}})),
+    ('GET /cocktails-by-letter', 8, lambda u: ('GET', f'/cocktails-by-letter/{u.rng.choice(LETTERS)}', {})),
+    ('GET /filter-by-alcoholic', 5, lambda u: ('GET', f"/filter-by-alcoholic/{u.rng.choice(['Alcoholic', 'Non_Alcoholic'])}", {})),
+    ('GET /random-cocktail', 3, lambda u: ('GET', '/random-cocktail', {})),
+    ('GET /ingredient-search', 1, lambda u: ('GET', '/ingredient-search', {})),
+    ('POST /ingredient-search', 3, lambda u: ('POST', '/ingredient-search',
+                                              {'data': u.form(ingredient_name=u.rng.choice(['Vodka', 'Gin', 'Tequila']))})),
+    ('GET /what-can-i-make', 1, lambda u: ('GET', '/what-can-i-make', {})),
+    ('POST /what-can-i-make', 4, lambda u: ('POST', '/what-can-i-make', {'data': u.form(ingredients=u.rng.choice(PANTRIES))})),
+    ('GET /pantry', 1, lambda u: ('GET', '/pantry', {})),
+    ('POST /pantry', 4, lambda u: ('POST', '/pantry', {'data': u.form(ingredients=u.rng.choice(PANTRIES))})),
+    ('POST /add-favorite', 4, lambda u: u.add_favorite()),
+    ('POST /remove-favorite', 2, lambda u: u.remove_favorite()),
+    ('POST /favorites/bulk-add', 1, lambda u: ('POST', '/favorites/bulk-add', u.json({'drinks': [
+        {'drink_id': drink_id, 'drink_name': f'Drink {drink_id}'} for drink_id in u.rng.sample(DRINK_IDS, 3)]}))),
+    ('POST /favorites/bulk-remove', 1, lambda u: ('POST', '/favorites/bulk-remove',
+                                                  u.json({'drink_ids': u.rng.sample(DRINK_IDS, 3)}))),
+    ('GET /favorites', 5, lambda u: ('GET', '/favorites', {})),
+    ('GET /favorites.json', 3, lambda u: ('GET', '/favorites.json', {})),
+    ('GET /api/v1/drinks/search', 3, lambda u: ('GET', '/api/v1/drinks/search', {'params': {'name': u.rng.choice(SEARCHES)}})),
+    ('GET /api/v1/drinks/letter', 3, lambda u: ('GET', f'/api/v1/drinks/letter/{u.rng.choice(LETTERS)}', {})),
+    ('GET /api/v1/drinks/filter', 2, lambda u: ('GET', '/api/v1/drinks/filter/Non_Alcoholic', {})),
+    ('GET /api/v1/drinks/random', 1, lambda u: ('GET', '/api/v1/drinks/random', {})),
+    ('GET /api/v1/favorites', 2, lambda u: ('GET', '/api/v1/favorites', {})),
+]
+
+
+class VirtualUser:
+    """One logged-in browser session"""
+
+    def __init__(self, base_url, number, seed):
+        self.base_url = base_url
+        self.number = number
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+        self.csrf_token = ''
+
+    def _scrape_token(self, path):
+        match = CSRF_TOKEN.search(self.session.get(self.base_url + path).text)
+        self.csrf_token = match.group(1) if match else ''
+
+    def form(self, **fields):
+        return dict(fields, csrf_token=self.csrf_token)
+
+    def json(self, payload):
+        return {'json': payload, 'headers': {'X-CSRFToken': self.csrf_token}}
+
+    def sign_up(self, run_id):
+        """Create the user's account and log in"""
+        email = f'load-{run_id}-{self.number}@example.com'
+        self._scrape_token('/')
+        self.session.post(self.base_url + '/', data=self.form(
+            first_name='Load', last_name=f'User{self.number}', dob='1990-01-01', address='1 Main St',
+            city='Testville', state='SC', zip='12345', phone_number=f'{run_id % 10**6:06d}{self.number:04d}',
+            email=email, password='password123', confirm_password='password123',
+        ))
+        self._scrape_token('/login')
+        response = self.session.post(self.base_url + '/login', data=self.form(email=email, password='password123'),
+                                     allow_redirects=False)
+        if response.status_code != 302:
+            raise RuntimeError(f"User {self.number} could not log in (status {response.status_code})")
+        # The token is tied to the session, which changed on login
+        self._scrape_token('/pantry')
+
+    def add_favorite(self):
+        drink_id = self.rng.choice(DRINK_IDS)
+        return 'POST', f'/add-favorite/{drink_id}', {'data': self.form(drink_name=f'Drink {drink_id}', drink_thumb='')}
+
+    def remove_favorite(self):
+        # Finding (or making) a favorite to remove isn't part of the timed request
+        favorites = self.session.get(self.base_url + '/favorites.json').json()['favorites']
+        if not favorites:
+            method, path, kwargs = self.add_favorite()
+            self.session.request(method, self.base_url + path, **kwargs)
+            favorites = self.session.get(self.base_url + '/favorites.json').json()['favorites']
+        return 'POST', f"/remove-favorite/{favorites[0]['id']}", {'headers': {'X-CSRFToken': self.csrf_token}}
+
+    def run(self, stop_at, record_after, samples, errors, scenarios=SCENARIOS):
+        routes, weights, builders = zip(*scenarios)
+        while time.perf_counter() < stop_at:
+            index = self.rng.choices(range(len(routes)), weights)[0]
+            method, path, kwargs = builders[index](self)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, self.base_url + path, allow_redirects=False, timeout=30, **kwargs)
+                failed = response.status_code >= 400
+            except requests.RequestException:
+                failed = True
+            elapsed = time.perf_counter() - started
+            if started >= record_after:
+                samples[routes[index]].append(elapsed)
+                if failed:
+                    errors[routes[index]] += 1
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def start_local_app(args, **config):
+    """Serve the app in-process against a fake upstream and a scratch database; returns its URL
+
+    Keyword arguments override the app's config.
+    """
+    from app import create_app
+    from config import TestingConfig
+    from models import db
+
+    upstream = FakeCocktailDB(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=args.seed)
+    upstream.start()
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'load.db')}"
+
+    class LoadTestConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+        COCKTAILDB_BASE_URL = upstream.url
+        WTF_CSRF_ENABLED = True
+
+    app = create_app(type('LoadTestConfig', (LoadTestConfig,), config))
+    with app.app_context():
+        db.create_all()
+
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.port}'
+
+
+def compare(results, baseline, tolerance):
+    """Return the routes (and 'total') that got slower than the baseline allows"""
+    regressions = []
+    for route, current in results['routes'].items():
+        before = baseline['routes'].get(route)
+        if before and before['p95'] and current['p95'] > before['p95'] * tolerance:
+            regressions.append(f"{route}: p95 {current['p95']:.1f} ms vs {before['p95']:.1f} ms")
+    if results['total_rps'] < baseline['total_rps'] / tolerance:
+        regressions.append(f"total: {results['total_rps']:.1f} req/s vs {baseline['total_rps']:.1f} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="drive a running app instead of starting one in-process")
+    parser.add_argument('--database-url', help="database for the in-process app (default: a scratch SQLite file)")
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20, help="seconds to record for")
+    parser.add_argument('--warmup', type=float, default=3, help="seconds to run before recording")
+    parser.add_argument('--latency', type=float, default=0, help="seconds the fake upstream adds to each call")
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of fake upstream calls that fail")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=1.25, help="allowed slowdown before flagging a regression")
+    parser.add_argument('--fail-on-regression', action='store_true', help="exit with status 1 on a regression")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip('/') if args.url else start_local_app(args)
+    run_id = int(time.time())
+    users = [VirtualUser(base_url, n, args.seed + n) for n in range(args.users)]
+    for user in users:
+        user.sign_up(run_id)
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    started = time.perf_counter()
+    record_after = started + args.warmup
+    stop_at = record_after + args.duration
+    threads = [threading.Thread(target=user.run, args=(stop_at, record_after, samples, errors)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results = {'routes': {}, 'total_rps': round(sum(map(len, samples.values())) / args.duration, 2)}
+    print(f"{'route':<32}{'requests':>9}{'errors':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for route, _, _ in SCENARIOS:
+        times = sorted(samples[route])
+        if not times:
+            continue
+        p50, p95, p99 = (percentile(times, p) * 1000 for p in (50, 95, 99))
+        results['routes'][route] = {'requests': len(times), 'errors': errors[route],
+                                    'rps': round(len(times) / args.duration, 2),
+                                    'p50': round(p50, 2), 'p95': round(p95, 2), 'p99': round(p99, 2)}
+        print(f"{route:<32}{len(times):>9}{errors[route]:>8}{len(times) / args.duration:>8.1f}"
+              f"{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}")
+    print(f"total: {results['total_rps']:.1f} req/s with {args.users} users")
+
+    settings = {'target': 'url' if args.url else 'in-process', 'users': args.users, 'latency': args.latency,
+                'jitter': args.jitter, 'error_rate': args.error_rate}
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(dict(results, settings=settings, machine={
+                'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            }), f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with; run with --save-baseline to store one")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != settings:
+        print(f"Baseline was recorded with different settings ({baseline.get('settings')}); not comparing")
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"Slower than the baseline by more than {args.tolerance}x:")
+        for regression in regressions:
+            print(f"  {regression}")
+        if args.fail_on_regression:
+            sys.exit(1)
+    else:
+        print(f"Within {args.tolerance}x of the baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Benchmark bcrypt logins per second at different work factors.
+
+A login is one bcrypt check, so checks/sec on one thread is the
+logins/sec a single core can sustain. The pool rows show how much a
+thread or process pool of the given size gets through when that many
+logins arrive at once.
+
+    python benchmarks/bench_password_hashing.py [--costs 10 11 12 13] [--workers 4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from passwords import bcrypt  # noqa: E402
+
+PASSWORD = 'correct horse battery staple'
+
+
+def logins_per_second(password_hash, seconds, executor=None, batch=1):
+    done = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        if executor is None:
+            bcrypt.check_password_hash(password_hash, PASSWORD)
+        else:
+            futures = [executor.submit(bcrypt.check_password_hash, password_hash, PASSWORD) for _ in range(batch)]
+            for future in futures:
+                future.result()
+        done += batch
+    return done / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--costs', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument('--seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, pools of {args.workers} workers")
+    print(f"{'cost':>4}  {'ms/login':>9}  {'logins/s/core':>13}  {'thread pool':>11}  {'process pool':>12}")
+    with ThreadPoolExecutor(args.workers) as threads, ProcessPoolExecutor(args.workers) as processes:
+        for cost in args.costs:
+            password_hash = bcrypt.generate_password_hash(PASSWORD, cost)
+            single = logins_per_second(password_hash, args.seconds)
+            threaded = logins_per_second(password_hash, args.seconds, threads, args.workers)
+            pooled = logins_per_second(password_hash, args.seconds, processes, args.workers)
+            print(f"{cost:>4}  {1000 / single:>9.1f}  {single:>13.1f}  {threaded:>11.1f}  {pooled:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark building and querying the "also liked" recommendation index.
+
+Generates synthetic favorites (by default 100k users and 1M favorites
+over a CocktailDB-sized catalog, with skewed drink popularity and a few
+taste groups so the co-occurrences mean something), then times
+RecommendationIndex.build() on them, similar() for a drink and
+for_drinks() for a user's favorites. For comparison it also times one
+similar-drinks query worked out directly from the favorites, the way a
+self-join on favorite_drinks would, which is what every query would cost
+without the index.
+
+    python benchmarks/bench_recommendations.py [--users 100000] [--favorites 1000000] [--drinks 640]
+"""
+import argparse
+import os
+import sys
+import time
+import timeit
+from collections import Counter, defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from recommendations import RecommendationIndex  # noqa: E402
+
+
+def synthetic_favorites(users, favorites, drinks, groups=20, seed=1):
+    """Return (user ids, drink ids) arrays of distinct favorites"""
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, drinks + 1) ** 0.8
+    popularity /= popularity.sum()
+    # Each taste group ranks the drinks in its own order
+    rankings = np.array([rng.permutation(drinks) for _ in range(groups)])
+    group_of_user = rng.integers(0, groups, users)
+
+    # Draw extra, since a user picking the same drink twice only counts once
+    draws = int(favorites * 1.3)
+    user_ids = rng.integers(0, users, draws)
+    ranks = rng.choice(drinks, draws, p=popularity)
+    drink_ids = rankings[group_of_user[user_ids], ranks]
+
+    pairs = np.unique(user_ids.astype(np.int64) * drinks + drink_ids)
+    pairs = rng.permutation(pairs)[:favorites]
+    return pairs // drinks, (pairs % drinks).astype(str)
+
+
+def direct_similar(favorites_by_user, users_by_drink, drink_id, k=10):
+    """Count the drinks favorited by the users who favorited drink_id, as a query over the table would"""
+    counts = Counter()
+    for user_id in users_by_drink[drink_id]:
+        counts.update(favorites_by_user[user_id])
+    del counts[drink_id]
+    return counts.most_common(k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--favorites', type=int, default=1000000)
+    parser.add_argument('--drinks', type=int, default=640)
+    parser.add_argument('--neighbors', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    user_ids, drink_ids = synthetic_favorites(args.users, args.favorites, args.drinks)
+    index = RecommendationIndex(neighbors=args.neighbors)
+    build = min(timeit.repeat(lambda: index.build(user_ids, drink_ids), number=1, repeat=args.repeat))
+
+    rng = np.random.default_rng(2)
+    drinks = list(rng.choice(drink_ids, 1000))
+    favorites_by_user = defaultdict(list)
+    for user_id, drink_id in zip(user_ids.tolist(), drink_ids.tolist()):
+        favorites_by_user[user_id].append(drink_id)
+    baskets = [favorites_by_user[user_id] for user_id in rng.choice(user_ids, 1000)]
+
+    def per_query(fn, queries):
+        started = time.perf_counter()
+        for query in queries:
+            fn(query)
+        return (time.perf_counter() - started) / len(queries) * 1e6
+
+    similar = per_query(index.similar, drinks)
+    for_user = per_query(index.for_drinks, baskets)
+
+    users_by_drink = defaultdict(list)
+    for user_id, drink_id in zip(user_ids.tolist(), drink_ids.tolist()):
+        users_by_drink[drink_id].append(user_id)
+    direct = per_query(lambda drink_id: direct_similar(favorites_by_user, users_by_drink, drink_id), drinks[:20])
+
+    print(f"{len(np.unique(user_ids))} users, {len(user_ids)} favorites, {len(index)} drinks, "
+          f"{index._index.similarity.nnz} similar pairs, mean {len(user_ids) / len(np.unique(user_ids)):.1f} per user")
+    print(f"index build:                         {build * 1e3:10.1f} ms")
+    print(f"similar() per drink:                 {similar:10.1f} us/query")
+    print(f"for_drinks() per user's favorites:   {for_user:10.1f} us/query")
+    print(f"similar drinks straight from the table: {direct:7.1f} us/query")
+
+
+if __name__ == '__main__':
+    main()
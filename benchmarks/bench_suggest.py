@@ -0,0 +1,89 @@
+"""Benchmark /suggest lookups on the prefix and trigram index.
+
+Runs against a full catalog dump (from `flask catalog sync --dump`) when
+one is given, otherwise against a synthetic catalog the size of
+CocktailDB's. Times every prefix of a set of names as the user would
+type them, plus misspelled queries that fall through to the trigram
+index, and compares them with a linear scan over every name.
+
+    python benchmarks/bench_suggest.py [--dump catalog.json]
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from drinks import Drink  # noqa: E402
+from suggest_index import SuggestIndex, suggest_key  # noqa: E402
+
+
+def synthetic_catalog(drink_count=640, ingredient_count=490, seed=1):
+    rng = random.Random(seed)
+
+    def name():
+        words = rng.randint(1, 3)
+        return ' '.join(''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))).title()
+                        for _ in range(words))
+
+    ingredients = [name() for _ in range(ingredient_count)]
+    return [Drink(str(10000 + n), name(), ingredients=[(i, '') for i in rng.sample(ingredients, rng.randint(2, 7))])
+            for n in range(drink_count)]
+
+
+def misspell(name, rng):
+    """Swap two neighbouring letters, the most common typo"""
+    if len(name) < 4:
+        return name
+    i = rng.randrange(1, len(name) - 2)
+    return name[:i] + name[i + 1] + name[i] + name[i + 2:]
+
+
+def linear_suggest(keys, query, limit=8):
+    key = suggest_key(query)
+    return [name for name_key, name in keys if key in name_key][:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dump', help="catalog dump written by `flask catalog sync --dump`")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.dump:
+        with open(args.dump) as f:
+            drinks = [Drink.from_api(data) for data in json.load(f)['drinks']]
+    else:
+        drinks = synthetic_catalog()
+
+    index = SuggestIndex()
+    build = timeit.timeit(lambda: SuggestIndex().sync(drinks), number=5) / 5
+    index.sync(drinks)
+
+    rng = random.Random(2)
+    names = [entry.name for entry in rng.sample(index._entries, min(50, len(index)))]
+    keystrokes = [name[:n] for name in names for n in range(1, len(name) + 1)]
+    typos = [misspell(name, rng) for name in names]
+    keys = [(suggest_key(entry.name), entry.name) for entry in index._entries]
+
+    def per_query(fn, queries):
+        total = timeit.timeit(lambda: [fn(query) for query in queries], number=args.repeat)
+        return total / (args.repeat * len(queries)) * 1e6
+
+    prefix = per_query(index.suggest, keystrokes)
+    fuzzy = per_query(index.suggest, typos)
+    linear = per_query(lambda query: linear_suggest(keys, query), keystrokes)
+
+    print(f"catalog: {len(drinks)} drinks, {len(index)} names")
+    print(f"index build:                      {build * 1e3:8.2f} ms")
+    print(f"each keystroke (prefix/words):    {prefix:8.1f} us/query")
+    print(f"misspelled names (trigrams):      {fuzzy:8.1f} us/query")
+    print(f"substring scan over every name:   {linear:8.1f} us/query")
+
+
+if __name__ == '__main__':
+    main()
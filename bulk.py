@@ -0,0 +1,349 @@
+import csv
+import io
+import json
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+from itertools import islice
+
+import click
+from email_validator import EmailNotValidError, validate_email
+from flask import current_app
+from flask.cli import AppGroup
+
+from choices import STATE_CHOICES
+from models import db, read_replica, FavoriteDrink, User
+from passwords import password_hasher
+
+# The fields of each kind of record, in the order they are exported; imports
+# of users may give a plain `password` instead of `password_hash`
+USER_FIELDS = ['first_name', 'last_name', 'dob', 'address', 'city', 'state', 'zip', 'phone_number', 'email',
+               'password_hash']
+FAVORITE_FIELDS = ['email', 'drink_id', 'drink_name', 'drink_thumb']
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+FORMAT_BY_EXTENSION = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+FORMAT_BY_MIMETYPE = {'text/csv': 'csv', 'application/x-ndjson': 'jsonl', 'application/jsonl': 'jsonl'}
+
+STATES = {state for state, _ in STATE_CHOICES}
+
+# An import reports this many of the records it rejected, with their line numbers
+MAX_REPORTED_ERRORS = 100
+
+
+class ImportResult:
+    """How many records an import added, skipped as duplicates and rejected as invalid"""
+
+    def __init__(self):
+        self.imported = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def reject(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self):
+        return {
+            'imported': self.imported,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors],
+        }
+
+
+def format_of(filename):
+    """Return the format a file's extension implies, or None"""
+    for extension, format in FORMAT_BY_EXTENSION.items():
+        if filename.lower().endswith(extension):
+            return format
+    return None
+
+
+def read_records(stream, format):
+    """Yield (line number, record dict) for every record in a CSV (with a header row) or JSONL stream
+
+    Lines that aren't a JSON object come through as None, for the importer
+    to reject.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def batches(iterable, size):
+    """Yield lists of up to `size` items from an iterable, without reading it all in"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _text(record, field, required=True):
+    """Return a record's field as stripped text no longer than its column allows"""
+    value = record.get(field)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise ValueError(f"{field} is missing")
+        return None
+    column = User.__table__.c.get(field)
+    if column is None:
+        column = FavoriteDrink.__table__.c[field]
+    if len(value) > column.type.length:
+        raise ValueError(f"{field} is longer than {column.type.length} characters")
+    return value
+
+
+def clean_user(record):
+    """Return a user record as users row values, or raise ValueError saying what's wrong with it
+
+    The checks are the ones the registration form makes. A plain
+    `password` is left in the row for the importer to hash.
+    """
+    if record is None:
+        raise ValueError("not a JSON object")
+    row = {field: _text(record, field) for field in USER_FIELDS if field not in ('dob', 'password_hash')}
+
+    try:
+        row['dob'] = date.fromisoformat(str(record.get('dob') or '').strip())
+    except ValueError:
+        raise ValueError("dob must be a YYYY-MM-DD date")
+    if row['state'] not in STATES:
+        raise ValueError(f"{row['state']} is not a state")
+    if len(row['zip']) != 5:
+        raise ValueError("zip must be 5 characters")
+    try:
+        validate_email(row['email'], check_deliverability=False)
+    except EmailNotValidError:
+        raise ValueError(f"{row['email']} is not an email address")
+
+    password_hash = _text(record, 'password_hash', required=False)
+    if password_hash:
+        if not password_hash.startswith('$2'):
+            raise ValueError("password_hash is not a bcrypt hash")
+        row['password_hash'] = password_hash
+    else:
+        password = record.get('password')
+        if not password or len(str(password)) < 6:
+            raise ValueError("password (of at least 6 characters) or password_hash is missing")
+        row['password'] = str(password)
+    return row
+
+
+def clean_favorite(record):
+    """Return a favorite record's values (with the user's email), or raise ValueError saying what's wrong"""
+    if record is None:
+        raise ValueError("not a JSON object")
+    return {
+        'email': _text(record, 'email'),
+        'drink_id': _text(record, 'drink_id'),
+        'drink_name': _text(record, 'drink_name'),
+        'drink_thumb': _text(record, 'drink_thumb', required=False),
+    }
+
+
+def _new_users(batch, result):
+    """Return the valid users in a batch whose email and phone number aren't taken, in one query"""
+    rows, emails, phone_numbers = [], set(), set()
+    for line, record in batch:
+        try:
+            row = clean_user(record)
+        except ValueError as e:
+            result.reject(line, str(e))
+            continue
+        if row['email'] in emails or row['phone_number'] in phone_numbers:
+            result.duplicates += 1
+            continue
+        emails.add(row['email'])
+        phone_numbers.add(row['phone_number'])
+        rows.append(row)
+
+    taken_emails, taken_phone_numbers = User.registered(emails, phone_numbers)
+    new = [row for row in rows if row['email'] not in taken_emails and row['phone_number'] not in taken_phone_numbers]
+    result.duplicates += len(rows) - len(new)
+    return new
+
+
+def import_users(records, batch_size=1000, executor=None):
+    """Register users from (line number, record) pairs a batch at a time; returns an ImportResult
+
+    Each batch is validated, checked for taken emails and phone numbers in
+    one query, has its plain passwords hashed on `executor` (by default the
+    password hasher's own PASSWORD_HASH_POOL) and goes in with one bulk
+    insert and commit. Users already registered count as duplicates, so an
+    import that stopped part way can simply be run again.
+    """
+    result = ImportResult()
+    for batch in batches(records, batch_size):
+        rows = _new_users(batch, result)
+        # Only users that will be inserted are worth the bcrypt
+        unhashed = [row for row in rows if 'password' in row]
+        hashes = password_hasher.hash_many([row.pop('password') for row in unhashed], executor)
+        for row, password_hash in zip(unhashed, hashes):
+            row['password_hash'] = password_hash
+
+        User.insert_many(rows)
+        db.session.commit()
+        result.imported += len(rows)
+    return result
+
+
+def import_favorites(records, batch_size=1000):
+    """Add favorites from (line number, record) pairs a batch at a time; returns an ImportResult
+
+    Records name their user by email. Each batch looks its users up in one
+    query and goes in with one insert that skips favorites users already
+    have (counted as duplicates), keeping the leaderboard counts in step.
+    """
+    result = ImportResult()
+    for batch in batches(records, batch_size):
+        favorites = []
+        for line, record in batch:
+            try:
+                favorites.append((line, clean_favorite(record)))
+            except ValueError as e:
+                result.reject(line, str(e))
+
+        user_ids = User.ids_by_email({favorite['email'] for _, favorite in favorites})
+        rows = []
+        for line, favorite in favorites:
+            email = favorite.pop('email')
+            if email not in user_ids:
+                result.reject(line, f"no user with the email {email}")
+                continue
+            rows.append(dict(favorite, user_id=user_ids[email]))
+
+        added = FavoriteDrink.add_many(rows)
+        db.session.commit()
+        result.imported += added
+        result.duplicates += len(rows) - added
+    return result
+
+
+def _export(query, fields, format, batch_size):
+    """Yield a query's rows (id first, then `fields`) as text, one keyset page of `batch_size` at a time"""
+    if format == 'csv':
+        yield ','.join(fields) + '\r\n'
+
+    key = query.selected_columns[0]
+    after = None
+    while True:
+        page = query if after is None else query.where(key > after)
+        with read_replica():
+            rows = db.session.execute(page.order_by(key).limit(batch_size)).all()
+        if not rows:
+            return
+
+        buffer = io.StringIO()
+        if format == 'csv':
+            csv.writer(buffer).writerows(row[1:] for row in rows)
+        else:
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(fields, row[1:])), default=str) + '\n')
+        yield buffer.getvalue()
+        after = rows[-1][0]
+
+
+def export_users(format, batch_size=1000, with_hashes=False):
+    """Yield every user as CSV or JSONL text, in the format import_users reads
+
+    Password hashes are left out unless `with_hashes` is set (only
+    `flask bulk export users --with-hashes` does); without them the file
+    can't be imported again as it is.
+    """
+    users = User.__table__.c
+    fields = USER_FIELDS if with_hashes else [field for field in USER_FIELDS if field != 'password_hash']
+    return _export(db.select(users.id, *(users[field] for field in fields)), fields, format, batch_size)
+
+
+def export_favorites(format, batch_size=1000):
+    """Yield every favorite, with its user's email, as CSV or JSONL text, in the format import_favorites reads"""
+    favorites, users = FavoriteDrink.__table__.c, User.__table__.c
+    query = (db.select(favorites.id, users.email, favorites.drink_id, favorites.drink_name, favorites.drink_thumb)
+             .join_from(FavoriteDrink.__table__, User.__table__, favorites.user_id == users.id))
+    return _export(query, FAVORITE_FIELDS, format, batch_size)
+
+
+def import_records(kind, records, batch_size, executor=None):
+    """Import users or favorites (hashing passwords on `executor`); returns an ImportResult"""
+    if kind == 'users':
+        return import_users(records, batch_size, executor)
+    return import_favorites(records, batch_size)
+
+
+def export_records(kind, format, batch_size, with_hashes=False):
+    """Yield every user or favorite as CSV or JSONL text (users' password hashes only with `with_hashes`)"""
+    if kind == 'users':
+        return export_users(format, batch_size, with_hashes)
+    return export_favorites(format, batch_size)
+
+
+bulk_cli = AppGroup('bulk', help="Import and export users and favorites in bulk.")
+
+
+@bulk_cli.command('import')
+@click.argument('kind', type=click.Choice(['users', 'favorites']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)), help="Defaults to the file's extension.")
+@click.option('--batch-size', type=int, help="Records per insert and commit (BULK_IMPORT_BATCH_SIZE).")
+@click.option('--workers', type=int, help="Processes hashing passwords (BULK_IMPORT_WORKERS, one per CPU).")
+def import_command(kind, path, format, batch_size, workers):
+    """Import users or favorites from a CSV or JSONL file.
+
+    Users need first_name, last_name, dob, address, city, state, zip,
+    phone_number, email and a password or password_hash; favorites need
+    the user's email, drink_id, drink_name and optionally drink_thumb.
+    """
+    format = format or format_of(path)
+    if format is None:
+        raise click.BadParameter("Pass --format for files not ending in .csv or .jsonl", param_hint='PATH')
+
+    # A pool of its own is fine in a one-off command; the web workers share the password hasher's
+    with open(path, newline='', encoding='utf-8') as f, \
+            ProcessPoolExecutor(max_workers=workers or current_app.config['BULK_IMPORT_WORKERS']) as pool:
+        result = import_records(kind, read_records(f, format),
+                                batch_size or current_app.config['BULK_IMPORT_BATCH_SIZE'], pool)
+
+    click.echo(f"Imported {result.imported} {kind}; skipped {result.duplicates} duplicates "
+               f"and {result.invalid} invalid records.")
+    for line, message in result.errors:
+        click.echo(f"  line {line}: {message}", err=True)
+
+
+@bulk_cli.command('export')
+@click.argument('kind', type=click.Choice(['users', 'favorites']))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'format', type=click.Choice(list(FORMATS)), help="Defaults to the file's extension.")
+@click.option('--batch-size', type=int, help="Rows read per query (BULK_IMPORT_BATCH_SIZE).")
+@click.option('--with-hashes', is_flag=True,
+              help="Include the users' password hashes, so the file can be imported again. Keep it safe.")
+def export_command(kind, path, format, batch_size, with_hashes):
+    """Export every user or favorite to a CSV or JSONL file.
+
+    Users are exported without their password hashes unless --with-hashes
+    is given; only then can `flask bulk import` read the file back.
+    """
+    format = format or format_of(path)
+    if format is None:
+        raise click.BadParameter("Pass --format for files not ending in .csv or .jsonl", param_hint='PATH')
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        for chunk in export_records(kind, format, batch_size or current_app.config['BULK_IMPORT_BATCH_SIZE'],
+                                    with_hashes):
+            f.write(chunk)
+    click.echo(f"Exported the {kind} to {path}.")
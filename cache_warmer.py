@@ -0,0 +1,87 @@
+import string
+import threading
+
+from catalog import CatalogError, CatalogUnavailable, catalog
+
+# Filters every visitor can reach from the navigation
+HOT_FILTERS = ('Alcoholic', 'Non_Alcoholic')
+
+
+class CacheWarmer:
+    """Keeps the hot catalog queries in the cache so users never wait on a cold fetch
+
+    Every `interval` seconds a daemon thread re-fetches the letter pages,
+    the alcoholic filters and the most searched-for terms that would go
+    stale before the next pass (or aren't cached yet). Each process warms
+    its own cache, since that is what its requests read from.
+    """
+
+    def __init__(self, client=catalog, interval=60, top_searches=20):
+        self.client = client
+        self.interval = interval
+        self.top_searches = top_searches
+        self.logger = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        """Configure the warmer and start it with the first request"""
+        # Seconds between passes; None turns warming off
+        app.config.setdefault('CATALOG_WARM_INTERVAL', 60)
+        app.config.setdefault('CATALOG_WARM_TOP_SEARCHES', 20)
+        self.interval = app.config['CATALOG_WARM_INTERVAL']
+        self.top_searches = app.config['CATALOG_WARM_TOP_SEARCHES']
+        self.logger = app.logger
+        app.extensions['cache_warmer'] = self
+
+        # The local catalog is read from the database, so there is nothing to warm
+        if self.interval and app.config['CATALOG_SOURCE'] == 'api':
+            # Not at startup, so CLI commands don't spin up a thread that calls the API
+            app.before_first_request(self.start)
+
+    def hot_queries(self):
+        """Return the (endpoint, path, params) of every query worth keeping warm"""
+        queries = [('letter', 'search.php', {'f': letter}) for letter in string.ascii_lowercase]
+        queries += [('filter', 'filter.php', {'a': type}) for type in HOT_FILTERS]
+        queries += [('search', 'search.php', {'s': term}) for term in self.client.top_searches(self.top_searches)]
+        return queries
+
+    def warm(self):
+        """Fetch the hot queries due to go stale before the next pass; returns how many were fetched"""
+        fetched = 0
+        for endpoint, path, params in self.hot_queries():
+            try:
+                if self.client.warm(endpoint, path, params, within=2 * (self.interval or 0)):
+                    fetched += 1
+            except CatalogUnavailable:
+                # The API is down; the breaker will let the next pass try again
+                break
+            except CatalogError as e:
+                if self.logger:
+                    self.logger.warning("Could not warm %s %s: %s", path, params, e)
+        return fetched
+
+    def start(self):
+        """Warm on a daemon thread every `interval` seconds until stop() is called"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='catalog-warmer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.warm()
+            except Exception:
+                # Never let one bad pass stop the warming for the life of the process
+                if self.logger:
+                    self.logger.exception("Catalog warming pass failed")
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+
+cache_warmer = CacheWarmer()
@@ -0,0 +1,592 @@
+import contextvars
+import string
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from drinks import Drink
+from metrics import timed
+
+API_BASE_URL = 'https://www.thecocktaildb.com/api/json/v1/1'
+
+# How long (in seconds) each kind of lookup stays fresh in the cache
+DEFAULT_TTLS = {
+    'search': 10 * 60,
+    'letter': 60 * 60,
+    'filter': 60 * 60,
+    'ingredient_filter': 60 * 60,
+    'ingredient': 24 * 60 * 60,
+    'lookup': 24 * 60 * 60,
+}
+
+# Endpoints whose drinks are full records (filter.php only has id, name and thumb)
+FULL_DRINK_ENDPOINTS = {'search', 'letter', 'lookup'}
+
+# How long past its TTL an entry may still be served while it is refreshed
+DEFAULT_STALE_TTL = 60 * 60
+
+# The first characters search.php?f= can be walked over to list every drink
+SYNC_FIRST_CHARACTERS = string.ascii_lowercase + string.digits
+
+# How many distinct search terms are counted before the rarest are forgotten
+SEARCH_COUNT_LIMIT = 1000
+
+# Upstream statuses worth retrying (and counting against the circuit breaker)
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class CatalogError(Exception):
+    """Raised when the cocktail API can't be reached or returns an error"""
+
+
+class CatalogUnavailable(CatalogError):
+    """Raised without calling the API while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing service for a while after repeated failures
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    every call fails fast for `reset_timeout` seconds. After that a single
+    trial call is let through; if it succeeds the breaker closes again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        """Return True if a call may be made right now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Give back a trial call that never reached the service, without counting it either way"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class SingleFlight:
+    """Runs one call per key at a time; concurrent callers for the key share its result
+
+    The first caller runs the call; everyone arriving while it is in flight
+    waits for it and gets the same result, or the same exception.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return fn(), or the result of the identical call already in flight"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            with timed('upstream'):
+                return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a per-entry TTL"""
+
+    def __init__(self, maxsize=512, stale_ttl=DEFAULT_STALE_TTL):
+        self.maxsize = maxsize
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return (value, state) where state is 'fresh', 'stale', 'expired' or None
+
+        Expired entries count as misses but are kept (until evicted) so they
+        can still be served if the API is down.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, fresh_until, stale_until = entry
+                if now < fresh_until:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value, 'fresh'
+                if now < stale_until:
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    return value, 'stale'
+                self.misses += 1
+                return value, 'expired'
+            self.misses += 1
+            return None, None
+
+    def peek(self, key):
+        """Return the state get() would report, without counting it or touching recency"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, fresh_until, stale_until = entry
+            if now < fresh_until:
+                return 'fresh'
+            return 'stale' if now < stale_until else 'expired'
+
+    def fresh_for(self, key):
+        """Return how many seconds an entry stays fresh (negative once stale), or None if absent"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            return entry[1] - time.monotonic()
+
+    def set(self, key, value, ttl):
+        """Store a value, evicting the least recently used entries if full
+
+        Returns the value it replaced, or None.
+        """
+        now = time.monotonic()
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = (value, now + ttl, now + ttl + self.stale_ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return previous[0] if previous is not None else None
+
+    def clear(self):
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return the cache counters as a dict"""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CatalogClient:
+    """Cached client for the CocktailDB endpoints used by the app"""
+
+    def __init__(self, base_url=API_BASE_URL, maxsize=512, ttls=None, stale_ttl=DEFAULT_STALE_TTL):
+        self.base_url = base_url
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.cache = TTLCache(maxsize=maxsize, stale_ttl=stale_ttl)
+        self.timeout = (3.05, 5)
+        self.pool_size = 10
+        self.retries = 2
+        self.backoff = 0.3
+        self.fanout_workers = 8
+        self.breaker = CircuitBreaker()
+        self._session = None
+        self._executor = None
+        self._setup_lock = threading.Lock()
+        self._listeners = []
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self.flights = SingleFlight()
+        self.search_counts = Counter()
+        self.generation = 0
+
+    @staticmethod
+    def _make_session(pool_size=10, retries=2, backoff=0.3):
+        """Build a keep-alive session that retries idempotent GETs with backoff"""
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def init_app(self, app):
+        """Configure the client from the app's config"""
+        app.config.setdefault('COCKTAILDB_BASE_URL', API_BASE_URL)
+        app.config.setdefault('CATALOG_CACHE_SIZE', 512)
+        app.config.setdefault('CATALOG_CACHE_TTLS', {})
+        app.config.setdefault('CATALOG_CACHE_STALE_TTL', DEFAULT_STALE_TTL)
+        app.config.setdefault('CATALOG_CONNECT_TIMEOUT', 3.05)
+        app.config.setdefault('CATALOG_READ_TIMEOUT', 5)
+        app.config.setdefault('CATALOG_POOL_SIZE', 10)
+        app.config.setdefault('CATALOG_RETRIES', 2)
+        app.config.setdefault('CATALOG_RETRY_BACKOFF', 0.3)
+        app.config.setdefault('CATALOG_BREAKER_THRESHOLD', 5)
+        app.config.setdefault('CATALOG_BREAKER_RESET', 30)
+        app.config.setdefault('CATALOG_FANOUT_WORKERS', 8)
+
+        self.base_url = app.config['COCKTAILDB_BASE_URL']
+        self.ttls = dict(DEFAULT_TTLS, **app.config['CATALOG_CACHE_TTLS'])
+        self.cache = TTLCache(
+            maxsize=app.config['CATALOG_CACHE_SIZE'],
+            stale_ttl=app.config['CATALOG_CACHE_STALE_TTL'],
+        )
+        self.timeout = (app.config['CATALOG_CONNECT_TIMEOUT'], app.config['CATALOG_READ_TIMEOUT'])
+        self.pool_size = app.config['CATALOG_POOL_SIZE']
+        self.retries = app.config['CATALOG_RETRIES']
+        self.backoff = app.config['CATALOG_RETRY_BACKOFF']
+        self.fanout_workers = app.config['CATALOG_FANOUT_WORKERS']
+        self.breaker = CircuitBreaker(
+            failure_threshold=app.config['CATALOG_BREAKER_THRESHOLD'],
+            reset_timeout=app.config['CATALOG_BREAKER_RESET'],
+        )
+        # The next call makes a session and pool with the new settings
+        self.close()
+        app.extensions['catalog'] = self
+
+    @property
+    def session(self):
+        """The keep-alive HTTP session, made on first use"""
+        if self._session is None:
+            with self._setup_lock:
+                if self._session is None:
+                    self._session = self._make_session(self.pool_size, self.retries, self.backoff)
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    @property
+    def executor(self):
+        """The pool fan-outs run on, made on first use
+
+        It bounds how many lookups one fan-out (and all of them together)
+        can have in flight.
+        """
+        if self._executor is None:
+            with self._setup_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.fanout_workers, thread_name_prefix='catalog')
+        return self._executor
+
+    def close(self):
+        """Close the HTTP session and shut the fan-out pool down (they're remade on next use)"""
+        with self._setup_lock:
+            session, executor = self._session, self._executor
+            self._session = self._executor = None
+        if session is not None:
+            session.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def add_listener(self, callback):
+        """Call `callback(drinks)` with every list of full drinks fetched from the API"""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    @staticmethod
+    def _parse(endpoint, data):
+        """Turn a decoded payload into what is cached: Drinks, or ingredient dicts"""
+        if endpoint == 'ingredient':
+            ingredients = data.get('ingredients')
+            return ingredients if isinstance(ingredients, list) else []
+        drinks = data.get('drinks')
+        # Unknown ingredients come back as {"drinks": "no data found"}
+        if not isinstance(drinks, list):
+            return []
+        return [Drink.from_api(drink) for drink in drinks]
+
+    def _store(self, endpoint, key, data, cache_misses=True):
+        """Cache a fresh payload and pass any full drink records to the listeners"""
+        value = self._parse(endpoint, data)
+        if not value and not cache_misses:
+            return value
+        self._replace(key, value, self.ttls[endpoint])
+        # Only search results carry recipes; filter.php returns id, name and thumb
+        if endpoint in FULL_DRINK_ENDPOINTS and value:
+            if endpoint != 'lookup':
+                # Full records double as drink details, saving later lookups
+                for drink in value:
+                    self._replace(self._lookup_key(drink.id), [drink], self.ttls['lookup'])
+            for callback in self._listeners:
+                callback(value)
+        return value
+
+    def _replace(self, key, value, ttl):
+        """Cache a value, moving the catalog version on if it changed what was cached"""
+        previous = self.cache.set(key, value, ttl)
+        if previous is not None and previous != value:
+            with self._refresh_lock:
+                self.generation += 1
+
+    @staticmethod
+    def _key(path, params):
+        return (path, tuple(sorted(params.items())))
+
+    @classmethod
+    def _lookup_key(cls, drink_id):
+        return cls._key('lookup.php', {'i': str(drink_id)})
+
+    def fetch(self, path, params=None):
+        """Call the API directly, bypassing the cache, and return the decoded JSON"""
+        if not self.breaker.allow():
+            raise CatalogUnavailable("The cocktail API is unavailable, not retrying yet")
+
+        try:
+            data = self._request(path, params)
+        except CatalogError:
+            self.breaker.record_failure()
+            raise
+
+        self.breaker.record_success()
+        return data
+
+    def _request(self, path, params):
+        """Make the HTTP call on the pooled session"""
+        try:
+            with timed('upstream'):
+                response = self.session.get(f"{self.base_url}/{path}", params=params, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise CatalogError(f"Could not reach the cocktail API: {e}") from e
+        return self._decode(response)
+
+    @staticmethod
+    def _decode(response):
+        """Return the JSON of an API response (requests or httpx), or raise CatalogError"""
+        if response.status_code != 200:
+            raise CatalogError(f"Cocktail API returned status {response.status_code}")
+
+        try:
+            # The API answers with an empty body when nothing matches
+            return response.json() if response.content else {}
+        except ValueError as e:
+            raise CatalogError("Cocktail API returned invalid JSON") from e
+
+    def _cached(self, endpoint, path, params, cache_misses=True):
+        """Serve a lookup from the cache, fetching or refreshing it as needed
+
+        With cache_misses off an empty result isn't cached, so callers
+        probing for ids that may not exist can't fill the cache with them.
+        """
+        key = self._key(path, params)
+        value, state = self.cache.get(key)
+
+        if state == 'fresh':
+            return value
+        if state == 'stale':
+            # Serve the old copy now and refresh it for the next caller
+            self._refresh_in_background(endpoint, key, path, params)
+            return value
+
+        try:
+            return self._fetch_once(endpoint, key, path, params, cache_misses)
+        except CatalogError:
+            if state == 'expired':
+                # Old data beats an error page while the API is degraded
+                return value
+            raise
+
+    def _fetch_once(self, endpoint, key, path, params, cache_misses=True):
+        """Fetch and cache a query, sharing one upstream call between concurrent callers"""
+        return self.flights.do(key, lambda: self._store(endpoint, key, self.fetch(path, params), cache_misses))
+
+    def warm(self, endpoint, path, params, within=0):
+        """Fetch a query ahead of time unless it stays fresh for `within` more seconds
+
+        Returns True if it was fetched.
+        """
+        key = self._key(path, params)
+        fresh_for = self.cache.fresh_for(key)
+        if fresh_for is not None and fresh_for > within:
+            return False
+        self._fetch_once(endpoint, key, path, params)
+        return True
+
+    def _refresh_in_background(self, endpoint, key, path, params):
+        """Re-fetch a stale entry on a daemon thread, at most once at a time per key"""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                self._fetch_once(endpoint, key, path, params)
+            except CatalogError:
+                # Keep serving the stale copy; the next caller will try again
+                pass
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def search_drinks(self, name):
+        """Return the drinks whose name matches the search term"""
+        term = name.strip().lower()
+        self._count_search(term)
+        return self._cached('search', 'search.php', {'s': term})
+
+    def _count_search(self, term):
+        with self._refresh_lock:
+            self.search_counts[term] += 1
+            if len(self.search_counts) > SEARCH_COUNT_LIMIT:
+                # Forget the long tail, keeping the counts of the popular terms
+                self.search_counts = Counter(dict(self.search_counts.most_common(SEARCH_COUNT_LIMIT // 2)))
+
+    def top_searches(self, n):
+        """Return the n most searched-for terms, most popular first"""
+        with self._refresh_lock:
+            return [term for term, count in self.search_counts.most_common(n)]
+
+    def _submit(self, fn, *args):
+        """Run fn on the pool with the caller's context, so its upstream time is still counted"""
+        return self.executor.submit(contextvars.copy_context().run, fn, *args)
+
+    def drinks_by_letter(self, letter):
+        """Return the drinks whose name starts with the given letter"""
+        return self._cached('letter', 'search.php', {'f': letter.lower()})
+
+    def filter_by_alcoholic(self, type):
+        """Return the (id, name, thumb only) drinks for Alcoholic or Non_Alcoholic"""
+        return self._cached('filter', 'filter.php', {'a': type})
+
+    def filter_by_ingredient(self, name):
+        """Return the (id, name, thumb only) drinks that use an ingredient"""
+        return self._cached('ingredient_filter', 'filter.php', {'i': name.strip().lower()})
+
+    def filter_by_ingredients(self, names):
+        """Look up several ingredients concurrently; returns {name: drinks}"""
+        futures = {name: self._submit(self.filter_by_ingredient, name) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+    def search_ingredients(self, name):
+        """Return the ingredient details matching the search term"""
+        return self._cached('ingredient', 'search.php', {'i': name.strip().lower()})
+
+    def lookup_drink(self, drink_id, cache_misses=True):
+        """Return the full details of one drink, or None if it doesn't exist (cached unless cache_misses is off)"""
+        drinks = self._cached('lookup', 'lookup.php', {'i': str(drink_id)}, cache_misses)
+        return drinks[0] if drinks else None
+
+    def lookup_drinks(self, drink_ids):
+        """Return {drink id: details} for many drinks at once
+
+        Cached details are used first; the misses are fetched concurrently on
+        the bounded pool and written back to the cache. Drinks that can't be
+        fetched are left out rather than failing the whole page.
+        """
+        drink_ids = list(dict.fromkeys(str(drink_id) for drink_id in drink_ids))
+        misses = [drink_id for drink_id in drink_ids if self.cache.peek(self._lookup_key(drink_id)) in (None, 'expired')]
+        futures = {drink_id: self._submit(self.lookup_drink, drink_id) for drink_id in misses}
+
+        details = {}
+        for drink_id in drink_ids:
+            try:
+                if drink_id in futures:
+                    drink = futures[drink_id].result()
+                else:
+                    drink = self.lookup_drink(drink_id)
+            except CatalogError:
+                continue
+            if drink:
+                details[drink_id] = drink
+        return details
+
+    def random_drink(self):
+        """Return a random drink; never cached"""
+        drinks = self._parse('random', self.fetch('random.php'))
+        return drinks[0] if drinks else None
+
+    def all_drinks(self):
+        """Return every drink, walking the (cached) first-letter pages concurrently"""
+        futures = [self._submit(self.drinks_by_letter, letter) for letter in SYNC_FIRST_CHARACTERS]
+        return [drink for future in futures for drink in future.result()]
+
+    def catalog_version(self):
+        """The API has no version, so count the refreshes that changed cached data"""
+        return f'api-{self.generation}'
+
+
+def rank_by_ingredients(drinks_by_ingredient):
+    """Merge per-ingredient drink lists into (drink, matched ingredients) pairs
+
+    Drinks using the most of the given ingredients come first, so drinks in
+    the intersection of every list lead the results.
+    """
+    drinks = {}
+    matches = {}
+    for ingredient, ingredient_drinks in drinks_by_ingredient.items():
+        for drink in ingredient_drinks:
+            drinks.setdefault(drink.id, drink)
+            matches.setdefault(drink.id, []).append(ingredient)
+
+    ranked = sorted(drinks, key=lambda id: (-len(matches[id]), drinks[id].name))
+    return [(drinks[id], matches[id]) for id in ranked]
+
+
+catalog = CatalogClient()
@@ -0,0 +1,107 @@
+import os
+
+
+class Config:
+    """Settings shared by every environment"""
+
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql:///whatsyourpoison')
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional read replica for the favorites, profile and logged-in user reads
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+    # A user's reads stay on the primary for this many seconds after they write, so they see their changes
+    DB_REPLICA_STICKY_SECONDS = 10
+    # Connection pool per process and database; connections are pinged before use and replaced after DB_POOL_RECYCLE seconds
+    DB_POOL_SIZE = 5
+    DB_MAX_OVERFLOW = 10
+    DB_POOL_TIMEOUT = 10
+    DB_POOL_RECYCLE = 1800
+    DB_POOL_PRE_PING = True
+    SECRET_KEY = os.environ.get('SECRET_KEY', "Sharapova1")
+    DEBUG_TB_INTERCEPT_REDIRECTS = False
+
+    # bcrypt work factor; existing hashes are upgraded on the next successful login
+    BCRYPT_LOG_ROUNDS = 12
+    # None hashes on the request thread, 'thread' or 'process' on a pool of PASSWORD_HASH_WORKERS
+    PASSWORD_HASH_POOL = None
+    PASSWORD_HASH_WORKERS = 2
+    # Seconds a logged-in user may be served from the per-process cache
+    USER_CACHE_TTL = 60
+
+    # 'api' calls CocktailDB live, 'local' reads the tables filled by `flask catalog sync`
+    CATALOG_SOURCE = os.environ.get('CATALOG_SOURCE', 'api')
+    # Seconds between passes refreshing the letter pages, filters and top searches (None turns it off)
+    CATALOG_WARM_INTERVAL = 60
+    CATALOG_WARM_TOP_SEARCHES = 20
+    MAX_PANTRY_INGREDIENTS = 10
+    MAX_PANTRY_INDEX_INGREDIENTS = 50
+    BULK_FAVORITES_LIMIT = 500
+    # `flask bulk` and /api/v1/admin: records per insert and commit, and the users allowed to use the admin endpoints;
+    # `flask bulk import` hashes on BULK_IMPORT_WORKERS processes (None is one per CPU);
+    # the endpoint only imports users when PASSWORD_HASH_POOL is set, and hashes on that
+    BULK_IMPORT_BATCH_SIZE = 1000
+    BULK_IMPORT_WORKERS = None
+    ADMIN_EMAILS = [email for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email]
+    FAVORITES_PAGE_SIZE = 50
+    SUGGEST_MAX_RESULTS = 20
+    # Seconds between checks for a changed catalog to rebuild the typeahead index from
+    SUGGEST_REFRESH_INTERVAL = 60
+    # "Also liked" neighbors kept per drink, seconds between index rebuilds, and suggestions on /favorites
+    RECOMMENDATIONS_NEIGHBORS = 20
+    RECOMMENDATIONS_REFRESH_INTERVAL = 3600
+    RECOMMENDATIONS_SHOWN = 6
+    # Drinks on the /popular leaderboard, and how long each process reuses it
+    LEADERBOARD_SIZE = 20
+    LEADERBOARD_CACHE_TTL = 60
+    # Serve the upstream-bound routes from async views on a shared httpx client (asgi.py turns them on)
+    ASYNC_VIEWS = False
+    ASYNC_CATALOG_MAX_CONNECTIONS = 20
+    ASYNC_CATALOG_POOL_TIMEOUT = 5
+    # Drinks per page on the letter and alcoholic filter pages
+    LISTING_PAGE_SIZE = 24
+    # Rendered result lists are reused for this long (and until the catalog version moves on)
+    FRAGMENT_CACHE_TTL = 600
+    # How many template chunks to group into each piece of a streamed response
+    TEMPLATE_STREAM_BUFFER = 20
+
+    # Drink thumbnails are served from a disk cache capped at this size, and cached by browsers for a year
+    THUMB_CACHE_MAX_BYTES = 256 * 1024 * 1024
+    THUMB_MAX_AGE = 365 * 24 * 60 * 60
+
+    # /api/v1: how long clients may reuse catalog responses, and when and how hard to compress
+    API_CACHE_MAX_AGE = 300
+    API_COMPRESS_MIN_SIZE = 500
+    API_GZIP_LEVEL = 6
+    API_BROTLI_QUALITY = 5
+
+    # Per-request timings at /metrics; requests slower than this many seconds are logged with their breakdown
+    METRICS_ENABLED = True
+    SLOW_REQUEST_THRESHOLD = 1.0
+    # Who may scrape /metrics: anyone sending `Authorization: Bearer <METRICS_TOKEN>`, or from these addresses
+    # (only list addresses the app really sees; behind a local reverse proxy every request comes from 127.0.0.1)
+    METRICS_ALLOWED_ADDRESSES = ()
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+
+class DevelopmentConfig(Config):
+    DEBUG = True
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'  # Use an in-memory SQLite database for testing
+    WTF_CSRF_ENABLED = False  # Disable CSRF for testing purposes
+    BCRYPT_LOG_ROUNDS = 4  # Keep hashing fast in tests
+    CATALOG_WARM_INTERVAL = None  # Tests only fetch what they ask for
+    RECOMMENDATIONS_REFRESH_INTERVAL = None  # Built on first use
+    SUGGEST_REFRESH_INTERVAL = None  # Loaded on first use
+
+
+class ProductionConfig(Config):
+    pass
+
+
+configs = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
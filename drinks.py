@@ -0,0 +1,84 @@
+import sys
+from collections import namedtuple
+
+# CocktailDB spreads a drink's recipe over strIngredient1..15 / strMeasure1..15
+MAX_DRINK_INGREDIENTS = 15
+
+# One line of a recipe; measure is '' when the API doesn't give one
+Ingredient = namedtuple('Ingredient', ['name', 'measure'])
+
+
+def clean_text(value):
+    """Strip a string from the API, turning blanks into None"""
+    if value is None:
+        return None
+    value = value.strip()
+    return value or None
+
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+
+class Drink:
+    """A cocktail, normalized from CocktailDB's wide and mostly-null records
+
+    The API sends ~50 keys per drink (fifteen ingredient and measure
+    slots, instructions in six languages, ...), nearly all of them null.
+    A Drink keeps only what the app shows, in slots rather than a dict,
+    with the recipe as a tuple of (name, measure) pairs. Ingredient
+    names, measures and the few category/glass values are interned, so
+    every drink using "Vodka" or "1 oz" shares the one string.
+
+    Drinks from filter.php only have an id, name and thumb; the other
+    fields are None and the recipe is empty.
+    """
+
+    __slots__ = ('id', 'name', 'thumb', 'category', 'alcoholic', 'glass', 'instructions', 'ingredients')
+
+    def __init__(self, id, name, thumb=None, category=None, alcoholic=None, glass=None,
+                 instructions=None, ingredients=()):
+        self.id = id
+        self.name = name
+        self.thumb = thumb
+        self.category = _intern(category)
+        self.alcoholic = _intern(alcoholic)
+        self.glass = _intern(glass)
+        self.instructions = instructions
+        self.ingredients = tuple(Ingredient(sys.intern(name), sys.intern(measure or ''))
+                                 for name, measure in ingredients)
+
+    @classmethod
+    def from_api(cls, data):
+        """Build a Drink from a raw CocktailDB dict"""
+        ingredients = []
+        for n in range(1, MAX_DRINK_INGREDIENTS + 1):
+            name = clean_text(data.get(f'strIngredient{n}'))
+            if name:
+                ingredients.append((name, clean_text(data.get(f'strMeasure{n}'))))
+
+        drink_id = data.get('idDrink')
+        return cls(
+            id=str(drink_id) if drink_id is not None else None,
+            name=clean_text(data.get('strDrink')),
+            thumb=clean_text(data.get('strDrinkThumb')),
+            category=clean_text(data.get('strCategory')),
+            alcoholic=clean_text(data.get('strAlcoholic')),
+            glass=clean_text(data.get('strGlass')),
+            instructions=clean_text(data.get('strInstructions')),
+            ingredients=ingredients,
+        )
+
+    @property
+    def ingredient_names(self):
+        return [ingredient.name for ingredient in self.ingredients]
+
+    def __eq__(self, other):
+        if not isinstance(other, Drink):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'<Drink {self.id} {self.name!r}>'
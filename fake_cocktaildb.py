@@ -0,0 +1,172 @@
+"""A local stand-in for the CocktailDB API, for tests and load tests.
+
+Serves the drinks and ingredients of a catalog dump (the fixture by
+default, or one written by `flask catalog sync --dump`) with the same
+endpoints, parameters and response shapes as the real API, and serves
+stand-in thumbnails for them the way the real API host does. Latency and
+errors can be injected to see how the app behaves when upstream is slow
+or flaky.
+
+    python fake_cocktaildb.py [--port 8001] [--latency 0.05] [--error-rate 0.01]
+
+then point the app at it with COCKTAILDB_BASE_URL=http://127.0.0.1:8001/api/json/v1/1
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+from werkzeug.wrappers import Request, Response
+
+FIXTURE_DUMP = os.path.join(os.path.dirname(__file__), 'fixtures', 'cocktaildb_dump.json')
+
+API_PATH = '/api/json/v1/1'
+
+# Thumbnails live on the API's host; responses point them at this server instead
+UPSTREAM_IMAGES = 'https://www.thecocktaildb.com/images/'
+
+# filter.php?a= types and the strAlcoholic value they match
+ALCOHOLIC_FILTERS = {'Alcoholic': 'Alcoholic', 'Non_Alcoholic': 'Non alcoholic'}
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Don't log every request; load tests make thousands"""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def _ingredient_names(drink):
+    for n in range(1, 16):
+        name = drink.get(f'strIngredient{n}')
+        if name and name.strip():
+            yield name.strip()
+
+
+def fake_image(path):
+    """Stand-in bytes for an image: a JPEG header and a body that differs per path (and variant)"""
+    digest = hashlib.sha256(path.encode('utf-8')).digest()
+    return b'\xff\xd8\xff\xe0' + digest * (4 if path.endswith(('/preview', '/small')) else 32)
+
+
+def _summary(drink):
+    """The id, name and thumb that filter.php returns"""
+    return {key: drink[key] for key in ('strDrink', 'strDrinkThumb', 'idDrink')}
+
+
+class FakeCocktailDB:
+    """Serves a catalog dump the way CocktailDB does, on a background thread
+
+    `latency` seconds (plus up to `jitter` more) are added to every
+    response, and `error_rate` of requests fail with a 503.
+    """
+
+    def __init__(self, dump_path=FIXTURE_DUMP, latency=0, jitter=0, error_rate=0, seed=None):
+        with open(dump_path) as f:
+            dump = json.load(f)
+        self.drinks = dump.get('drinks', [])
+        self.ingredients = dump.get('ingredients', [])
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def respond(self, endpoint, args):
+        """Return the JSON payload for an API call, or None for an unknown endpoint"""
+        if endpoint == 'search.php':
+            if 's' in args:
+                term = args['s'].lower()
+                return {'drinks': [d for d in self.drinks if term in d['strDrink'].lower()] or None}
+            if 'f' in args:
+                letter = args['f'].lower()
+                return {'drinks': [d for d in self.drinks if d['strDrink'].lower().startswith(letter)] or None}
+            if 'i' in args:
+                name = args['i'].lower()
+                return {'ingredients': [i for i in self.ingredients if i['strIngredient'].lower() == name] or None}
+        elif endpoint == 'filter.php':
+            if 'a' in args:
+                alcoholic = ALCOHOLIC_FILTERS.get(args['a'], args['a'])
+                return {'drinks': [_summary(d) for d in self.drinks if d.get('strAlcoholic') == alcoholic] or None}
+            if 'i' in args:
+                name = args['i'].lower()
+                drinks = [_summary(d) for d in self.drinks if name in (n.lower() for n in _ingredient_names(d))]
+                return {'drinks': drinks or 'no data found'}
+        elif endpoint == 'lookup.php':
+            return {'drinks': [d for d in self.drinks if d['idDrink'] == args.get('i')] or None}
+        elif endpoint == 'random.php':
+            with self._lock:
+                drink = self.random.choice(self.drinks) if self.drinks else None
+            return {'drinks': [drink] if drink else None}
+        elif endpoint == 'list.php':
+            return {'drinks': [{'strIngredient1': i['strIngredient']} for i in self.ingredients]}
+        return None
+
+    def wsgi_app(self, environ, start_response):
+        request = Request(environ)
+        with self._lock:
+            self.request_count += 1
+            fail = self.error_rate and self.random.random() < self.error_rate
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            response = Response('Service Unavailable', status=503)
+        elif request.path.startswith('/images/'):
+            response = Response(fake_image(request.path), mimetype='image/jpeg')
+        else:
+            payload = self.respond(request.path.rsplit('/', 1)[-1], request.args)
+            if payload is None:
+                response = Response('Not Found', status=404)
+            else:
+                body = json.dumps(payload).replace(UPSTREAM_IMAGES, f'{request.host_url}images/')
+                response = Response(body, mimetype='application/json')
+        return response(environ, start_response)
+
+    def start(self, host='127.0.0.1', port=0):
+        """Serve on a daemon thread (port 0 picks a free port); returns self"""
+        self._server = make_server(host, port, self.wsgi_app, threaded=True, request_handler=QuietRequestHandler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+    @property
+    def url(self):
+        """The base URL to use as COCKTAILDB_BASE_URL"""
+        return f'http://{self._server.host}:{self._server.port}{API_PATH}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dump', default=FIXTURE_DUMP, help="catalog dump written by `flask catalog sync --dump`")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0, help="up to this many more seconds, at random")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of requests answered with a 503")
+    args = parser.parse_args()
+
+    server = FakeCocktailDB(args.dump, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    server.start(args.host, args.port)
+    print(f"Serving {len(server.drinks)} drinks at {server.url} (Ctrl-C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
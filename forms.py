@@ -50,3 +50,16 @@ class LoginForm(FlaskForm):
 class IngredientSearchForm(FlaskForm):
     ingredient_name = StringField('Ingredient Name')
     submit = SubmitField('Search')
+
+class WhatCanIMakeForm(FlaskForm):
+    ingredients = StringField('Ingredients (comma separated)', validators=[DataRequired(), Length(max=1000)])
+    submit = SubmitField('Find Drinks')
+
+    def ingredient_names(self, limit=10):
+        """Return the distinct ingredient names entered, up to `limit`"""
+        names = []
+        for name in self.ingredients.data.split(','):
+            name = name.strip()
+            if name and name.lower() not in (n.lower() for n in names):
+                names.append(name)
+        return names[:limit]
@@ -0,0 +1,177 @@
+import threading
+
+from drinks import MAX_DRINK_INGREDIENTS
+
+
+def ingredient_key(name):
+    """Normalize an ingredient name for matching"""
+    return ' '.join(name.split()).lower()
+
+
+def recipe_keys(drink):
+    """Return the distinct ingredient keys a drink uses"""
+    return frozenset(ingredient_key(ingredient.name) for ingredient in drink.ingredients)
+
+
+def _positions(bits):
+    """Yield the positions of the set bits in an int"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class IngredientIndex:
+    """Inverted index from ingredient to the drinks that use it
+
+    Every drink gets a bit position, and each ingredient maps to an int
+    whose set bits are the drinks using it. Pantry queries are then a
+    handful of bitwise operations over whole ints (one per pantry
+    ingredient), which Python runs in C over every drink at once, instead
+    of a Python loop over every drink's recipe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+        self.loaded_version = None
+
+    def _clear(self):
+        self._positions = {}      # drink id -> bit position
+        self._drinks = []         # bit position -> Drink (None once removed)
+        self._recipes = []        # bit position -> frozenset of ingredient keys
+        self._free = []           # bit positions freed by removed drinks
+        self._by_ingredient = {}  # ingredient key -> bitset of drinks
+        self._by_size = {}        # recipe size -> bitset of drinks
+        self._names = {}          # ingredient key -> display name
+
+    def __len__(self):
+        return len(self._positions)
+
+    def _unset(self, position):
+        """Clear a drink's bits (lock must be held)"""
+        mask = ~(1 << position)
+        for key in self._recipes[position]:
+            self._by_ingredient[key] &= mask
+        size = len(self._recipes[position])
+        self._by_size[size] &= mask
+
+    def _set(self, position, drink, recipe):
+        """Set a drink's bits (lock must be held)"""
+        bit = 1 << position
+        for key in recipe:
+            self._by_ingredient[key] = self._by_ingredient.get(key, 0) | bit
+        self._by_size[len(recipe)] = self._by_size.get(len(recipe), 0) | bit
+        self._drinks[position] = drink
+        self._recipes[position] = recipe
+
+    def update(self, drinks):
+        """Add or replace drinks; drinks without recipes are skipped
+
+        Only drinks whose recipe changed have their bits touched, so this is
+        cheap to call with every page of drinks fetched from the catalog.
+        """
+        with self._lock:
+            for drink in drinks:
+                recipe = recipe_keys(drink)
+                if not recipe:
+                    # filter.php results have no ingredients to index
+                    continue
+
+                for ingredient in drink.ingredients:
+                    self._names.setdefault(ingredient_key(ingredient.name), ingredient.name)
+
+                position = self._positions.get(drink.id)
+                if position is None:
+                    position = self._free.pop() if self._free else len(self._drinks)
+                    if position == len(self._drinks):
+                        self._drinks.append(None)
+                        self._recipes.append(frozenset())
+                    self._positions[drink.id] = position
+                elif self._recipes[position] == recipe:
+                    self._drinks[position] = drink
+                    continue
+                else:
+                    self._unset(position)
+
+                self._set(position, drink, recipe)
+
+    def remove(self, drink_ids):
+        """Drop drinks from the index"""
+        with self._lock:
+            for drink_id in drink_ids:
+                position = self._positions.pop(drink_id, None)
+                if position is None:
+                    continue
+                self._unset(position)
+                self._drinks[position] = None
+                self._recipes[position] = frozenset()
+                self._free.append(position)
+
+    def sync(self, drinks, version=None):
+        """Make the index hold exactly `drinks`, touching only what changed"""
+        drinks = list(drinks)
+        current = {drink.id for drink in drinks}
+        with self._lock:
+            gone = [drink_id for drink_id in self._positions if drink_id not in current]
+        self.remove(gone)
+        self.update(drinks)
+        self.loaded_version = version
+
+    def _missing_counts(self, pantry, max_missing):
+        """Return bitsets of the drinks missing exactly 0..max_missing ingredients
+
+        A bit-sliced counter adds up, for every drink at once, how many
+        pantry ingredients it uses; a drink of recipe size s that uses c of
+        them is missing s - c.
+        """
+        planes = [0] * MAX_DRINK_INGREDIENTS.bit_length()
+        for key in pantry:
+            carry = self._by_ingredient.get(key, 0)
+            for i, plane in enumerate(planes):
+                if not carry:
+                    break
+                planes[i], carry = plane ^ carry, plane & carry
+
+        everything = 0
+        for bits in self._by_size.values():
+            everything |= bits
+
+        def have_exactly(count):
+            bits = everything
+            for i, plane in enumerate(planes):
+                bits &= plane if count >> i & 1 else ~plane
+            return bits
+
+        counts = [0] * (max_missing + 1)
+        for size, drinks in self._by_size.items():
+            for missing in range(min(max_missing, size) + 1):
+                counts[missing] |= drinks & have_exactly(size - missing)
+        return counts
+
+    def makeable(self, pantry):
+        """Return the drinks that can be made entirely from the pantry"""
+        return [drink for drink, missing in self.missing(pantry, max_missing=0)[0]]
+
+    def missing(self, pantry, max_missing=2):
+        """Return {n: [(drink, missing ingredient names)]} for n = 0..max_missing"""
+        keys = {ingredient_key(name) for name in pantry}
+        with self._lock:
+            counts = self._missing_counts(keys, max_missing)
+            results = {}
+            for n, bits in enumerate(counts):
+                hits = [(self._drinks[p], self._recipes[p] - keys) for p in _positions(bits)]
+                hits.sort(key=lambda hit: hit[0].name)
+                results[n] = [(drink, sorted(self._names[key] for key in missing)) for drink, missing in hits]
+            return results
+
+
+ingredient_index = IngredientIndex()
+
+
+def ensure_loaded(index, backend):
+    """(Re)load the index from a catalog backend whenever its data has changed"""
+    version = backend.catalog_version()
+    if version != index.loaded_version:
+        index.sync(backend.all_drinks(), version)
+    return index
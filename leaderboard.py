@@ -0,0 +1,63 @@
+from collections import namedtuple
+
+import click
+from flask.cli import AppGroup
+
+from catalog import TTLCache
+from models import db, DrinkFavoriteCount, read_replica
+
+LeaderboardEntry = namedtuple('LeaderboardEntry', 'drink_id drink_name drink_thumb count')
+
+
+class Leaderboard:
+    """Per-process cache of the most favorited drinks
+
+    The counts are kept up to date as favorites change (see
+    DrinkFavoriteCount), so a miss reads LEADERBOARD_SIZE rows off an
+    index, from the replica when there is one. The result is reused for
+    LEADERBOARD_CACHE_TTL seconds.
+    """
+
+    def __init__(self, size=20, ttl=60):
+        self.size = size
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=8, stale_ttl=0)
+
+    def init_app(self, app):
+        """Configure the leaderboard from the app's config"""
+        app.config.setdefault('LEADERBOARD_SIZE', 20)
+        app.config.setdefault('LEADERBOARD_CACHE_TTL', 60)
+        self.size = app.config['LEADERBOARD_SIZE']
+        self.ttl = app.config['LEADERBOARD_CACHE_TTL']
+        self.clear()
+        app.extensions['leaderboard'] = self
+
+    def top(self, limit=None):
+        """Return the `limit` (default LEADERBOARD_SIZE) most favorited drinks as LeaderboardEntries"""
+        limit = limit or self.size
+        entries, state = self.cache.get(limit)
+        if state == 'fresh':
+            return entries
+
+        with read_replica():
+            entries = [LeaderboardEntry(row.drink_id, row.drink_name, row.drink_thumb, row.count)
+                       for row in DrinkFavoriteCount.top(limit)]
+        self.cache.set(limit, entries, self.ttl)
+        return entries
+
+    def clear(self):
+        self.cache.clear()
+
+
+leaderboard = Leaderboard()
+
+leaderboard_cli = AppGroup('leaderboard', help="Manage the most favorited drinks leaderboard.")
+
+
+@leaderboard_cli.command('reconcile')
+def reconcile_command():
+    """Rebuild the favorite counts from the favorites table."""
+    count = DrinkFavoriteCount.reconcile()
+    db.session.commit()
+    leaderboard.clear()
+    click.echo(f"Counted the favorites of {count} drinks.")
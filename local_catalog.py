@@ -0,0 +1,208 @@
+import json
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from catalog import catalog, CatalogError, SYNC_FIRST_CHARACTERS
+from drinks import Drink, clean_text
+from models import db, CatalogDrink, CatalogIngredient, CatalogSync, DrinkIngredient
+
+# filter.php?a= types and the strAlcoholic value they match
+ALCOHOLIC_FILTERS = {'Alcoholic': 'Alcoholic', 'Non_Alcoholic': 'Non alcoholic'}
+
+
+class LocalCatalog:
+    """Serves catalog lookups from the mirrored tables instead of the API
+
+    Results come back as the same Drinks the API client returns so routes
+    and templates don't care which one they are talking to.
+    """
+
+    def search_drinks(self, name):
+        """Return the drinks whose name contains the search term"""
+        term = name.strip().lower()
+        drinks = (CatalogDrink.query
+                  .filter(db.func.lower(CatalogDrink.name).contains(term, autoescape=True))
+                  .order_by(CatalogDrink.name)
+                  .all())
+        return [drink.to_drink() for drink in drinks]
+
+    def drinks_by_letter(self, letter):
+        """Return the drinks whose name starts with the given letter"""
+        drinks = (CatalogDrink.query
+                  .filter_by(first_letter=letter.lower())
+                  .order_by(CatalogDrink.name)
+                  .all())
+        return [drink.to_drink() for drink in drinks]
+
+    def filter_by_alcoholic(self, type):
+        """Return the drinks for Alcoholic or Non_Alcoholic"""
+        drinks = (CatalogDrink.query
+                  .filter_by(alcoholic=ALCOHOLIC_FILTERS.get(type, type))
+                  .order_by(CatalogDrink.name)
+                  .all())
+        return [drink.to_drink() for drink in drinks]
+
+    def filter_by_ingredient(self, name):
+        """Return the drinks that use an ingredient"""
+        return self.filter_by_ingredients([name])[name]
+
+    def filter_by_ingredients(self, names):
+        """Look up several ingredients in one query; returns {name: drinks}"""
+        wanted = {name.strip().lower(): name for name in names}
+        rows = (db.session.query(DrinkIngredient.ingredient_name, CatalogDrink)
+                .join(CatalogDrink, CatalogDrink.id == DrinkIngredient.drink_id)
+                .filter(db.func.lower(DrinkIngredient.ingredient_name).in_(list(wanted)))
+                .order_by(CatalogDrink.name, CatalogDrink.id)
+                .all())
+
+        results = {name: [] for name in names}
+        for ingredient_name, drink in rows:
+            drinks = results[wanted[ingredient_name.lower()]]
+            # A drink can list the same ingredient twice (e.g. lemon juice and a slice)
+            if not drinks or drinks[-1].id != str(drink.id):
+                drinks.append(drink.to_drink())
+        return results
+
+    def search_ingredients(self, name):
+        """Return the ingredient details matching the search term"""
+        ingredients = (CatalogIngredient.query
+                       .filter(db.func.lower(CatalogIngredient.name) == name.strip().lower())
+                       .all())
+        return [ingredient.to_api_dict() for ingredient in ingredients]
+
+    def lookup_drink(self, drink_id, cache_misses=True):
+        """Return the full details of one drink, or None if it doesn't exist (nothing is cached here)"""
+        return self.lookup_drinks([drink_id]).get(str(drink_id))
+
+    def lookup_drinks(self, drink_ids):
+        """Return {drink id: details} for many drinks with one query"""
+        ids = [int(drink_id) for drink_id in drink_ids if str(drink_id).isdigit()]
+        if not ids:
+            return {}
+        drinks = CatalogDrink.query.filter(CatalogDrink.id.in_(ids)).all()
+        return {str(drink.id): drink.to_drink() for drink in drinks}
+
+    def random_drink(self):
+        """Return a random drink from the mirror"""
+        drink = CatalogDrink.query.order_by(db.func.random()).first()
+        return drink.to_drink() if drink else None
+
+    def all_drinks(self):
+        """Return every mirrored drink"""
+        return [drink.to_drink() for drink in CatalogDrink.query.all()]
+
+    def catalog_version(self):
+        """Return the id of the latest sync, which changes whenever the mirror does"""
+        return db.session.query(db.func.max(CatalogSync.id)).scalar() or 0
+
+
+local_catalog = LocalCatalog()
+
+
+def active_catalog():
+    """Return the backend catalog lookups are served from (CATALOG_SOURCE)"""
+    if current_app.config['CATALOG_SOURCE'] == 'local':
+        return local_catalog
+    return catalog
+
+
+def fetch_catalog_dump(client=catalog, echo=lambda message: None):
+    """Walk the API and return every drink and ingredient as raw API dicts"""
+    drinks = {}
+    for char in SYNC_FIRST_CHARACTERS:
+        data = client.fetch('search.php', {'f': char})
+        for drink in data.get('drinks') or []:
+            drinks[drink['idDrink']] = drink
+        echo(f"{char}: {len(drinks)} drinks so far")
+
+    ingredients = {}
+    names = client.fetch('list.php', {'i': 'list'}).get('drinks') or []
+    for entry in names:
+        data = client.fetch('search.php', {'i': entry['strIngredient1']})
+        for ingredient in data.get('ingredients') or []:
+            ingredients[ingredient['idIngredient']] = ingredient
+    echo(f"{len(ingredients)} ingredients")
+
+    return {'drinks': list(drinks.values()), 'ingredients': list(ingredients.values())}
+
+
+def normalize_drink(data):
+    """Build a CatalogDrink (with its ingredients) from a raw API dict"""
+    parsed = Drink.from_api(data)
+    drink = CatalogDrink(
+        id=int(parsed.id),
+        name=parsed.name,
+        first_letter=parsed.name[0].lower(),
+        category=parsed.category,
+        alcoholic=parsed.alcoholic,
+        glass=parsed.glass,
+        instructions=parsed.instructions,
+        thumb=parsed.thumb,
+    )
+    for position, ingredient in enumerate(parsed.ingredients, start=1):
+        drink.ingredients.append(DrinkIngredient(
+            position=position,
+            ingredient_name=ingredient.name,
+            measure=ingredient.measure or None,
+        ))
+    return drink
+
+
+def normalize_ingredient(data):
+    """Build a CatalogIngredient from a raw API dict"""
+    return CatalogIngredient(
+        id=int(data['idIngredient']),
+        name=clean_text(data['strIngredient']),
+        description=clean_text(data.get('strDescription')),
+        type=clean_text(data.get('strType')),
+        alcohol=clean_text(data.get('strAlcohol')),
+        abv=clean_text(data.get('strABV')),
+    )
+
+
+def import_catalog(dump):
+    """Replace the mirrored tables with the contents of a dump in one transaction"""
+    DrinkIngredient.query.delete()
+    CatalogDrink.query.delete()
+    CatalogIngredient.query.delete()
+
+    drinks = [normalize_drink(data) for data in dump.get('drinks', [])]
+
+    # The API occasionally lists the same ingredient twice under different ids
+    ingredients = {}
+    for data in dump.get('ingredients', []):
+        ingredient = normalize_ingredient(data)
+        ingredients.setdefault(ingredient.name.lower(), ingredient)
+
+    db.session.add_all(drinks)
+    db.session.add_all(ingredients.values())
+    db.session.add(CatalogSync(drink_count=len(drinks), ingredient_count=len(ingredients)))
+    db.session.commit()
+    return len(drinks), len(ingredients)
+
+
+catalog_cli = AppGroup('catalog', help="Manage the local copy of the cocktail catalog.")
+
+
+@catalog_cli.command('sync')
+@click.option('--from-file', 'from_file', type=click.File('r'),
+              help="Import a previously saved dump instead of calling the API.")
+@click.option('--dump', 'dump_file', type=click.File('w'),
+              help="Also save what was fetched to this file.")
+def sync_command(from_file, dump_file):
+    """Mirror the CocktailDB drinks and ingredients into the database."""
+    if from_file:
+        dump = json.load(from_file)
+    else:
+        try:
+            dump = fetch_catalog_dump(echo=click.echo)
+        except CatalogError as e:
+            raise click.ClickException(str(e))
+
+    if dump_file:
+        json.dump(dump, dump_file)
+
+    drink_count, ingredient_count = import_catalog(dump)
+    click.echo(f"Imported {drink_count} drinks and {ingredient_count} ingredients.")
@@ -0,0 +1,287 @@
+import bisect
+import hmac
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from flask import Response, abort, before_render_template, current_app, g, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds; spans a cached page (~1 ms) to a page waiting on a slow upstream
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# What a request's time is broken down into
+COMPONENTS = ('upstream', 'db', 'password', 'template')
+
+# The breakdown of the request being handled, if any (copied into catalog fan-out threads)
+_current = ContextVar('request_breakdown', default=None)
+
+
+class Breakdown:
+    """Time spent in each component during one request, plus its query count
+
+    Calls made concurrently (e.g. a fan-out of upstream lookups) are
+    summed, so a component can add up to more than the request took.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def add(self, component, seconds):
+        with self._lock:
+            self.seconds[component] += seconds
+
+    def count_query(self):
+        with self._lock:
+            self.queries += 1
+
+    def describe(self):
+        parts = [f'{component} {self.seconds[component] * 1000:.1f} ms' for component in COMPONENTS
+                 if component in self.seconds]
+        parts.append(f'{self.queries} queries')
+        return ', '.join(parts)
+
+
+@contextmanager
+def timed(component):
+    """Add the time spent in the block to the current request's breakdown"""
+    breakdown = _current.get()
+    if breakdown is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        breakdown.add(component, time.perf_counter() - started)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Histogram:
+    """A Prometheus histogram with optional labels"""
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels + ('le',), label_values + (repr(float(bound)),))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labels + ('le',), label_values + ('+Inf',))
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """A Prometheus counter with optional labels"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values):
+        with self._lock:
+            self._values[label_values] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Metrics:
+    """Times every request, breaks it down by component and serves /metrics
+
+    Upstream calls, password hashing and template rendering are timed
+    where they happen (with timed()); DB time and query counts come from
+    SQLAlchemy's cursor events. Requests slower than
+    SLOW_REQUEST_THRESHOLD seconds are logged with their breakdown.
+    Streamed responses are timed until their last chunk is generated.
+    """
+
+    def __init__(self):
+        self.requests = Counter('http_requests_total', 'Requests handled', ('endpoint', 'method', 'status'))
+        self.duration = Histogram('http_request_duration_seconds', 'Time to handle a request',
+                                  ('endpoint', 'method'))
+        self.components = Histogram('http_request_component_seconds',
+                                    'Time a request spent in upstream calls, DB queries, password hashing '
+                                    'and template rendering', ('component',))
+        self.queries = Histogram('http_request_db_queries', 'DB queries made by a request',
+                                 buckets=QUERY_COUNT_BUCKETS)
+        self._listening = False
+
+    def init_app(self, app):
+        """Install the request hooks and the /metrics endpoint"""
+        app.config.setdefault('METRICS_ENABLED', True)
+        # Seconds; None turns the slow-request log off
+        app.config.setdefault('SLOW_REQUEST_THRESHOLD', None)
+        # /metrics answers scrapers sending `Authorization: Bearer <METRICS_TOKEN>`, or from these addresses
+        # (none by default: behind a reverse proxy on the same host every request comes from 127.0.0.1)
+        app.config.setdefault('METRICS_ALLOWED_ADDRESSES', ())
+        app.config.setdefault('METRICS_TOKEN', None)
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._reset)
+        app.add_url_rule('/metrics', 'metrics', self.view)
+
+        # Rendering happens between these two signals
+        before_render_template.connect(self._template_started, app, weak=False)
+        template_rendered.connect(self._template_finished, app, weak=False)
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._query_started)
+            event.listen(Engine, 'after_cursor_execute', self._query_finished)
+            event.listen(Engine, 'handle_error', self._query_failed)
+            self._listening = True
+        app.extensions['metrics'] = self
+
+    def _start(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_breakdown = Breakdown()
+        g.metrics_token = _current.set(g.metrics_breakdown)
+
+    def _finish(self, response):
+        started = g.pop('metrics_started', None)
+        breakdown = g.pop('metrics_breakdown', None)
+        if started is None or request.endpoint == 'metrics':
+            return response
+
+        observe = partial(self._observe, current_app._get_current_object(), started, breakdown,
+                          request.endpoint or 'unmatched', request.method, str(response.status_code),
+                          request.full_path.rstrip('?'))
+        if response.is_streamed and not response.direct_passthrough:
+            # The body (and whatever it fetches) is generated after this returns
+            response.response = self._timed_body(response.response, observe)
+        else:
+            observe()
+        return response
+
+    @staticmethod
+    def _timed_body(body, observe):
+        """Yield a streamed body's chunks, then record the request once the last one is out"""
+        try:
+            yield from body
+        finally:
+            observe()
+
+    def _observe(self, app, started, breakdown, endpoint, method, status, path):
+        elapsed = time.perf_counter() - started
+        self.requests.inc(endpoint, method, status)
+        self.duration.observe(elapsed, endpoint, method)
+        for component in COMPONENTS:
+            self.components.observe(breakdown.seconds.get(component, 0.0), component)
+        self.queries.observe(breakdown.queries)
+
+        threshold = app.config['SLOW_REQUEST_THRESHOLD']
+        if threshold is not None and elapsed >= threshold:
+            app.logger.warning('Slow request: %s %s took %.1f ms (%s)', method, path, elapsed * 1000,
+                               breakdown.describe())
+
+    def _reset(self, exc=None):
+        token = g.pop('metrics_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    def _template_started(self, sender, template, context, **extra):
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def _template_finished(self, sender, template, context, **extra):
+        stack = g.get('metrics_templates')
+        breakdown = _current.get()
+        if stack and breakdown is not None:
+            breakdown.add('template', time.perf_counter() - stack.pop())
+
+    def _query_started(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+    def _query_finished(self, conn, cursor, statement, parameters, context, executemany):
+        self._count_query(conn.info['metrics_query_started'].pop())
+
+    def _query_failed(self, context):
+        # A query that raised never reaches after_cursor_execute; pop its start so later ones pair up right
+        stack = context.connection.info.get('metrics_query_started') if context.connection is not None else None
+        if stack:
+            self._count_query(stack.pop())
+
+    @staticmethod
+    def _count_query(started):
+        breakdown = _current.get()
+        if breakdown is not None:
+            breakdown.add('db', time.perf_counter() - started)
+            breakdown.count_query()
+
+    @staticmethod
+    def _scraper_allowed():
+        """True if the request comes from an allowed address or carries the METRICS_TOKEN"""
+        if request.remote_addr in current_app.config['METRICS_ALLOWED_ADDRESSES']:
+            return True
+        token = current_app.config['METRICS_TOKEN']
+        sent = request.headers.get('Authorization', '')
+        return bool(token) and hmac.compare_digest(sent.encode(), f'Bearer {token}'.encode())
+
+    def view(self):
+        """Serve every metric in the Prometheus text format, to allowed scrapers only"""
+        if not self._scraper_allowed():
+            abort(403)
+        body = '\n'.join(metric.render() for metric in (self.requests, self.duration, self.components, self.queries))
+        return Response(body + '\n', mimetype='text/plain; version=0.0.4')
+
+    def clear(self):
+        for metric in (self.requests, self.duration, self.components, self.queries):
+            metric.clear()
+
+
+metrics = Metrics()
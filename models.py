@@ -1,11 +1,94 @@
-from flask_sqlalchemy import SQLAlchemy
+import csv
+import io
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import flask
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
 from datetime import datetime
 from flask_login import UserMixin
-from flask_bcrypt import Bcrypt
+from sqlalchemy import orm
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects import postgresql, sqlite
+
+from drinks import Drink
+from passwords import password_hasher
+
+# Flask session key holding until when the user's reads must go to the primary
+PRIMARY_UNTIL_KEY = 'db_primary_until'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def read_replica():
+    """Send the SELECTs made inside the block to the read replica, if there is one
+
+    Also works as a view decorator: @read_replica().
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class RoutingSession(SignallingSession):
+    """Session that sends the SELECTs inside read_replica() to the replica
+
+    Everything else goes to the primary: writes, anything after this
+    session has written, and every read for DB_REPLICA_STICKY_SECONDS
+    after the user's own last commit, so nobody reads past their own
+    changes while the replica catches up.
+    """
+
+    def __init__(self, db, **options):
+        super().__init__(db, **options)
+        self.wrote = False
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or (clause is not None and not getattr(clause, 'is_select', False)):
+            self.wrote = True
+        elif clause is not None and _replica_reads.get() and not self.wrote and self._has_replica() \
+                and not _reads_own_writes():
+            return get_state(self.app).db.get_engine(self.app, bind='replica')
+        return super().get_bind(mapper, clause)
+
+    def _has_replica(self):
+        return 'replica' in (self.app.config['SQLALCHEMY_BINDS'] or {})
 
-db = SQLAlchemy()
-bcrypt = Bcrypt()
+    def commit(self):
+        super().commit()
+        if self.wrote and self._has_replica() and flask.has_request_context():
+            flask.session[PRIMARY_UNTIL_KEY] = time.time() + self.app.config['DB_REPLICA_STICKY_SECONDS']
+
+
+def _reads_own_writes():
+    """True while the current user's recent commit may not have reached the replica"""
+    return flask.has_request_context() and flask.session.get(PRIMARY_UNTIL_KEY, 0) > time.time()
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """SQLAlchemy with the DB_POOL_* engine settings and a replica-aware session"""
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        # SQLite gets a StaticPool or NullPool, which have nothing to size or recycle
+        if sa_url.drivername != 'sqlite':
+            options.setdefault('pool_size', app.config['DB_POOL_SIZE'])
+            options.setdefault('max_overflow', app.config['DB_MAX_OVERFLOW'])
+            options.setdefault('pool_timeout', app.config['DB_POOL_TIMEOUT'])
+            options.setdefault('pool_recycle', app.config['DB_POOL_RECYCLE'])
+            options.setdefault('pool_pre_ping', app.config['DB_POOL_PRE_PING'])
+        return sa_url, options
+
+
+db = RoutingSQLAlchemy()
 
 class User(db.Model, UserMixin):
     """Table for registering users"""
@@ -26,17 +109,55 @@ class User(db.Model, UserMixin):
     
     def set_password(self, password):
         """Set the password hash for the user"""
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        self.password_hash = password_hasher.hash(password)
         
     def check_password(self, password):
         """Check if the passwword matched the hashed password"""
-        return bcrypt.check_password_hash(self.password_hash, password)
+        return password_hasher.check(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        """Check if the password was hashed with a different cost than configured"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     @classmethod
     def is_phone_number_email_duplicate(cls, phone_number, email):
         """Check if the phone number or email already exists in the database"""
         existing_user = cls.query.filter((cls.phone_number == phone_number) | (cls.email == email)).first()
         return existing_user is not None
+
+    @classmethod
+    def registered(cls, emails, phone_numbers):
+        """Return which of the given emails and phone numbers are already taken, as two sets, in one query"""
+        emails, phone_numbers = list(emails), list(phone_numbers)
+        if not emails and not phone_numbers:
+            return set(), set()
+        rows = (db.session.query(cls.email, cls.phone_number)
+                .filter(cls.email.in_(emails) | cls.phone_number.in_(phone_numbers))
+                .all())
+        return ({email for email, _ in rows if email in emails},
+                {phone_number for _, phone_number in rows if phone_number in phone_numbers})
+
+    @classmethod
+    def ids_by_email(cls, emails):
+        """Return {email: user id} for the given emails that are registered"""
+        emails = list(emails)
+        if not emails:
+            return {}
+        return dict(db.session.query(cls.email, cls.id).filter(cls.email.in_(emails)))
+
+    @classmethod
+    def insert_many(cls, rows):
+        """Insert new users (dicts of column values, password already hashed) without loading them
+
+        On Postgres the rows are streamed in with COPY; elsewhere they go in
+        as one executemany. The caller must have checked for duplicates.
+        """
+        if not rows:
+            return
+        if _dialect(cls) == 'postgresql':
+            _copy(cls, rows)
+        else:
+            db.session.execute(cls.__table__.insert(), rows)
     
 class FavoriteDrink(db.Model):
     """Table for storing users' favorite drinks"""
@@ -51,8 +172,321 @@ class FavoriteDrink(db.Model):
     
     user = relationship("User", backref=db.backref('favorite_drinks', cascade="all, delete-orphan"))
 
+    __table_args__ = (
+        db.Index('ix_favorite_drinks_user_id_drink_id', 'user_id', 'drink_id', unique=True),
+        db.Index('ix_favorite_drinks_user_id_id', 'user_id', 'id'),
+    )
+
+    @classmethod
+    def page_for_user(cls, user_id, after_id=None, limit=50):
+        """Return (favorites, next cursor) for one keyset page ordered by id
+
+        Pages are found by seeking past the last id seen rather than with
+        OFFSET, so every page costs the same however deep it is.
+        """
+        query = cls.query.filter(cls.user_id == user_id)
+        if after_id is not None:
+            query = query.filter(cls.id > after_id)
+        favorites = query.order_by(cls.id).limit(limit + 1).all()
+
+        if len(favorites) > limit:
+            return favorites[:limit], favorites[limit - 1].id
+        return favorites, None
+
+    def to_dict(self):
+        """Return the favorite as a JSON-serializable dict"""
+        return {
+            'id': self.id,
+            'drink_id': self.drink_id,
+            'drink_name': self.drink_name,
+            'drink_thumb': self.drink_thumb,
+        }
+
+    @classmethod
+    def add_for_user(cls, user_id, drinks):
+        """Insert favorites in one statement, skipping ones the user already has
+
+        `drinks` is a list of dicts with drink_id, drink_name and drink_thumb.
+        Returns how many rows were actually inserted.
+        """
+        return cls.add_many([dict(drink, user_id=user_id) for drink in drinks])
+
+    @classmethod
+    def add_many(cls, rows):
+        """Insert favorites of any users in one statement, skipping ones they already have
+
+        `rows` are dicts with user_id, drink_id, drink_name and drink_thumb.
+        Returns how many rows were actually inserted. The unique index makes
+        this safe against concurrent double-clicks, and only the inserted
+        rows are counted on the leaderboard, in the same transaction.
+        """
+        if not rows:
+            return 0
+
+        stmt = _upsert_insert(cls).on_conflict_do_nothing(index_elements=['user_id', 'drink_id'])
+        if _dialect(cls) == 'postgresql':
+            added = db.session.execute(
+                stmt.values(rows).returning(cls.drink_id, cls.drink_name, cls.drink_thumb)).mappings().all()
+        else:
+            # SQLite (in 1.4) has no RETURNING; each single-row insert's rowcount says if it went in
+            added = [row for row in rows if db.session.execute(stmt.values(row)).rowcount]
+
+        DrinkFavoriteCount.increment(added)
+        return len(added)
+
+    @classmethod
+    def drink_ids_for_user(cls, user_id, drink_ids):
+        """Return which of the given drink ids the user has favorited"""
+        drink_ids = list(drink_ids)
+        if not drink_ids:
+            return set()
+        rows = (db.session.query(cls.drink_id)
+                .filter(cls.user_id == user_id, cls.drink_id.in_(drink_ids))
+                .all())
+        return {drink_id for drink_id, in rows}
+
+    @classmethod
+    def remove_for_user(cls, user_id, drink_ids):
+        """Delete the user's favorites for the given drinks; returns how many were removed
+
+        Only the rows actually deleted come off the leaderboard, so a
+        concurrent removal of the same favorite isn't counted twice.
+        """
+        if not drink_ids:
+            return 0
+
+        table = cls.__table__
+        stmt = table.delete().where(table.c.user_id == user_id)
+        if _dialect(cls) == 'postgresql':
+            removed = [drink_id for drink_id, in db.session.execute(
+                stmt.where(table.c.drink_id.in_(drink_ids)).returning(table.c.drink_id))]
+        else:
+            removed = [drink_id for drink_id in set(drink_ids)
+                       if db.session.execute(stmt.where(table.c.drink_id == drink_id)).rowcount]
+
+        DrinkFavoriteCount.decrement(removed)
+        return len(removed)
+
+    @classmethod
+    def drink_ids_of_user(cls, user_id):
+        """Return the ids of every drink the user has favorited"""
+        return [drink_id for drink_id, in db.session.query(cls.drink_id).filter(cls.user_id == user_id)]
+
+    @classmethod
+    def remove_all_for_user(cls, user_id):
+        """Delete every favorite of a user (before deleting the account); returns how many were removed"""
+        return cls.remove_for_user(user_id, cls.drink_ids_of_user(user_id))
+
+
+class DrinkFavoriteCount(db.Model):
+    """Table counting how many users have favorited each drink
+
+    Kept up to date by FavoriteDrink.add_for_user and remove_for_user in
+    the same transaction as the favorites themselves, so the leaderboard
+    is an index scan over the top rows rather than a GROUP BY over every
+    favorite. `flask leaderboard reconcile` rebuilds it from scratch.
+    """
+
+    __tablename__ = "drink_favorite_counts"
+
+    drink_id = db.Column(db.String(50), primary_key=True)
+    drink_name = db.Column(db.String(100), nullable=False)
+    drink_thumb = db.Column(db.String(200))
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def increment(cls, drinks):
+        """Count one more favorite for each drink (dicts with drink_id, drink_name and drink_thumb)
+
+        A drink listed n times (favorited by n users) is counted n times.
+        """
+        if not drinks:
+            return
+        counts = Counter(drink['drink_id'] for drink in drinks)
+        latest = {drink['drink_id']: drink for drink in drinks}
+        # In id order, so concurrent bulk adds lock the rows in the same order and can't deadlock
+        stmt = _upsert_insert(cls).values([{'drink_id': drink_id, 'drink_name': latest[drink_id]['drink_name'],
+                                            'drink_thumb': latest[drink_id].get('drink_thumb'),
+                                            'count': counts[drink_id]}
+                                           for drink_id in sorted(latest)])
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['drink_id'],
+            set_={'count': cls.__table__.c.count + stmt.excluded.count, 'drink_name': stmt.excluded.drink_name,
+                  'drink_thumb': stmt.excluded.drink_thumb},
+        ))
+
+    @classmethod
+    def decrement(cls, drink_ids):
+        """Count one fewer favorite for each drink"""
+        if not drink_ids:
+            return
+        table = cls.__table__
+        db.session.execute(table.update().where(table.c.drink_id.in_(drink_ids)).values(count=table.c.count - 1))
+
+    @classmethod
+    def top(cls, limit):
+        """Return the `limit` most favorited drinks, most favorited first"""
+        return (cls.query
+                .filter(cls.count > 0)
+                .order_by(cls.count.desc(), cls.drink_id)
+                .limit(limit)
+                .all())
+
+    @classmethod
+    def reconcile(cls):
+        """Rebuild every count from favorite_drinks; returns how many drinks are counted"""
+        favorites = FavoriteDrink.__table__.c
+        if _dialect(cls) == 'postgresql':
+            # Hold favorite writes off until the rebuilt counts are committed
+            db.session.execute(db.text('LOCK TABLE favorite_drinks IN SHARE MODE'))
+        counts = (db.select(favorites.drink_id, db.func.max(favorites.drink_name), db.func.max(favorites.drink_thumb),
+                            db.func.count())
+                  .group_by(favorites.drink_id))
+        db.session.execute(cls.__table__.delete())
+        db.session.execute(cls.__table__.insert().from_select(['drink_id', 'drink_name', 'drink_thumb', 'count'], counts))
+        return cls.query.count()
+
+
+# In the order top() reads it (count descending, then drink id), so the leaderboard is a forward index scan
+db.Index('ix_drink_favorite_counts_count_desc_drink_id', DrinkFavoriteCount.count.desc(), DrinkFavoriteCount.drink_id)
+
+
+def _dialect(model):
+    """Return the name of the database dialect a model's table is written to"""
+    return db.session().get_bind(mapper=model.__mapper__).dialect.name
+
+
+def _upsert_insert(model):
+    """Return an insert() into a model's table that supports ON CONFLICT"""
+    dialect = _dialect(model)
+    if dialect == 'postgresql':
+        return postgresql.insert(model.__table__)
+    if dialect == 'sqlite':
+        return sqlite.insert(model.__table__)
+    raise NotImplementedError(f"No upsert support for {dialect}")
+
+
+def _copy(model, rows):
+    """Stream rows into a model's table with Postgres COPY, in the session's transaction"""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    # An unquoted empty field is NULL to COPY, which is what csv writes for None
+    csv.writer(buffer).writerows([row[column] for column in columns] for row in rows)
+    buffer.seek(0)
+
+    session = db.session()
+    cursor = session.connection(mapper=model.__mapper__).connection.cursor()
+    # COPY goes around SQLAlchemy, so tell the session it has written (see RoutingSession)
+    session.wrote = True
+    try:
+        cursor.copy_expert(f"COPY {model.__tablename__} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+class CatalogDrink(db.Model):
+    """Table mirroring the CocktailDB drinks (filled by `flask catalog sync`)"""
+
+    __tablename__ = "catalog_drinks"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    first_letter = db.Column(db.String(1), nullable=False, index=True)
+    category = db.Column(db.String(50))
+    alcoholic = db.Column(db.String(50), index=True)
+    glass = db.Column(db.String(50))
+    instructions = db.Column(db.Text)
+    thumb = db.Column(db.String(200))
+
+    ingredients = relationship(
+        "DrinkIngredient",
+        order_by="DrinkIngredient.position",
+        cascade="all, delete-orphan",
+        lazy="selectin",
+    )
+
+    __table_args__ = (
+        db.Index('ix_catalog_drinks_name_lower', db.func.lower(name)),
+    )
+
+    def to_drink(self):
+        """Return the drink as a Drink, the same type the API client returns"""
+        return Drink(
+            id=str(self.id),
+            name=self.name,
+            thumb=self.thumb,
+            category=self.category,
+            alcoholic=self.alcoholic,
+            glass=self.glass,
+            instructions=self.instructions,
+            ingredients=[(ingredient.ingredient_name, ingredient.measure) for ingredient in self.ingredients],
+        )
+
+
+class DrinkIngredient(db.Model):
+    """Table for the ingredients (and measures) that make up a catalog drink"""
+
+    __tablename__ = "catalog_drink_ingredients"
+
+    drink_id = db.Column(db.Integer, db.ForeignKey('catalog_drinks.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    ingredient_name = db.Column(db.String(100), nullable=False)
+    measure = db.Column(db.String(100))
+
+    __table_args__ = (
+        db.Index('ix_catalog_drink_ingredients_name_lower', db.func.lower(ingredient_name)),
+    )
+
+
+class CatalogSync(db.Model):
+    """Table recording each `flask catalog sync`, used as the mirror's version"""
+
+    __tablename__ = "catalog_syncs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    synced_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    drink_count = db.Column(db.Integer, nullable=False)
+    ingredient_count = db.Column(db.Integer, nullable=False)
+
+
+class CatalogIngredient(db.Model):
+    """Table mirroring the CocktailDB ingredient descriptions"""
+
+    __tablename__ = "catalog_ingredients"
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    type = db.Column(db.String(50))
+    alcohol = db.Column(db.String(10))
+    abv = db.Column(db.String(10))
+
+    __table_args__ = (
+        db.Index('ix_catalog_ingredients_name_lower', db.func.lower(name), unique=True),
+    )
+
+    def to_api_dict(self):
+        """Return the ingredient in the same shape the CocktailDB API uses"""
+        return {
+            'idIngredient': str(self.id),
+            'strIngredient': self.name,
+            'strDescription': self.description,
+            'strType': self.type,
+            'strAlcohol': self.alcohol,
+            'strABV': self.abv,
+        }
+
 
 def connect_db(app):
-    """Connect to database."""
-    db.app = app
+    """Connect to database (and its read replica, when SQLALCHEMY_REPLICA_URI is set)."""
+    app.config.setdefault('DB_POOL_SIZE', 5)
+    app.config.setdefault('DB_MAX_OVERFLOW', 10)
+    app.config.setdefault('DB_POOL_TIMEOUT', 10)
+    app.config.setdefault('DB_POOL_RECYCLE', 1800)
+    app.config.setdefault('DB_POOL_PRE_PING', True)
+    app.config.setdefault('SQLALCHEMY_REPLICA_URI', None)
+    app.config.setdefault('DB_REPLICA_STICKY_SECONDS', 10)
+    if app.config['SQLALCHEMY_REPLICA_URI']:
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {},
+                                              replica=app.config['SQLALCHEMY_REPLICA_URI'])
     db.init_app(app)
\ No newline at end of file
@@ -0,0 +1,45 @@
+import math
+
+
+class Page:
+    """One page of a list, plus what the page links need"""
+
+    def __init__(self, items, page, per_page, total):
+        self.items = items
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else None
+
+
+def paginate(items, page, per_page):
+    """Return page `page` (counting from 1) of a list, or None if there is no such page"""
+    total = len(items)
+    if page < 1 or (page - 1) * per_page >= max(total, 1):
+        return None
+    start = (page - 1) * per_page
+    return Page(items[start:start + per_page], page, per_page, total)
+
+
+def by_name(drinks):
+    """Sort drinks by name (then id), so pages stay stable however upstream orders them"""
+    return sorted(drinks, key=lambda drink: ((drink.name or '').lower(), drink.id or ''))
@@ -0,0 +1,100 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+
+from flask import current_app, has_app_context
+from flask_bcrypt import Bcrypt
+
+from metrics import timed
+
+bcrypt = Bcrypt()
+
+DEFAULT_LOG_ROUNDS = 12
+
+
+def hash_cost(password_hash):
+    """Return the work factor stored in a bcrypt hash like $2b$12$..."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    """Hashes and checks passwords with bcrypt at a configurable cost
+
+    Bcrypt is by far the most CPU-hungry thing the app does, so it can
+    optionally be run on a bounded thread or process pool. The pool caps
+    how many hashes run at once, so a burst of logins can't take every
+    core away from the requests that are only serving pages.
+    """
+
+    def __init__(self):
+        self.executor = None
+
+    def init_app(self, app):
+        """Configure the hasher from the app's config"""
+        app.config.setdefault('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS)
+        # None hashes on the request thread; 'thread' or 'process' use a pool
+        app.config.setdefault('PASSWORD_HASH_POOL', None)
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+
+        bcrypt.init_app(app)
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+        pool = app.config['PASSWORD_HASH_POOL']
+        if pool == 'thread':
+            # bcrypt releases the GIL while hashing, so threads do run in parallel
+            self.executor = ThreadPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                               thread_name_prefix='bcrypt')
+        elif pool == 'process':
+            # Workers come from a clean forkserver, not forks of a worker holding DB connections and threads
+            self.executor = ProcessPoolExecutor(max_workers=app.config['PASSWORD_HASH_WORKERS'],
+                                                mp_context=multiprocessing.get_context('forkserver'))
+        elif pool is None:
+            self.executor = None
+        else:
+            raise ValueError(f"PASSWORD_HASH_POOL must be None, 'thread' or 'process', not {pool!r}")
+        app.extensions['password_hasher'] = self
+
+    @property
+    def rounds(self):
+        """The configured work factor (read per call so it can be changed at runtime)"""
+        if has_app_context():
+            return current_app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_LOG_ROUNDS)
+        return DEFAULT_LOG_ROUNDS
+
+    def _run(self, fn, *args):
+        with timed('password'):
+            if self.executor is None:
+                return fn(*args)
+            return self.executor.submit(fn, *args).result()
+
+    def hash(self, password):
+        """Return the bcrypt hash of a password as a string"""
+        return self._run(bcrypt.generate_password_hash, password, self.rounds).decode('utf-8')
+
+    def hash_many(self, passwords, executor=None):
+        """Return the bcrypt hashes of many passwords, in order, spread over `executor` (or the hasher's pool)"""
+        executor = executor or self.executor
+        rounds = self.rounds
+        with timed('password'):
+            if executor is None:
+                hashes = [bcrypt.generate_password_hash(password, rounds) for password in passwords]
+            else:
+                # A few chunks per worker, so cheap hashes aren't all spent on round trips
+                chunksize = max(1, len(passwords) // 32)
+                hashes = executor.map(bcrypt.generate_password_hash, passwords, repeat(rounds), chunksize=chunksize)
+            return [password_hash.decode('utf-8') for password_hash in hashes]
+
+    def check(self, password_hash, password):
+        """Check a password against a stored hash"""
+        return self._run(bcrypt.check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Return True if a hash was made with a different cost than the configured one"""
+        return hash_cost(password_hash) != self.rounds
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import namedtuple
+from functools import partial
+
+import numpy as np
+from scipy import sparse
+
+from models import db, DrinkFavoriteCount, FavoriteDrink, read_replica
+
+Recommendation = namedtuple('Recommendation', 'drink_id drink_name drink_thumb score')
+
+# Seconds before retrying a failed first build; doubles with every failure, up to the refresh interval
+FIRST_BUILD_RETRY = 1
+
+
+def cosine_similarity(user_positions, drink_positions, user_count, drink_count):
+    """Return the drink x drink cosine similarity of who favorited what, as a CSR matrix
+
+    The favorites become a binary user x drink matrix X; X.T @ X counts
+    the users every pair of drinks has in common, and dividing by the
+    square roots of each drink's own count turns that into the cosine of
+    their user vectors. The diagonal (a drink's similarity to itself) is
+    dropped.
+    """
+    favorites = sparse.csr_matrix(
+        (np.ones(len(user_positions), dtype=np.float32), (user_positions, drink_positions)),
+        shape=(user_count, drink_count),
+    )
+    # A repeated (user, drink) pair still counts once
+    favorites.sum_duplicates()
+    favorites.data[:] = 1
+
+    common = (favorites.T @ favorites).tocsr()
+    norms = np.sqrt(common.diagonal())
+    common.setdiag(0)
+    common.eliminate_zeros()
+
+    rows = np.repeat(np.arange(drink_count), np.diff(common.indptr))
+    common.data /= norms[rows] * norms[common.indices]
+    return common
+
+
+def top_k_per_row(matrix, k):
+    """Return (columns, scores) of each row's k largest entries, best first; missing ones are -1 and 0"""
+    row_count = matrix.shape[0]
+    rows = np.repeat(np.arange(row_count), np.diff(matrix.indptr))
+    # Sort every entry by row, then score (descending), then column, all at once
+    order = np.lexsort((matrix.indices, -matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+    keep = order[rank < k]
+    rank = rank[rank < k]
+
+    columns = np.full((row_count, k), -1, dtype=np.int32)
+    scores = np.zeros((row_count, k), dtype=np.float32)
+    columns[rows[keep], rank] = matrix.indices[keep]
+    scores[rows[keep], rank] = matrix.data[keep]
+    return columns, scores
+
+
+class _Index(namedtuple('_Index', 'drink_ids positions similarity neighbors scores names built_at')):
+    """One immutable build, swapped in whole so readers never see half of one"""
+
+
+class RecommendationIndex:
+    """Item-item index answering "users who liked this also liked" from the favorites
+
+    The item-item similarity of every pair of favorited drinks is computed
+    in one pass of sparse matrix products (see cosine_similarity), and
+    the top `neighbors` of each drink are kept, so similar() is an array
+    lookup. for_drinks() sums the similarity rows of a set of drinks (a
+    user's favorites) to score every other drink. The index is rebuilt
+    from favorite_drinks every RECOMMENDATIONS_REFRESH_INTERVAL seconds
+    on a daemon thread; until its first build is done, queries return
+    nothing rather than hold a page up, and a failed first build is
+    retried within seconds. Without the thread the index is built on
+    first use.
+    """
+
+    def __init__(self, neighbors=20, interval=3600):
+        self.neighbors = neighbors
+        self.interval = interval
+        self.logger = None
+        self._index = None
+        self._build_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        """Configure the index and start refreshing it with the first request"""
+        app.config.setdefault('RECOMMENDATIONS_NEIGHBORS', 20)
+        # Seconds between rebuilds; None only builds on first use
+        app.config.setdefault('RECOMMENDATIONS_REFRESH_INTERVAL', 3600)
+        self.neighbors = app.config['RECOMMENDATIONS_NEIGHBORS']
+        self.interval = app.config['RECOMMENDATIONS_REFRESH_INTERVAL']
+        self.logger = app.logger
+        self.clear()
+        app.extensions['recommendations'] = self
+
+        if self.interval:
+            app.before_first_request(partial(self.start, app))
+
+    def __len__(self):
+        index = self._index
+        return len(index.drink_ids) if index is not None else 0
+
+    def build(self, user_ids, drink_ids, names=None):
+        """Build the index from parallel sequences of (user id, drink id) favorites
+
+        `names` maps drink ids to (name, thumb) for the results.
+        """
+        user_ids = np.asarray(user_ids)
+        drink_ids = np.asarray(drink_ids, dtype=str)
+        unique_drinks, drink_positions = np.unique(drink_ids, return_inverse=True)
+        unique_users, user_positions = np.unique(user_ids, return_inverse=True)
+
+        similarity = cosine_similarity(user_positions, drink_positions, len(unique_users), len(unique_drinks))
+        neighbors, scores = top_k_per_row(similarity, self.neighbors)
+        self._index = _Index(
+            drink_ids=unique_drinks.tolist(),
+            positions={drink_id: position for position, drink_id in enumerate(unique_drinks.tolist())},
+            similarity=similarity,
+            neighbors=neighbors,
+            scores=scores,
+            names=names or {},
+            built_at=time.time(),
+        )
+        return self
+
+    def load(self):
+        """Rebuild the index from the favorites table (needs an app context)"""
+        with read_replica():
+            favorites = db.session.execute(db.select(FavoriteDrink.user_id, FavoriteDrink.drink_id)).all()
+            names = {row.drink_id: (row.drink_name, row.drink_thumb) for row in DrinkFavoriteCount.query}
+        user_ids, drink_ids = zip(*favorites) if favorites else ((), ())
+        return self.build(user_ids, drink_ids, names)
+
+    def ensure_built(self):
+        """Build the index now if it never has been"""
+        if self._index is None:
+            with self._build_lock:
+                if self._index is None:
+                    self.load()
+        return self
+
+    def _ready(self):
+        """Return the index to answer from, or None while the refresh thread makes the first one"""
+        if self._index is None and self._thread is not None and self._thread.is_alive():
+            return None
+        return self.ensure_built()._index
+
+    def _results(self, index, positions, scores):
+        results = []
+        for position, score in zip(positions.tolist(), scores.tolist()):
+            if position < 0 or score <= 0:
+                break
+            drink_id = index.drink_ids[position]
+            name, thumb = index.names.get(drink_id, (None, None))
+            results.append(Recommendation(drink_id, name, thumb, round(score, 4)))
+        return results
+
+    def similar(self, drink_id, k=10):
+        """Return the k drinks most often favorited by the same users as this one"""
+        index = self._ready()
+        position = index.positions.get(str(drink_id)) if index is not None else None
+        if position is None:
+            return []
+        return self._results(index, index.neighbors[position, :k], index.scores[position, :k])
+
+    def for_drinks(self, drink_ids, k=10):
+        """Return the k drinks most similar to a set of drinks (a user's favorites), leaving those out"""
+        index = self._ready()
+        if index is None:
+            return []
+        positions = [index.positions[drink_id] for drink_id in map(str, drink_ids) if drink_id in index.positions]
+        if not positions or k <= 0:
+            return []
+
+        scores = np.asarray(index.similarity[positions].sum(axis=0)).ravel()
+        scores[positions] = 0
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.lexsort((best, -scores[best]))]
+        return self._results(index, best, scores[best])
+
+    def for_user(self, user_id, k=10):
+        """Return the k drinks a user is most likely to favorite next"""
+        if self._ready() is None:
+            return []
+        return self.for_drinks(FavoriteDrink.drink_ids_of_user(user_id), k)
+
+    def start(self, app):
+        """Rebuild on a daemon thread every `interval` seconds until stop() is called"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='recommendations', daemon=True)
+        self._thread.start()
+
+    def _run(self, app):
+        retry = FIRST_BUILD_RETRY
+        while True:
+            try:
+                # Under the lock, so a request's ensure_built() doesn't build it a second time
+                with app.app_context(), self._build_lock:
+                    self.load()
+            except Exception:
+                # A failed rebuild keeps the last index; the next pass tries again
+                if self.logger:
+                    self.logger.exception("Rebuilding the recommendations failed")
+            if self._index is None:
+                # Queries return nothing until the first build, so don't wait a whole interval to retry it
+                delay, retry = min(retry, self.interval), retry * 2
+            else:
+                delay = self.interval
+            if self._stop.wait(delay):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+    def clear(self):
+        self._index = None
+
+
+recommendations = RecommendationIndex()
@@ -0,0 +1,200 @@
+import bisect
+import threading
+import unicodedata
+from collections import Counter, namedtuple
+from functools import partial
+
+from catalog import CatalogError
+from local_catalog import active_catalog
+
+# One suggestable name: a drink (with its id) or an ingredient (id None)
+Suggestion = namedtuple('Suggestion', ['name', 'type', 'id'])
+
+# Trigram matches sharing less than this much of their trigrams are dropped (pg_trgm's default)
+MIN_SIMILARITY = 0.3
+
+
+def suggest_key(name):
+    """Normalize a name for matching: lowercased, accents stripped, spaces collapsed"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.split()).lower()
+
+
+def trigrams(key):
+    """Return the set of trigrams of a normalized name, padded the way pg_trgm pads words"""
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SuggestIndex:
+    """In-memory typeahead over every drink and ingredient name
+
+    Prefix matches come from sorted arrays searched with bisect: one of
+    whole names and one of every later word in a name (so "russ" finds
+    White Russian). When those don't fill the list, names sharing enough
+    trigrams with the query are added, which catches typos. The arrays
+    and posting lists are rebuilt on sync and swapped in whole, so
+    lookups never wait on a rebuild. A daemon thread checks the catalog
+    version every SUGGEST_REFRESH_INTERVAL seconds and rebuilds when it
+    moved on; until its first build is done, suggestions come back empty
+    rather than hold a keystroke up. Without the thread the index is
+    loaded on first use.
+    """
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self.logger = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._load_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._entries = []          # entry id -> Suggestion
+        self._names = []            # sorted (key, entry id) of whole names
+        self._words = []            # sorted (key from a later word on, whole key, entry id)
+        self._trigrams = {}         # trigram -> entry ids
+        self._trigram_counts = []   # entry id -> number of trigrams in its key
+        self.loaded_version = None
+
+    def init_app(self, app):
+        """Configure the index and start refreshing it with the first request"""
+        # Seconds between catalog version checks; None only loads on first use
+        app.config.setdefault('SUGGEST_REFRESH_INTERVAL', 60)
+        self.interval = app.config['SUGGEST_REFRESH_INTERVAL']
+        self.logger = app.logger
+        app.extensions['suggest_index'] = self
+
+        if self.interval:
+            app.before_first_request(partial(self.start, app))
+
+    def __len__(self):
+        return len(self._entries)
+
+    def sync(self, drinks, version=None):
+        """Rebuild the index from the catalog's drinks and the ingredients they use"""
+        entries = []
+        seen = set()
+        for drink in drinks:
+            entries.append(Suggestion(drink.name, 'drink', drink.id))
+            for name in drink.ingredient_names:
+                key = suggest_key(name)
+                if key and key not in seen:
+                    seen.add(key)
+                    entries.append(Suggestion(name, 'ingredient', None))
+
+        names, words, grams, counts = [], [], {}, []
+        for entry_id, entry in enumerate(entries):
+            key = suggest_key(entry.name)
+            names.append((key, entry_id))
+            parts = key.split(' ')
+            for i in range(1, len(parts)):
+                words.append((' '.join(parts[i:]), key, entry_id))
+            entry_grams = trigrams(key)
+            for gram in entry_grams:
+                grams.setdefault(gram, []).append(entry_id)
+            counts.append(len(entry_grams))
+        names.sort()
+        words.sort()
+
+        with self._lock:
+            self._entries, self._names, self._words = entries, names, words
+            self._trigrams, self._trigram_counts = grams, counts
+            self.loaded_version = version
+
+    def refresh(self, backend):
+        """Rebuild from a catalog backend if its data changed since the last sync"""
+        with self._load_lock:
+            version = backend.catalog_version()
+            if version != self.loaded_version:
+                self.sync(backend.all_drinks(), version)
+        return self
+
+    def ready(self, backend):
+        """Return the index for a request, loading it now only if no refresh thread will"""
+        if self.loaded_version is None and not (self._thread is not None and self._thread.is_alive()):
+            self.refresh(backend)
+        return self
+
+    def start(self, app):
+        """Check for a new catalog on a daemon thread every `interval` seconds until stop() is called"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name='suggest-index', daemon=True)
+        self._thread.start()
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    self.refresh(active_catalog())
+            except CatalogError:
+                # Keep suggesting from what was loaded before the catalog went down
+                if self.logger:
+                    self.logger.warning("Refreshing the suggest index failed", exc_info=True)
+            if self._stop.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+    @staticmethod
+    def _prefixed(keys, prefix):
+        """Yield the entry ids of the keys starting with prefix, in key order"""
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and keys[i][0].startswith(prefix):
+            yield keys[i][-1]
+            i += 1
+
+    @staticmethod
+    def _similar(key, grams, counts):
+        """Yield the entry ids sharing enough trigrams with key, most similar first"""
+        query = trigrams(key)
+        shared = Counter()
+        for gram in query:
+            shared.update(grams.get(gram, ()))
+
+        scored = []
+        for entry_id, count in shared.items():
+            similarity = count / (len(query) + counts[entry_id] - count)
+            if similarity >= MIN_SIMILARITY:
+                scored.append((-similarity, entry_id))
+        scored.sort()
+        for score, entry_id in scored:
+            yield entry_id
+
+    def suggest(self, query, limit=8, type=None):
+        """Return up to `limit` Suggestions for what the user has typed so far
+
+        Names starting with the query come first, then names with a later
+        word starting with it, then (for three or more characters) close
+        misspellings, best first. `type` keeps only 'drink' or
+        'ingredient' suggestions.
+        """
+        key = suggest_key(query)
+        if not key:
+            return []
+
+        with self._lock:
+            entries, names, words = self._entries, self._names, self._words
+            grams, counts = self._trigrams, self._trigram_counts
+
+        sources = [self._prefixed(names, key), self._prefixed(words, key)]
+        if len(key) >= 3:
+            # Only scored when the prefix matches run out
+            sources.append(self._similar(key, grams, counts))
+
+        found = []
+        seen = set()
+        for source in sources:
+            for entry_id in source:
+                if entry_id in seen or (type and entries[entry_id].type != type):
+                    continue
+                seen.add(entry_id)
+                found.append(entries[entry_id])
+                if len(found) == limit:
+                    return found
+        return found
+
+
+suggest_index = SuggestIndex()
@@ -1,16 +1,45 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
-from app import app, db
-from models import User, FavoriteDrink
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from app import create_app, db, ASYNC_VIEWS
+from async_catalog import async_catalog
+from config import TestingConfig
+from models import User, FavoriteDrink, DrinkFavoriteCount, read_replica, PRIMARY_UNTIL_KEY
+from leaderboard import leaderboard
+from recommendations import recommendations
+from user_cache import user_cache
+from fragments import fragment_cache, CSRF_PLACEHOLDER
+from catalog import catalog
+from sqlalchemy import event
+from fake_cocktaildb import FakeCocktailDB
+from metrics import metrics
+from passwords import password_hasher
+
+# Catalog routes talk to a local stand-in serving the fixture dump, not the real API
+upstream = FakeCocktailDB(seed=1).start()
+
+
+class OfflineTestingConfig(TestingConfig):
+    COCKTAILDB_BASE_URL = upstream.url
+    THUMB_CACHE_DIR = tempfile.mkdtemp(prefix='thumbs-')
+
+
+app = create_app(OfflineTestingConfig)
+
+
+def tearDownModule():
+    upstream.stop()
+    shutil.rmtree(OfflineTestingConfig.THUMB_CACHE_DIR, ignore_errors=True)
 
 class FlaskAppTests(unittest.TestCase):
 
     @classmethod
     def setUpClass(cls):
         # Set up the application for testing
-        app.config['TESTING'] = True
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use an in-memory SQLite database for testing
-        app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF for testing purposes
-        app.config['DEBUG_TB_INTERCEPT_REDIRECTS'] = False
         cls.client = app.test_client()
         
         with app.app_context():
@@ -25,11 +54,16 @@ class FlaskAppTests(unittest.TestCase):
 
     def setUp(self):
         # Prepare some test data before each test
+        user_cache.clear()
+        fragment_cache.clear()
+        leaderboard.clear()
+        recommendations.clear()
+        metrics.clear()
         with app.app_context():
             user = User(
                 first_name="John",
                 last_name="Doe",
-                dob="1990-01-01",
+                dob=date(1990, 1, 1),
                 address="123 Main St",
                 city="Sample City",
                 state="SC",
@@ -83,6 +117,19 @@ class FlaskAppTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Logged in successfully!', response.data)
 
+    def test_login_rehashes_password_when_cost_changes(self):
+        app.config['BCRYPT_LOG_ROUNDS'] = 5
+        try:
+            response = self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+            self.assertIn(b'Logged in successfully!', response.data)
+
+            with app.app_context():
+                user = User.query.filter_by(email='john@example.com').first()
+                self.assertTrue(user.password_hash.startswith('$2b$05$'))
+                self.assertTrue(user.check_password('password123'))
+        finally:
+            app.config['BCRYPT_LOG_ROUNDS'] = 4
+
     def test_edit_profile(self):
         # Log in first
         self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
@@ -111,6 +158,45 @@ class FlaskAppTests(unittest.TestCase):
             updated_user = User.query.filter_by(email='john@example.com').first()
             self.assertEqual(updated_user.city, 'Updated City')
 
+    def test_logged_in_requests_use_cached_user(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        # Record the statements run while loading the profile page
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get('/profile')
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        self.assertIn(b'Welcome, John Doe', response.data)
+        self.assertFalse([s for s in statements if 'FROM users' in s])
+
+    def test_profile_changes_are_not_served_stale(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        self.client.get('/profile')
+
+        self.client.post('/edit-profile', data={
+            'first_name': 'Johnny', 'last_name': 'Doe', 'dob': '1990-01-01', 'address': '456 Main St',
+            'city': 'Updated City', 'state': 'FL', 'zip': '54321', 'phone_number': '1234567890',
+            'email': 'john@example.com',
+        })
+        response = self.client.get('/profile')
+        self.assertIn(b'Welcome, Johnny Doe', response.data)
+
+    def test_deleted_user_is_logged_out(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        self.client.post('/delete-account', data={'password': 'password123'})
+
+        response = self.client.get('/profile')
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('/login', response.headers['Location'])
+
     def test_cocktails_by_letter_white_russian(self):
         # Log in first
         self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
@@ -123,6 +209,34 @@ class FlaskAppTests(unittest.TestCase):
         # Check if "White Russian" is in the response
         self.assertIn(b'White Russian', response.data)
     
+    def test_letter_page_reuses_cached_fragment_with_per_user_buttons(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        first = self.client.get('/cocktails-by-letter/w')
+        self.assertIn(b'Add to Favorites', first.data)
+        self.assertNotIn(CSRF_PLACEHOLDER.encode(), first.data)
+        self.assertEqual(len(fragment_cache.cache), 1)
+
+        with app.app_context():
+            db.session.add(FavoriteDrink(user_id=self.test_user.id, drink_id='12528', drink_name='White Russian', drink_thumb='t'))
+            db.session.commit()
+
+        # Same fragment, but the favorite button now reflects this user's favorites
+        second = self.client.get('/cocktails-by-letter/w')
+        self.assertIn(b'id="btn-12528" disabled>In Favorites', second.data)
+        self.assertEqual(fragment_cache.cache.stats()['hits'], 1)
+
+    def test_catalog_refresh_invalidates_fragments(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        # The list is rendered while the page streams, so read each one to the end
+        self.client.get('/cocktails-by-letter/w').get_data()
+        catalog.generation += 1
+        self.client.get('/cocktails-by-letter/w').get_data()
+
+        self.assertEqual(fragment_cache.cache.stats()['hits'], 0)
+        self.assertEqual(len(fragment_cache.cache), 2)
+
     def test_filter_by_alcoholic(self):
         # Log in first
         self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
@@ -147,6 +261,61 @@ class FlaskAppTests(unittest.TestCase):
         # Check if at least one known non-alcoholic drink is present
         self.assertIn(b'Afterglow', response.data)  # Replace with a known drink from the data
 
+    def test_listing_pages_are_paginated_and_streamed(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        app.config['LISTING_PAGE_SIZE'] = 1
+        try:
+            first = self.client.get('/cocktails-by-letter/w')
+            self.assertTrue(first.is_streamed)
+            # Pages are in name order, whatever order upstream returns them in
+            self.assertIn(b'Whiskey Sour', first.data)
+            self.assertNotIn(b'White Russian', first.data)
+            self.assertIn(b'Page 1 of 2', first.data)
+            self.assertIn(b'href="/cocktails-by-letter/w?page=2"', first.data)
+
+            second = self.client.get('/cocktails-by-letter/w?page=2')
+            self.assertIn(b'White Russian', second.data)
+            self.assertNotIn(b'rel="next"', second.data)
+
+            self.assertEqual(self.client.get('/cocktails-by-letter/w?page=3').status_code, 404)
+            self.assertEqual(self.client.get('/filter-by-alcoholic/Alcoholic?page=0').status_code, 404)
+        finally:
+            app.config['LISTING_PAGE_SIZE'] = 24
+
+    def test_listing_thumbnails_are_lazy_and_local(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        response = self.client.get('/filter-by-alcoholic/Non_Alcoholic')
+        self.assertRegex(response.get_data(as_text=True), r'<img src="/thumb/\d+\?size=small" [^>]*loading="lazy">')
+
+    def test_thumbnails_are_fetched_once_and_cached_for_good(self):
+        # Like the pages embedding them, thumbnails are for logged-in users
+        self.assertEqual(app.test_client().get('/thumb/11007?size=medium').status_code, 302)
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        fetches = upstream.request_count
+        first = self.client.get('/thumb/11007?size=medium')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.mimetype, 'image/jpeg')
+        self.assertTrue(first.data.startswith(b'\xff\xd8'))
+        self.assertIn('immutable', first.headers['Cache-Control'])
+        self.assertIn('public', first.headers['Cache-Control'])
+        etag = first.headers['ETag']
+        first.close()
+        fetches_after_first = upstream.request_count
+        self.assertGreater(fetches_after_first, fetches)
+
+        # From disk from now on, and a revalidation is a 304
+        again = self.client.get('/thumb/11007?size=medium', headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(upstream.request_count, fetches_after_first)
+
+        self.assertEqual(self.client.get('/thumb/11007?size=huge').status_code, 404)
+        self.assertEqual(self.client.get('/thumb/..%2Fconfig').status_code, 404)
+        self.assertEqual(self.client.get('/thumb/99999').status_code, 404)
+        # Unknown ids don't take up room in the shared catalog cache
+        self.assertIsNone(catalog.cache.peek(catalog._lookup_key('99999')))
+
     def test_delete_account(self):
         # Log in first
         self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
@@ -165,6 +334,37 @@ class FlaskAppTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Margarita', response.data)
         
+    def test_what_can_i_make(self):
+        # Log in first
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        # Search with two ingredients; drinks using both should be listed
+        response = self.client.post('/what-can-i-make', data={'ingredients': 'Vodka, Coffee liqueur'}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'White Russian', response.data)
+        self.assertIn(b'Uses 2 of your 2 ingredients', response.data)
+
+    def test_pantry(self):
+        # Log in first
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        # White Russian also needs light cream, so it is one ingredient away
+        response = self.client.post('/pantry', data={'ingredients': 'Vodka, Coffee liqueur'}, follow_redirects=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'White Russian', response.data)
+        self.assertIn(b'You still need: Light cream', response.data)
+
+    def test_suggest(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        suggestions = self.client.get('/suggest?q=whi').get_json()['suggestions']
+        self.assertEqual(suggestions[0], {'name': 'Whiskey Sour', 'type': 'drink', 'id': '11004'})
+
+        # A typo still finds the drink, and ingredients can be asked for on their own
+        self.assertEqual(self.client.get('/suggest?q=margarta&limit=1').get_json()['suggestions'][0]['name'], 'Margarita')
+        suggestions = self.client.get('/suggest?q=vod&type=ingredient').get_json()['suggestions']
+        self.assertEqual([suggestion['name'] for suggestion in suggestions], ['Vodka'])
+
     def test_add_favorite_drink(self):
         # Log in as the test user
         self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
@@ -182,6 +382,44 @@ class FlaskAppTests(unittest.TestCase):
             favorite = FavoriteDrink.query.filter_by(user_id=self.test_user.id, drink_id='11007').first()
             self.assertIsNotNone(favorite)
 
+    def test_add_favorite_twice(self):
+        # Log in as the test user
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        data = {'drink_name': 'Margarita', 'drink_thumb': 'https://www.thecocktaildb.com/images/media/drink/wpxpvu1439905379.jpg'}
+        self.client.post('/add-favorite/11007', data=data)
+        response = self.client.post('/add-favorite/11007', data=data)
+        self.assertFalse(response.get_json()['success'])
+
+        # Only one row is stored
+        with app.app_context():
+            self.assertEqual(FavoriteDrink.query.filter_by(user_id=self.test_user.id, drink_id='11007').count(), 1)
+
+    def test_bulk_add_and_remove_favorites(self):
+        # Log in as the test user
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        response = self.client.post('/favorites/bulk-add', json={'drinks': [
+            {'drink_id': '11007', 'drink_name': 'Margarita'},
+            {'drink_id': '12528', 'drink_name': 'White Russian', 'drink_thumb': None},
+            {'drink_id': '11007', 'drink_name': 'Margarita'},
+        ]})
+        self.assertEqual(response.get_json(), {'success': True, 'added': 2})
+
+        response = self.client.post('/favorites/bulk-remove', json={'drink_ids': ['11007', '99999']})
+        self.assertEqual(response.get_json(), {'success': True, 'removed': 1})
+
+        with app.app_context():
+            remaining = [f.drink_id for f in FavoriteDrink.query.filter_by(user_id=self.test_user.id)]
+            self.assertEqual(remaining, ['12528'])
+
+    def test_bulk_add_favorites_rejects_bad_payload(self):
+        # Log in as the test user
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        response = self.client.post('/favorites/bulk-add', json={'drinks': [{'drink_name': 'No id'}]})
+        self.assertEqual(response.status_code, 400)
+
     def test_view_favorites(self):
         # Log in as the test user
         self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
@@ -197,6 +435,37 @@ class FlaskAppTests(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn(b'Margarita', response.data)
 
+        # Pages loaded by infinite scroll carry the same recipe details
+        favorite = self.client.get('/favorites.json').get_json()['favorites'][0]
+        self.assertIn('Tequila', [ingredient['name'] for ingredient in favorite['ingredients']])
+        self.assertIn(favorite['instructions'], response.get_data(as_text=True))
+
+    def test_favorites_are_paginated(self):
+        # Log in as the test user
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        with app.app_context():
+            for n in range(5):
+                db.session.add(FavoriteDrink(user_id=self.test_user.id, drink_name=f'Drink {n}', drink_id=str(n)))
+            db.session.commit()
+
+        app.config['FAVORITES_PAGE_SIZE'] = 2
+        try:
+            response = self.client.get('/favorites')
+            self.assertIn(b'Drink 1', response.data)
+            self.assertNotIn(b'Drink 2', response.data)
+            self.assertIn(b'Load More', response.data)
+
+            # Follow the cursors through the JSON variant
+            page = self.client.get('/favorites.json').get_json()
+            names = [f['drink_name'] for f in page['favorites']]
+            while page['next_cursor']:
+                page = self.client.get(f"/favorites.json?after={page['next_cursor']}").get_json()
+                names += [f['drink_name'] for f in page['favorites']]
+            self.assertEqual(names, [f'Drink {n}' for n in range(5)])
+        finally:
+            app.config['FAVORITES_PAGE_SIZE'] = 50
+
     def test_remove_favorite(self):
         # Log in as the test user
         self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
@@ -222,6 +491,496 @@ class FlaskAppTests(unittest.TestCase):
             favorite = FavoriteDrink.query.filter_by(id=favorite_id).first()
             self.assertIsNone(favorite)
 
+    def favorite_counts(self):
+        with app.app_context():
+            return {row.drink_id: row.count for row in DrinkFavoriteCount.query if row.count}
+
+    def test_favorite_counts_follow_every_change(self):
+        with app.app_context():
+            FavoriteDrink.add_for_user(self.test_user.id, [{'drink_id': '11007', 'drink_name': 'Margarita', 'drink_thumb': None}])
+            other = User(first_name="Jane", last_name="Roe", dob=date(1990, 1, 1), address="1 Main St", city="Sample City",
+                         state="SC", zip="12345", phone_number="5550003333", email="jane@example.com", password_hash='x')
+            db.session.add(other)
+            db.session.flush()
+            FavoriteDrink.add_for_user(other.id, [{'drink_id': '11007', 'drink_name': 'Margarita', 'drink_thumb': None}])
+            db.session.commit()
+
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        self.client.post('/add-favorite/11007', data={'drink_name': 'Margarita', 'drink_thumb': ''})
+        self.client.post('/favorites/bulk-add', json={'drinks': [
+            {'drink_id': '12528', 'drink_name': 'White Russian'}, {'drink_id': '12528', 'drink_name': 'White Russian'},
+            {'drink_id': '11000', 'drink_name': 'Mojito'},
+        ]})
+        # Already-favorited drinks aren't counted again
+        self.assertEqual(self.favorite_counts(), {'11007': 2, '12528': 1, '11000': 1})
+
+        self.client.post('/favorites/bulk-remove', json={'drink_ids': ['11000', '11000', '99999']})
+        with app.app_context():
+            favorite_id = FavoriteDrink.query.filter_by(user_id=self.test_user.id, drink_id='12528').one().id
+        self.client.post(f'/remove-favorite/{favorite_id}')
+        self.assertEqual(self.favorite_counts(), {'11007': 2})
+
+        response = self.client.get('/popular')
+        self.assertIn(b'Margarita', response.data)
+        self.assertIn(b'2 favorites', response.data)
+
+        self.client.post('/delete-account', data={'password': 'password123'})
+        self.assertEqual(self.favorite_counts(), {'11007': 1})
+
+    def test_also_liked_recommendations(self):
+        with app.app_context():
+            other = User(first_name="Jane", last_name="Roe", dob=date(1990, 1, 1), address="1 Main St", city="Sample City",
+                         state="SC", zip="12345", phone_number="5550003333", email="jane@example.com", password_hash='x')
+            db.session.add(other)
+            db.session.flush()
+            FavoriteDrink.add_for_user(other.id, [{'drink_id': '11007', 'drink_name': 'Margarita', 'drink_thumb': None},
+                                                  {'drink_id': '12528', 'drink_name': 'White Russian', 'drink_thumb': None}])
+            FavoriteDrink.add_for_user(self.test_user.id, [{'drink_id': '11007', 'drink_name': 'Margarita', 'drink_thumb': None}])
+            db.session.commit()
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        response = self.client.get('/favorites')
+        self.assertIn(b'You Might Also Like', response.data)
+        self.assertIn(b'White Russian', response.data)
+
+        similar = self.client.get('/api/v1/drinks/11007/similar').get_json()['drinks']
+        self.assertEqual([(item['drink']['name'], item['score']) for item in similar], [('White Russian', 0.7071)])
+        recommended = self.client.get('/api/v1/recommendations?limit=5').get_json()['drinks']
+        self.assertEqual([item['drink']['id'] for item in recommended], ['12528'])
+
+    def test_leaderboard_reconcile_rebuilds_the_counts(self):
+        with app.app_context():
+            db.session.add(FavoriteDrink(user_id=self.test_user.id, drink_name='Margarita', drink_id='11007'))
+            db.session.add(DrinkFavoriteCount(drink_id='12528', drink_name='White Russian', count=7))
+            db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['leaderboard', 'reconcile'])
+        self.assertIn('Counted the favorites of 1 drinks.', result.output)
+        self.assertEqual(self.favorite_counts(), {'11007': 1})
+        with app.app_context():
+            self.assertEqual([entry.drink_name for entry in leaderboard.top()], ['Margarita'])
+
+    def scratch_file(self, name):
+        """Return a path in a directory of its own, removed after the test"""
+        directory = tempfile.mkdtemp(prefix='bulk-')
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        return os.path.join(directory, name)
+
+    def test_bulk_import_and_export_users(self):
+        path = self.scratch_file('users.csv')
+        with open(path, 'w') as f:
+            f.write("first_name,last_name,dob,address,city,state,zip,phone_number,email,password\n"
+                    "Ann,Lee,1985-02-03,1 Elm St,Springfield,IL,62701,5550000001,ann@example.com,secret123\n"
+                    "Bob,Ray,1979-12-31,2 Oak St,Portland,OR,97201,5550000002,bob@example.com,secret456\n"
+                    # Taken by the test user, then by Ann earlier in the file
+                    "Jon,Doe,1990-01-01,3 Pine St,Salem,OR,97301,5550000003,john@example.com,secret789\n"
+                    "Ann,Lee,1985-02-03,1 Elm St,Springfield,IL,62701,5550000001,ann2@example.com,secret123\n"
+                    "Cy,Fox,not-a-date,4 Ash St,Salem,OR,97301,5550000004,cy@example.com,secret000\n")
+
+        runner = app.test_cli_runner()
+        result = runner.invoke(args=['bulk', 'import', 'users', path, '--batch-size', '2', '--workers', '2'])
+        self.assertIn('Imported 2 users; skipped 2 duplicates and 1 invalid records.', result.output)
+        self.assertIn('line 6: dob must be a YYYY-MM-DD date', result.output)
+
+        # Imported users log in with the passwords from the file
+        response = self.client.post('/login', data={'email': 'bob@example.com', 'password': 'secret456'},
+                                    follow_redirects=True)
+        self.assertIn(b'Logged in successfully!', response.data)
+
+        export = self.scratch_file('users.jsonl')
+        runner.invoke(args=['bulk', 'export', 'users', export, '--batch-size', '2'])
+        with open(export) as f:
+            exported = [json.loads(line) for line in f]
+        self.assertEqual([user['email'] for user in exported], ['john@example.com', 'ann@example.com', 'bob@example.com'])
+        self.assertEqual(exported[1]['dob'], '1985-02-03')
+        # Password hashes only go out when asked for
+        self.assertNotIn('password_hash', exported[0])
+        runner.invoke(args=['bulk', 'export', 'users', export, '--with-hashes'])
+
+        # The export imports again as nothing but duplicates
+        result = runner.invoke(args=['bulk', 'import', 'users', export])
+        self.assertIn('Imported 0 users; skipped 3 duplicates and 0 invalid records.', result.output)
+
+    def test_bulk_import_favorites_keeps_the_counts(self):
+        with app.app_context():
+            FavoriteDrink.add_for_user(self.test_user.id, [{'drink_id': '11007', 'drink_name': 'Margarita', 'drink_thumb': None}])
+            db.session.commit()
+
+        path = self.scratch_file('favorites.jsonl')
+        with open(path, 'w') as f:
+            for record in [{'email': 'john@example.com', 'drink_id': '11007', 'drink_name': 'Margarita'},
+                           {'email': 'john@example.com', 'drink_id': '12528', 'drink_name': 'White Russian'},
+                           {'email': 'nobody@example.com', 'drink_id': '12528', 'drink_name': 'White Russian'}]:
+                f.write(json.dumps(record) + '\n')
+            f.write('not json\n')
+
+        result = app.test_cli_runner().invoke(args=['bulk', 'import', 'favorites', path])
+        self.assertIn('Imported 1 favorites; skipped 1 duplicates and 2 invalid records.', result.output)
+        self.assertIn('line 3: no user with the email nobody@example.com', result.output)
+        self.assertEqual(self.favorite_counts(), {'11007': 1, '12528': 1})
+
+    def test_bulk_admin_endpoints(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        body = '{"email": "john@example.com", "drink_id": "11007", "drink_name": "Margarita"}\n'
+        response = self.client.post('/api/v1/admin/import/favorites', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 403)
+
+        app.config['ADMIN_EMAILS'] = ['john@example.com']
+        try:
+            response = self.client.post('/api/v1/admin/import/favorites', data=body, content_type='application/x-ndjson')
+            self.assertEqual(response.get_json(), {'imported': 1, 'duplicates': 0, 'invalid': 0, 'errors': []})
+            response = self.client.post('/api/v1/admin/import/favorites', data=body, content_type='text/plain')
+            self.assertEqual(response.status_code, 400)
+
+            # Users are only imported here with a password hashing pool to run the hashes on
+            user = {'first_name': 'Ann', 'last_name': 'Lee', 'dob': '1985-02-03', 'address': '1 Elm St', 'city': 'Springfield',
+                    'state': 'IL', 'zip': '62701', 'phone_number': '5550000001', 'email': 'ann@example.com',
+                    'password': 'secret123'}
+            response = self.client.post('/api/v1/admin/import/users', data=json.dumps(user) + '\n',
+                                        content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('flask bulk import', response.get_json()['error'])
+            password_hasher.executor = ThreadPoolExecutor(max_workers=1)
+            try:
+                response = self.client.post('/api/v1/admin/import/users', data=json.dumps(user) + '\n',
+                                            content_type='application/x-ndjson')
+            finally:
+                password_hasher.executor.shutdown()
+                password_hasher.executor = None
+            self.assertEqual(response.get_json()['imported'], 1)
+            with app.app_context():
+                self.assertTrue(User.query.filter_by(email='ann@example.com').one().check_password('secret123'))
+
+            response = self.client.get('/api/v1/admin/export/favorites?format=csv')
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(response.headers['Content-Disposition'], 'attachment; filename=favorites.csv')
+            self.assertEqual(response.get_data(as_text=True).splitlines(),
+                             ['email,drink_id,drink_name,drink_thumb', 'john@example.com,11007,Margarita,'])
+
+            # The HTTP export never includes password hashes
+            users = self.client.get('/api/v1/admin/export/users?format=jsonl').get_data(as_text=True).splitlines()
+            self.assertEqual(len(users), 2)
+            self.assertNotIn('password_hash', users[0])
+        finally:
+            app.config['ADMIN_EMAILS'] = []
+
+    def test_api_requires_login(self):
+        # API clients get a 401 rather than a redirect to the login page
+        response = app.test_client().get('/api/v1/drinks/search?name=margarita')
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('error', response.get_json())
+
+    def test_api_search_returns_compact_drinks(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        response = self.client.get('/api/v1/drinks/search?name=margarita')
+        self.assertEqual(response.status_code, 200)
+        drinks = response.get_json()['drinks']
+        drink = drinks[0]
+        self.assertEqual(set(drink), {'id', 'name', 'thumb', 'ingredients'})
+        self.assertIn('Margarita', [d['name'] for d in drinks])
+        self.assertTrue(all(set(ingredient) == {'name', 'measure'} for ingredient in drink['ingredients']))
+
+    def test_api_filter_is_paginated(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        app.config['LISTING_PAGE_SIZE'] = 2
+        try:
+            fetches = upstream.request_count
+            first = self.client.get('/api/v1/drinks/filter/Alcoholic').get_json()
+            self.assertEqual(len(first['drinks']), 2)
+            self.assertTrue(all(drink['ingredients'] for drink in first['drinks']))
+            self.assertEqual((first['page'], first['next_page']), (1, 2))
+            # Only the page's drinks are looked up: one filter call and two lookups
+            self.assertEqual(upstream.request_count - fetches, 3)
+
+            last = self.client.get(f"/api/v1/drinks/filter/Alcoholic?page={first['pages']}").get_json()
+            self.assertIsNone(last['next_page'])
+            response = self.client.get(f"/api/v1/drinks/filter/Alcoholic?page={first['pages'] + 1}")
+            self.assertEqual(response.status_code, 404)
+        finally:
+            app.config['LISTING_PAGE_SIZE'] = 24
+
+    def test_api_answers_matching_etag_with_304(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+
+        response = self.client.get('/api/v1/drinks/letter/w')
+        etag = response.headers['ETag']
+        self.assertTrue(etag)
+
+        response = self.client.get('/api/v1/drinks/letter/w', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    def test_api_compresses_when_asked(self):
+        import gzip
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        app.config['API_COMPRESS_MIN_SIZE'] = 0
+        try:
+            plain = self.client.get('/api/v1/drinks/letter/w')
+            self.assertNotIn('Content-Encoding', plain.headers)
+
+            response = self.client.get('/api/v1/drinks/letter/w', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+            self.assertEqual(gzip.decompress(response.data), plain.data)
+            self.assertIn('Accept-Encoding', response.headers['Vary'])
+            # Each encoding gets its own ETag
+            self.assertNotEqual(response.headers['ETag'], plain.headers['ETag'])
+        finally:
+            app.config['API_COMPRESS_MIN_SIZE'] = 500
+
+    def test_api_favorites(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        with app.app_context():
+            db.session.add(FavoriteDrink(user_id=self.test_user.id, drink_id='11007', drink_name='Margarita', drink_thumb='t'))
+            db.session.commit()
+
+        page = self.client.get('/api/v1/favorites').get_json()
+        self.assertEqual([item['drink']['id'] for item in page['favorites']], ['11007'])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_metrics_endpoint(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        self.client.get('/search-drink-results?drink_name=margarita')
+
+        app.config['METRICS_ALLOWED_ADDRESSES'] = ('127.0.0.1',)
+        try:
+            response = self.client.get('/metrics')
+        finally:
+            app.config['METRICS_ALLOWED_ADDRESSES'] = ()
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{endpoint="main.login",method="POST",status="302"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{endpoint="main.search_drink_results",method="GET"} 1', body)
+        for component in ('upstream', 'db', 'password', 'template'):
+            self.assertIn(f'http_request_component_seconds_count{{component="{component}"}}', body)
+        self.assertIn('http_request_db_queries_count', body)
+        # Scrapes don't count themselves
+        self.assertNotIn('endpoint="metrics"', body)
+
+    def test_metrics_are_only_served_to_allowed_scrapers(self):
+        # Not even to localhost by default, which is every request behind a local reverse proxy
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        remote = {'REMOTE_ADDR': '203.0.113.9'}
+        self.assertEqual(self.client.get('/metrics', environ_base=remote).status_code, 403)
+
+        app.config['METRICS_TOKEN'] = 'scrape-me'
+        try:
+            response = self.client.get('/metrics', environ_base=remote, headers={'Authorization': 'Bearer wrong'})
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get('/metrics', environ_base=remote, headers={'Authorization': 'Bearer scrape-me'})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            app.config['METRICS_TOKEN'] = None
+
+    def test_failed_queries_dont_skew_later_query_timings(self):
+        with app.app_context():
+            with self.assertRaises(Exception):
+                db.session.execute(db.text('SELECT * FROM no_such_table'))
+            db.session.rollback()
+            self.assertFalse(db.session.connection().info.get('metrics_query_started'))
+
+    def test_slow_requests_are_logged_with_breakdown(self):
+        app.config['SLOW_REQUEST_THRESHOLD'] = 0
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'})
+        finally:
+            app.config['SLOW_REQUEST_THRESHOLD'] = 1.0
+        message = logs.output[0]
+        self.assertIn('Slow request: POST /login', message)
+        self.assertIn('password', message)
+        self.assertRegex(message, r'[1-9]\d* queries')
+
+
+    def test_streamed_pages_are_timed_until_the_body_is_done(self):
+        self.client.post('/login', data={'email': 'john@example.com', 'password': 'password123'}, follow_redirects=True)
+        catalog.cache.clear()
+        metrics.clear()
+        app.config['SLOW_REQUEST_THRESHOLD'] = 0
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                response = self.client.get('/filter-by-alcoholic/Alcoholic')
+                # The drinks are looked up while the body streams, so nothing is recorded yet
+                self.assertTrue(response.is_streamed)
+                self.assertNotIn('main.filter_by_alcoholic', metrics.duration.render())
+                response.get_data()
+        finally:
+            app.config['SLOW_REQUEST_THRESHOLD'] = 1.0
+        self.assertIn('http_request_duration_seconds_count{endpoint="main.filter_by_alcoholic",method="GET"} 1',
+                      metrics.duration.render())
+        self.assertIn('Slow request: GET /filter-by-alcoholic/Alcoholic', logs.output[-1])
+        self.assertIn('upstream', logs.output[-1])
+
+class AsyncTestingConfig(OfflineTestingConfig):
+    ASYNC_VIEWS = True
+
+
+class AsyncViewTests(unittest.TestCase):
+    """The async variants of the upstream-bound routes, on an app with ASYNC_VIEWS on"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(AsyncTestingConfig)
+        cls.client = cls.app.test_client()
+        with cls.app.app_context():
+            db.create_all()
+            user = User(first_name="Ann", last_name="Async", dob=date(1990, 1, 1), address="1 Main St",
+                        city="Sample City", state="SC", zip="12345", phone_number="5550001111",
+                        email="ann@example.com")
+            user.set_password("password123")
+            db.session.add(user)
+            db.session.commit()
+
+    @classmethod
+    def tearDownClass(cls):
+        with cls.app.app_context():
+            db.session.remove()
+            db.drop_all()
+        async_catalog.close()
+
+    def setUp(self):
+        user_cache.clear()
+        fragment_cache.clear()
+        self.client.post('/login', data={'email': 'ann@example.com', 'password': 'password123'})
+
+    def test_upstream_bound_routes_are_async(self):
+        for endpoint, view in ASYNC_VIEWS.items():
+            self.assertIs(self.app.view_functions[endpoint], view)
+        self.assertIsNot(app.view_functions['main.random_cocktail'], ASYNC_VIEWS['main.random_cocktail'])
+
+    def test_search_shares_the_catalog_cache(self):
+        response = self.client.get('/search-drink-results?drink_name=margarita')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Margarita', response.data)
+
+        fetches = upstream.request_count
+        self.assertEqual(catalog.search_drinks('margarita')[0].name, 'Margarita')
+        self.assertEqual(upstream.request_count, fetches)
+
+    def test_listing_pages(self):
+        response = self.client.get('/cocktails-by-letter/w')
+        self.assertTrue(response.is_streamed)
+        self.assertIn(b'Whiskey Sour', response.data)
+        self.assertEqual(self.client.get('/cocktails-by-letter/1').status_code, 302)
+
+        response = self.client.get('/filter-by-alcoholic/Non_Alcoholic')
+        self.assertIn(b'Afterglow', response.data)
+        # The page's details were fetched up front, concurrently
+        self.assertRegex(response.get_data(as_text=True), r'<p class="mb-0"><small>\w')
+
+    def test_random_cocktail_and_ingredient_search(self):
+        self.assertEqual(self.client.get('/random-cocktail').status_code, 200)
+
+        response = self.client.post('/ingredient-search', data={'ingredient_name': 'Vodka'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'Vodka', response.data)
+        self.assertEqual(self.client.get('/ingredient-search').status_code, 200)
+
+    def test_upstream_errors(self):
+        upstream.error_rate = 1
+        try:
+            response = self.client.get('/random-cocktail')
+        finally:
+            upstream.error_rate = 0
+            catalog.breaker.record_success()
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.get_json(), {"error": "Failed to retrieve random cocktail."})
+
+
+class ReplicaTestingConfig(OfflineTestingConfig):
+    DATABASE_DIR = tempfile.mkdtemp(prefix='replica-')
+    SQLALCHEMY_DATABASE_URI = f"sqlite:///{os.path.join(DATABASE_DIR, 'primary.db')}"
+    SQLALCHEMY_REPLICA_URI = f"sqlite:///{os.path.join(DATABASE_DIR, 'replica.db')}"
+
+
+class ReplicaRoutingTests(unittest.TestCase):
+    """Read/write routing between two SQLite files standing in for a primary and its replica"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = create_app(ReplicaTestingConfig)
+        cls.client = cls.app.test_client()
+        with cls.app.app_context():
+            cls.primary = db.get_engine()
+            cls.replica = db.get_engine(bind='replica')
+        for engine in (cls.primary, cls.replica):
+            db.Model.metadata.create_all(engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        for engine in (cls.primary, cls.replica):
+            engine.dispose()
+        shutil.rmtree(ReplicaTestingConfig.DATABASE_DIR, ignore_errors=True)
+
+    def setUp(self):
+        user_cache.clear()
+        with self.app.app_context():
+            user = User(first_name="Rita", last_name="Replica", dob=date(1990, 1, 1), address="1 Main St",
+                        city="Sample City", state="SC", zip="12345", phone_number="5550002222",
+                        email="rita@example.com")
+            user.set_password("password123")
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+        self.replicate()
+        self.client = self.app.test_client()
+        self.client.post('/login', data={'email': 'rita@example.com', 'password': 'password123'})
+
+    def tearDown(self):
+        for engine in (self.primary, self.replica):
+            with engine.begin() as connection:
+                for table in reversed(db.Model.metadata.sorted_tables):
+                    connection.execute(table.delete())
+
+    def replicate(self):
+        """Copy the primary's users and favorites to the replica, as replication would"""
+        tables = [User.__table__, FavoriteDrink.__table__]
+        with self.primary.connect() as source, self.replica.begin() as target:
+            for table in reversed(tables):
+                target.execute(table.delete())
+            for table in tables:
+                rows = [dict(row._mapping) for row in source.execute(table.select())]
+                if rows:
+                    target.execute(table.insert(), rows)
+
+    def favorite_ids(self):
+        return [favorite['drink_id'] for favorite in self.client.get('/favorites.json').get_json()['favorites']]
+
+    def test_favorites_are_read_from_the_replica(self):
+        with self.replica.begin() as connection:
+            connection.execute(FavoriteDrink.__table__.insert(),
+                               {'user_id': self.user_id, 'drink_id': '11000', 'drink_name': 'Mojito'})
+        self.assertEqual(self.favorite_ids(), ['11000'])
+
+    def test_users_read_their_own_writes(self):
+        response = self.client.post('/add-favorite/11007', data={'drink_name': 'Margarita', 'drink_thumb': ''})
+        self.assertTrue(response.get_json()['success'])
+
+        # The replica hasn't caught up, but the user who wrote reads from the primary for a while
+        self.assertEqual(self.favorite_ids(), ['11007'])
+
+        with self.client.session_transaction() as session:
+            session[PRIMARY_UNTIL_KEY] = 0
+        self.assertEqual(self.favorite_ids(), [])
+        self.replicate()
+        self.assertEqual(self.favorite_ids(), ['11007'])
+
+    def test_writes_in_replica_reads_go_to_the_primary(self):
+        with self.app.test_request_context(), read_replica():
+            query = FavoriteDrink.query.filter_by(user_id=self.user_id)
+            self.assertIs(db.session().get_bind(clause=query.statement), self.replica)
+
+            db.session.add(FavoriteDrink(user_id=self.user_id, drink_id='11001', drink_name='Old Fashioned'))
+            db.session.flush()
+            # Once the session has written, its reads stay on the primary
+            self.assertEqual([favorite.drink_id for favorite in query], ['11001'])
+            db.session.commit()
+            db.session.remove()
+
+        with self.primary.connect() as connection:
+            self.assertEqual(len(connection.execute(FavoriteDrink.__table__.select()).all()), 1)
+
 if __name__ == "__main__":
     unittest.main()
 
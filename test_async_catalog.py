@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import httpx
+
+from async_catalog import AsyncCatalog
+from catalog import CatalogClient, CatalogError, CircuitBreaker
+
+
+class AsyncCatalogTests(unittest.TestCase):
+
+    def setUp(self):
+        client = CatalogClient()
+        client.breaker = CircuitBreaker(failure_threshold=1)
+        self.catalog = AsyncCatalog(client, max_connections=2)
+        self.catalog._http = mock.Mock()
+
+    def test_pool_timeouts_dont_trip_the_breaker(self):
+        self.catalog._http.get = mock.AsyncMock(side_effect=httpx.PoolTimeout('no free connection'))
+        with self.assertRaises(CatalogError):
+            asyncio.run(self.catalog._fetch('random.php'))
+        self.assertEqual(self.catalog.client.breaker.state, 'closed')
+
+        self.catalog._http.get = mock.AsyncMock(side_effect=httpx.ConnectError('refused'))
+        with self.assertRaises(CatalogError):
+            asyncio.run(self.catalog._fetch('random.php'))
+        self.assertEqual(self.catalog.client.breaker.state, 'open')
+
+    def test_lookup_drinks_stays_within_the_pool(self):
+        running = []
+        most = 0
+
+        async def lookup_drink(drink_id):
+            nonlocal most
+            running.append(drink_id)
+            most = max(most, len(running))
+            await asyncio.sleep(0.01)
+            running.remove(drink_id)
+            return {'id': drink_id}
+
+        with mock.patch.object(self.catalog, '_local', return_value=None), \
+                mock.patch.object(self.catalog, 'lookup_drink', lookup_drink):
+            details = asyncio.run(self.catalog.lookup_drinks(range(10)))
+        self.assertEqual(len(details), 10)
+        self.assertEqual(most, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+from unittest import mock
+
+from cache_warmer import CacheWarmer
+from catalog import CatalogClient, CatalogUnavailable
+
+
+class CacheWarmerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = CatalogClient(maxsize=100)
+        self.fetch = mock.patch.object(self.client, 'fetch').start()
+        self.fetch.return_value = {'drinks': [{'idDrink': '1', 'strDrink': 'Whiskey Sour'}]}
+        self.addCleanup(mock.patch.stopall)
+        self.warmer = CacheWarmer(self.client, interval=60, top_searches=2)
+
+    def test_warms_letters_filters_and_top_searches(self):
+        for term in ['margarita', 'margarita', 'mojito', 'negroni']:
+            self.client._count_search(term)
+
+        self.assertEqual(self.warmer.warm(), 26 + 2 + 2)
+        self.fetch.assert_any_call('filter.php', {'a': 'Non_Alcoholic'})
+        self.fetch.assert_any_call('search.php', {'s': 'margarita'})
+
+        # Everything is fresh for longer than the next two passes
+        self.assertEqual(self.warmer.warm(), 0)
+        self.client.drinks_by_letter('q')
+        self.assertEqual(self.fetch.call_count, 30)
+
+    def test_pass_stops_while_the_api_is_unavailable(self):
+        self.fetch.side_effect = CatalogUnavailable('open')
+        self.assertEqual(self.warmer.warm(), 0)
+        self.fetch.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,276 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import requests
+from flask import Flask
+
+from catalog import CatalogClient, CatalogError, CatalogUnavailable, CircuitBreaker, TTLCache, rank_by_ingredients
+from drinks import Drink
+
+
+class TTLCacheTests(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set('a', 1, 60)
+        cache.set('b', 2, 60)
+        cache.get('a')  # 'a' is now the most recently used
+        cache.set('c', 3, 60)
+
+        self.assertEqual(cache.get('a'), (1, 'fresh'))
+        self.assertEqual(cache.get('b'), (None, None))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entries_go_stale_then_miss(self):
+        cache = TTLCache(maxsize=10, stale_ttl=60)
+        with mock.patch('catalog.time.monotonic', return_value=1000):
+            cache.set('a', 1, 10)
+        with mock.patch('catalog.time.monotonic', return_value=1020):
+            self.assertEqual(cache.get('a'), (1, 'stale'))
+        with mock.patch('catalog.time.monotonic', return_value=1100):
+            self.assertEqual(cache.get('a'), (1, 'expired'))
+
+        stats = cache.stats()
+        self.assertEqual((stats['stale_hits'], stats['misses']), (1, 1))
+
+
+class CatalogClientTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = CatalogClient(maxsize=10)
+        self.fetch = mock.patch.object(self.client, 'fetch').start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_repeated_searches_are_served_from_cache(self):
+        self.fetch.return_value = {'drinks': [{'idDrink': '11007', 'strDrink': 'Margarita'}]}
+
+        self.assertEqual(self.client.search_drinks('Margarita')[0].name, 'Margarita')
+        self.assertEqual(self.client.search_drinks(' margarita ')[0].name, 'Margarita')
+
+        self.fetch.assert_called_once_with('search.php', {'s': 'margarita'})
+        self.assertEqual(self.client.cache.stats()['hits'], 1)
+
+    def test_empty_results_return_empty_list(self):
+        self.fetch.return_value = {'drinks': None}
+        self.assertEqual(self.client.drinks_by_letter('x'), [])
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        self.client.cache.stale_ttl = 60
+        self.fetch.return_value = {'drinks': [{'strDrink': 'Old'}]}
+        self.client.drinks_by_letter('w')
+
+        # Age the entry past its TTL without expiring the stale window
+        key = ('search.php', (('f', 'w'),))
+        value, fresh_until, stale_until = self.client.cache._entries[key]
+        self.client.cache._entries[key] = (value, time.monotonic() - 1, stale_until)
+
+        self.fetch.return_value = {'drinks': [{'strDrink': 'New'}]}
+        self.assertEqual(self.client.drinks_by_letter('w')[0].name, 'Old')
+
+        for _ in range(100):
+            if self.client.cache.get(key)[0][0].name == 'New':
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.client.drinks_by_letter('w')[0].name, 'New')
+
+    def test_version_moves_only_when_refreshed_data_changes(self):
+        self.fetch.return_value = {'drinks': [{'idDrink': '1', 'strDrink': 'Old'}]}
+        self.client.drinks_by_letter('w')
+        version = self.client.catalog_version()
+
+        key = ('search.php', (('f', 'w'),))
+        self.client._store('letter', key, {'drinks': [{'idDrink': '1', 'strDrink': 'Old'}]})
+        self.assertEqual(self.client.catalog_version(), version)
+
+        self.client._store('letter', key, {'drinks': [{'idDrink': '1', 'strDrink': 'New'}]})
+        self.assertNotEqual(self.client.catalog_version(), version)
+
+    def test_errors_are_not_cached(self):
+        self.fetch.side_effect = CatalogError('down')
+        with self.assertRaises(CatalogError):
+            self.client.filter_by_alcoholic('Alcoholic')
+        self.assertEqual(len(self.client.cache), 0)
+
+    def test_expired_entry_is_served_when_api_fails(self):
+        self.fetch.return_value = {'drinks': [{'strDrink': 'Cached'}]}
+        self.client.drinks_by_letter('w')
+
+        key = ('search.php', (('f', 'w'),))
+        value = self.client.cache._entries[key][0]
+        self.client.cache._entries[key] = (value, 0, 0)
+
+        self.fetch.side_effect = CatalogError('down')
+        self.assertEqual(self.client.drinks_by_letter('w')[0].name, 'Cached')
+
+    def test_ingredient_lookups_fan_out_concurrently(self):
+        def slow_fetch(path, params):
+            time.sleep(0.2)
+            return {'drinks': [{'idDrink': params['i'], 'strDrink': params['i']}]}
+        self.fetch.side_effect = slow_fetch
+
+        started = time.monotonic()
+        results = self.client.filter_by_ingredients(['Gin', 'Vodka', 'Rum', 'Tequila'])
+
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual([drink.name for drink in results['Rum']], ['rum'])
+
+    def test_unknown_ingredient_returns_empty_list(self):
+        self.fetch.return_value = {'drinks': 'no data found'}
+        self.assertEqual(self.client.filter_by_ingredient('unobtainium'), [])
+
+    def test_lookup_drinks_uses_cache_then_fetches_misses(self):
+        # A letter page primes the details of every drink on it
+        self.fetch.return_value = {'drinks': [{'idDrink': '12528', 'strDrink': 'White Russian', 'strIngredient1': 'Vodka'}]}
+        self.client.drinks_by_letter('w')
+
+        self.fetch.side_effect = lambda path, params: {'drinks': [{'idDrink': params['i'], 'strDrink': 'Fetched'}]}
+        details = self.client.lookup_drinks(['12528', '11007', 11007])
+
+        self.assertEqual(details['12528'].name, 'White Russian')
+        self.assertEqual(details['11007'].name, 'Fetched')
+        self.assertEqual(self.fetch.call_count, 2)
+
+        # The fetched drink was written back
+        self.client.lookup_drinks(['11007'])
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_lookup_drinks_skips_failures(self):
+        def fetch(path, params):
+            if params['i'] == '2':
+                raise CatalogError('down')
+            return {'drinks': [{'idDrink': params['i'], 'strDrink': 'Ok'}]}
+        self.fetch.side_effect = fetch
+
+        self.assertEqual(list(self.client.lookup_drinks(['1', '2', '3'])), ['1', '3'])
+
+    def test_concurrent_misses_share_one_fetch(self):
+        release = threading.Event()
+
+        def slow_fetch(path, params):
+            release.wait(1)
+            return {'drinks': [{'idDrink': '1', 'strDrink': 'Whiskey Sour'}]}
+        self.fetch.side_effect = slow_fetch
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            futures = [pool.submit(self.client.drinks_by_letter, 'w') for _ in range(5)]
+            # Let every caller reach the cold cache before the fetch returns
+            while self.client.flights.coalesced < 4:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.fetch.assert_called_once()
+        self.assertTrue(all(result[0].name == 'Whiskey Sour' for result in results))
+
+    def test_coalesced_callers_share_the_error(self):
+        release = threading.Event()
+
+        def failing_fetch(path, params):
+            release.wait(1)
+            raise CatalogError('down')
+        self.fetch.side_effect = failing_fetch
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(self.client.filter_by_alcoholic, 'Alcoholic') for _ in range(3)]
+            while self.client.flights.coalesced < 2:
+                time.sleep(0.01)
+            release.set()
+            for future in futures:
+                self.assertRaises(CatalogError, future.result)
+        self.fetch.assert_called_once()
+
+    def test_warm_only_fetches_what_is_about_to_go_stale(self):
+        self.fetch.return_value = {'drinks': [{'idDrink': '1', 'strDrink': 'Whiskey Sour'}]}
+
+        self.assertTrue(self.client.warm('letter', 'search.php', {'f': 'w'}))
+        self.assertFalse(self.client.warm('letter', 'search.php', {'f': 'w'}, within=60))
+        # Fresh for an hour, so due within two hours
+        self.assertTrue(self.client.warm('letter', 'search.php', {'f': 'w'}, within=2 * 60 * 60))
+        self.assertEqual(self.fetch.call_count, 2)
+
+        self.client.drinks_by_letter('w')
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_top_searches_are_counted(self):
+        self.fetch.return_value = {'drinks': None}
+        for term in ['Margarita', 'mojito', ' margarita', 'Negroni', 'MARGARITA', 'mojito']:
+            self.client.search_drinks(term)
+
+        self.assertEqual(self.client.top_searches(2), ['margarita', 'mojito'])
+
+    def test_rank_by_ingredients_puts_intersection_first(self):
+        margarita = Drink('1', 'Margarita')
+        daiquiri = Drink('2', 'Daiquiri')
+        paloma = Drink('3', 'Paloma')
+
+        ranked = rank_by_ingredients({
+            'Tequila': [margarita, paloma],
+            'Lime juice': [daiquiri, margarita],
+        })
+        self.assertEqual(ranked, [
+            (margarita, ['Tequila', 'Lime juice']),
+            (daiquiri, ['Lime juice']),
+            (paloma, ['Tequila']),
+        ])
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def test_opens_after_threshold_and_half_opens_after_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        with mock.patch('catalog.time.monotonic', return_value=100):
+            breaker.record_failure()
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+            self.assertEqual(breaker.state, 'open')
+            self.assertFalse(breaker.allow())
+
+        with mock.patch('catalog.time.monotonic', return_value=131):
+            self.assertEqual(breaker.state, 'half_open')
+            self.assertTrue(breaker.allow())
+            # Only one trial call at a time
+            self.assertFalse(breaker.allow())
+            breaker.record_success()
+            self.assertEqual(breaker.state, 'closed')
+
+    def test_client_fails_fast_while_open(self):
+        client = CatalogClient()
+        client.breaker = CircuitBreaker(failure_threshold=1)
+        client.session = mock.Mock()
+        client.session.get.side_effect = requests.ConnectionError('refused')
+
+        with self.assertRaises(CatalogError):
+            client.fetch('random.php')
+        with self.assertRaises(CatalogUnavailable):
+            client.fetch('random.php')
+        self.assertEqual(client.session.get.call_count, 1)
+
+    def test_requests_use_pooled_session_with_timeout(self):
+        client = CatalogClient()
+        client.session = mock.Mock()
+        client.session.get.return_value = mock.Mock(status_code=200, content=b'{}', json=lambda: {'drinks': None})
+
+        self.assertIsNone(client.random_drink())
+        client.session.get.assert_called_once_with(
+            f"{client.base_url}/random.php", params=None, timeout=client.timeout)
+
+
+    def test_session_and_pool_are_made_on_use_and_closed_on_reconfigure(self):
+        client = CatalogClient()
+        self.assertIsNone(client._session)
+        self.assertIsNone(client._executor)
+
+        session, executor = client.session, client.executor
+        client.init_app(Flask(__name__))
+        # The old ones are closed rather than leaked; the new ones use the app's settings
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+        self.assertIsNot(client.session, session)
+        self.assertEqual(client.executor._max_workers, 8)
+        client.close()
+
+if __name__ == "__main__":
+    unittest.main()
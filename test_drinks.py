@@ -0,0 +1,48 @@
+import json
+import os
+import unittest
+
+from drinks import Drink, Ingredient
+
+FIXTURE_DUMP = os.path.join(os.path.dirname(__file__), 'fixtures', 'cocktaildb_dump.json')
+
+
+class DrinkTests(unittest.TestCase):
+
+    def setUp(self):
+        with open(FIXTURE_DUMP) as f:
+            self.raw = json.load(f)['drinks']
+
+    def test_from_api_keeps_recipe_in_order_and_drops_nulls(self):
+        data = next(d for d in self.raw if d['idDrink'] == '12528')
+        drink = Drink.from_api(data)
+
+        self.assertEqual((drink.id, drink.name, drink.alcoholic), ('12528', 'White Russian', 'Alcoholic'))
+        self.assertEqual(drink.ingredients, (
+            Ingredient('Vodka', '2 oz'),
+            Ingredient('Coffee liqueur', '1 oz'),
+            Ingredient('Light cream', ''),
+        ))
+        self.assertEqual(drink.ingredient_names, ['Vodka', 'Coffee liqueur', 'Light cream'])
+
+    def test_thumb_only_drinks(self):
+        drink = Drink.from_api({'idDrink': 11007, 'strDrink': 'Margarita', 'strDrinkThumb': 'x'})
+        self.assertEqual(drink.id, '11007')
+        self.assertEqual(drink.ingredients, ())
+        self.assertIsNone(drink.category)
+
+    def test_repeated_strings_are_shared(self):
+        # Decoding the same drink twice gives two separate copies of every string
+        first, second = (Drink.from_api(data) for data in json.loads(json.dumps(self.raw[:1] * 2)))
+        self.assertIs(first.ingredients[0].name, second.ingredients[0].name)
+        self.assertIs(first.category, second.category)
+
+    def test_drinks_have_no_instance_dict(self):
+        drink = Drink.from_api(self.raw[0])
+        self.assertFalse(hasattr(drink, '__dict__'))
+        with self.assertRaises(AttributeError):
+            drink.strDrink = 'nope'
+
+
+if __name__ == "__main__":
+    unittest.main()
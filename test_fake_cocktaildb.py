@@ -0,0 +1,30 @@
+import unittest
+
+from catalog import CatalogClient, CatalogError
+from fake_cocktaildb import FakeCocktailDB
+
+
+class FakeCocktailDBTests(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = FakeCocktailDB(seed=1).start()
+        self.addCleanup(self.upstream.stop)
+        self.client = CatalogClient(maxsize=10)
+        self.client.base_url = self.upstream.url
+
+    def test_serves_the_api_shapes_the_client_expects(self):
+        self.assertEqual([drink.name for drink in self.client.drinks_by_letter('w')], ['White Russian', 'Whiskey Sour'])
+        self.assertEqual([drink.id for drink in self.client.filter_by_ingredient('GIN')], ['11003', '11005'])
+        self.assertEqual(self.client.filter_by_ingredient('unobtainium'), [])
+        self.assertEqual(self.client.lookup_drink('11007').ingredient_names[0], 'Tequila')
+        self.assertEqual(self.client.search_ingredients('vodka')[0]['strABV'], '40')
+
+    def test_injected_errors(self):
+        self.upstream.error_rate = 1
+        self.client.session = self.client._make_session(retries=0)
+        with self.assertRaises(CatalogError):
+            self.client.search_drinks('margarita')
+
+
+if __name__ == "__main__":
+    unittest.main()
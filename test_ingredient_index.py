@@ -0,0 +1,76 @@
+import json
+import os
+import random
+import unittest
+
+from drinks import Drink
+from ingredient_index import IngredientIndex, recipe_keys
+
+FIXTURE_DUMP = os.path.join(os.path.dirname(__file__), 'fixtures', 'cocktaildb_dump.json')
+
+
+def drink(id, name, *ingredients):
+    return Drink(id, name, ingredients=[(ingredient, None) for ingredient in ingredients])
+
+
+class IngredientIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        with open(FIXTURE_DUMP) as f:
+            self.drinks = [Drink.from_api(data) for data in json.load(f)['drinks']]
+        self.index = IngredientIndex()
+        self.index.update(self.drinks)
+
+    def names(self, drinks):
+        return [drink.name for drink in drinks]
+
+    def test_makeable(self):
+        pantry = ['gin', 'Campari', 'sweet vermouth ', 'Vodka', 'Coffee liqueur']
+        self.assertEqual(self.names(self.index.makeable(pantry)), ['Negroni'])
+
+    def test_missing_one_or_two(self):
+        results = self.index.missing(['Tequila', 'Lime juice', 'Gin'], max_missing=2)
+
+        self.assertEqual(results[0], [])
+        self.assertEqual(
+            [(d.name, missing) for d, missing in results[1]],
+            [("Tommy's Margarita", ['Agave syrup'])],
+        )
+        self.assertEqual(
+            [(d.name, missing) for d, missing in results[2]],
+            [('Blue Margarita', ['Blue Curacao', 'Salt']), ('Dry Martini', ['Dry Vermouth', 'Olive']),
+             ('Margarita', ['Salt', 'Triple sec']), ('Negroni', ['Campari', 'Sweet Vermouth'])],
+        )
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        everything = sorted({key for d in self.drinks for key in recipe_keys(d)})
+        for _ in range(50):
+            pantry = rng.sample(everything, rng.randint(0, len(everything)))
+            results = self.index.missing(pantry, max_missing=2)
+            for n in range(3):
+                expected = sorted(d.name for d in self.drinks if len(recipe_keys(d) - set(pantry)) == n)
+                self.assertEqual(self.names(d for d, missing in results[n]), expected)
+
+    def test_incremental_update_and_remove(self):
+        self.index.update([drink('11003', 'Negroni', 'Gin', 'Campari', 'Sweet Vermouth', 'Orange peel')])
+        self.assertEqual(self.index.makeable(['Gin', 'Campari', 'Sweet Vermouth']), [])
+
+        self.index.remove(['11003'])
+        self.index.update([drink('999', 'Gin and Campari', 'Gin', 'Campari')])
+        self.assertEqual(self.names(self.index.makeable(['Gin', 'Campari', 'Sweet Vermouth'])), ['Gin and Campari'])
+        self.assertEqual(len(self.index), len(self.drinks))
+
+    def test_sync_drops_drinks_no_longer_listed(self):
+        self.index.sync(self.drinks[:2], version=3)
+        self.assertEqual(len(self.index), 2)
+        self.assertEqual(self.index.loaded_version, 3)
+        self.assertEqual(self.index.makeable(['Gin', 'Campari', 'Sweet Vermouth']), [])
+
+    def test_drinks_without_recipes_are_skipped(self):
+        self.index.update([Drink('1', 'Thumb only', 'x')])
+        self.assertEqual(len(self.index), len(self.drinks))
+
+
+if __name__ == "__main__":
+    unittest.main()
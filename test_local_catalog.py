@@ -0,0 +1,94 @@
+import os
+import unittest
+from unittest import mock
+
+from flask import Flask
+
+from local_catalog import catalog_cli, fetch_catalog_dump, local_catalog
+from models import connect_db, db, CatalogDrink
+
+FIXTURE_DUMP = os.path.join(os.path.dirname(__file__), 'fixtures', 'cocktaildb_dump.json')
+
+
+class LocalCatalogTests(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        self.app.cli.add_command(catalog_cli)
+        connect_db(self.app)
+
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        db.create_all()
+
+        result = self.app.test_cli_runner().invoke(args=['catalog', 'sync', '--from-file', FIXTURE_DUMP])
+        self.assertIn('Imported 13 drinks and 11 ingredients.', result.output)
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def test_sync_normalizes_ingredients(self):
+        margarita = CatalogDrink.query.get(11007)
+        self.assertEqual(margarita.first_letter, 'm')
+        self.assertEqual(
+            [(i.position, i.ingredient_name, i.measure) for i in margarita.ingredients],
+            [(1, 'Tequila', '1 1/2 oz'), (2, 'Triple sec', '1/2 oz'), (3, 'Lime juice', '1 oz'), (4, 'Salt', None)],
+        )
+
+    def test_sync_replaces_previous_import(self):
+        version = local_catalog.catalog_version()
+        result = self.app.test_cli_runner().invoke(args=['catalog', 'sync', '--from-file', FIXTURE_DUMP])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(CatalogDrink.query.count(), 13)
+        self.assertEqual(local_catalog.catalog_version(), version + 1)
+
+    def test_search_drinks(self):
+        names = [drink.name for drink in local_catalog.search_drinks('MARGARITA')]
+        self.assertEqual(names, ['Blue Margarita', 'Margarita', "Tommy's Margarita"])
+        self.assertEqual(local_catalog.search_drinks('100%'), [])
+
+    def test_drinks_by_letter_match_api_client(self):
+        drinks = local_catalog.drinks_by_letter('W')
+        self.assertEqual([drink.name for drink in drinks], ['Whiskey Sour', 'White Russian'])
+        white_russian = drinks[1]
+        self.assertEqual(white_russian.id, '12528')
+        self.assertEqual(white_russian.ingredients[1], ('Coffee liqueur', '1 oz'))
+
+    def test_filter_by_alcoholic(self):
+        names = [drink.name for drink in local_catalog.filter_by_alcoholic('Non_Alcoholic')]
+        self.assertEqual(names, ['Afterglow', 'Apello'])
+
+    def test_filter_by_ingredients(self):
+        results = local_catalog.filter_by_ingredients(['Lemon', 'GIN'])
+        self.assertEqual([d.name for d in results['Lemon']], ['Whiskey Sour'])
+        self.assertEqual([d.name for d in results['GIN']], ['Dry Martini', 'Negroni'])
+
+    def test_lookup_drinks(self):
+        details = local_catalog.lookup_drinks(['11007', 12528, '404', 'bad'])
+        self.assertEqual(sorted(details), ['11007', '12528'])
+        self.assertEqual(details['11007'].ingredient_names[0], 'Tequila')
+
+    def test_search_ingredients(self):
+        ingredients = local_catalog.search_ingredients('vodka')
+        self.assertEqual([i['strIngredient'] for i in ingredients], ['Vodka'])
+        self.assertEqual(ingredients[0]['strABV'], '40')
+
+    def test_fetch_catalog_dump_walks_letters_and_ingredients(self):
+        client = mock.Mock()
+        client.fetch.side_effect = lambda path, params: {
+            ('search.php', 'f', 'a'): {'drinks': [{'idDrink': '1', 'strDrink': 'A1'}]},
+            ('list.php', 'i', 'list'): {'drinks': [{'strIngredient1': 'Gin'}]},
+            ('search.php', 'i', 'Gin'): {'ingredients': [{'idIngredient': '2', 'strIngredient': 'Gin'}]},
+        }.get((path,) + next(iter(params.items())), {'drinks': None})
+
+        dump = fetch_catalog_dump(client)
+        self.assertEqual([d['strDrink'] for d in dump['drinks']], ['A1'])
+        self.assertEqual([i['strIngredient'] for i in dump['ingredients']], ['Gin'])
+
+
+if __name__ == "__main__":
+    unittest.main()
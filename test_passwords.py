@@ -0,0 +1,48 @@
+import unittest
+
+from flask import Flask
+
+from passwords import PasswordHasher, hash_cost
+
+
+class PasswordHasherTests(unittest.TestCase):
+
+    def make_hasher(self, pool):
+        app = Flask(__name__)
+        app.config['BCRYPT_LOG_ROUNDS'] = 4
+        app.config['PASSWORD_HASH_POOL'] = pool
+        hasher = PasswordHasher()
+        hasher.init_app(app)
+        if hasher.executor is not None:
+            self.addCleanup(hasher.executor.shutdown)
+
+        ctx = app.app_context()
+        ctx.push()
+        self.addCleanup(ctx.pop)
+        return app, hasher
+
+    def test_hash_and_check_in_each_mode(self):
+        for pool in (None, 'thread', 'process'):
+            with self.subTest(pool=pool):
+                app, hasher = self.make_hasher(pool)
+                password_hash = hasher.hash('password123')
+
+                self.assertEqual(hash_cost(password_hash), 4)
+                self.assertTrue(hasher.check(password_hash, 'password123'))
+                self.assertFalse(hasher.check(password_hash, 'wrong'))
+
+    def test_needs_rehash_follows_configured_cost(self):
+        app, hasher = self.make_hasher(None)
+        password_hash = hasher.hash('password123')
+        self.assertFalse(hasher.needs_rehash(password_hash))
+
+        app.config['BCRYPT_LOG_ROUNDS'] = 5
+        self.assertTrue(hasher.needs_rehash(password_hash))
+
+    def test_rejects_unknown_pool(self):
+        with self.assertRaises(ValueError):
+            self.make_hasher('gevent')
+
+
+if __name__ == "__main__":
+    unittest.main()
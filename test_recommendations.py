@@ -0,0 +1,94 @@
+import threading
+import time
+import unittest
+
+import numpy as np
+from flask import Flask
+from scipy import sparse
+
+from recommendations import RecommendationIndex, cosine_similarity, top_k_per_row
+
+
+class RecommendationIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        # Everyone who likes a likes b; only user 3 also likes c
+        favorites = [(1, 'a'), (1, 'b'), (2, 'a'), (2, 'b'), (3, 'a'), (3, 'b'), (3, 'c'), (4, 'd'), (4, 'd')]
+        user_ids, drink_ids = zip(*favorites)
+        self.index = RecommendationIndex(neighbors=2).build(user_ids, drink_ids, {'b': ('Bramble', 'b.jpg')})
+
+    def test_similar_drinks_are_ranked_by_cosine(self):
+        similar = self.index.similar('a')
+        self.assertEqual([(r.drink_id, r.score) for r in similar], [('b', 1.0), ('c', round(1 / 3 ** 0.5, 4))])
+        self.assertEqual(similar[0].drink_name, 'Bramble')
+        self.assertEqual(self.index.similar('a', k=1)[0].drink_id, 'b')
+
+    def test_drinks_nobody_shares_have_no_neighbors(self):
+        self.assertEqual(self.index.similar('d'), [])
+        self.assertEqual(self.index.similar('unknown'), [])
+
+    def test_recommendations_leave_out_what_the_user_has(self):
+        self.assertEqual([r.drink_id for r in self.index.for_drinks(['a', 'b'])], ['c'])
+        self.assertEqual([r.drink_id for r in self.index.for_drinks(['c'])], ['a', 'b'])
+        self.assertEqual(self.index.for_drinks(['unknown']), [])
+        self.assertEqual(self.index.for_drinks(['c'], k=0), [])
+
+    def test_nothing_is_recommended_until_the_refresh_thread_has_built(self):
+        index = RecommendationIndex()
+        release = threading.Event()
+        index._thread = threading.Thread(target=release.wait, daemon=True)
+        index._thread.start()
+        self.addCleanup(release.set)
+
+        # Answered straight away, without building on the request thread
+        self.assertEqual(index.similar('a'), [])
+        self.assertEqual(index.for_drinks(['a']), [])
+        self.assertEqual(index.for_user(1), [])
+
+    def test_a_failed_first_build_is_retried_soon(self):
+        index = RecommendationIndex(interval=3600)
+        attempts = []
+
+        def load():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise RuntimeError('database not up yet')
+            return index.build([1, 1], ['a', 'b'])
+
+        index.load = load
+        index.start(Flask(__name__))
+        self.addCleanup(index.stop)
+        deadline = time.monotonic() + 5
+        while not len(index) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(len(attempts), 2)
+
+    def test_an_empty_index(self):
+        index = RecommendationIndex().build([], [])
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.similar('a'), [])
+        self.assertEqual(index.for_drinks(['a']), [])
+
+    def test_vectorized_ops_match_a_dense_computation(self):
+        rng = np.random.default_rng(1)
+        users, drinks = rng.integers(0, 50, 400), rng.integers(0, 30, 400)
+        similarity = cosine_similarity(users, drinks, 50, 30)
+
+        dense = np.zeros((50, 30))
+        dense[users, drinks] = 1
+        counts = dense.T @ dense
+        norms = np.sqrt(np.diag(counts))
+        expected = np.divide(counts, np.outer(norms, norms), out=np.zeros_like(counts), where=counts > 0)
+        np.fill_diagonal(expected, 0)
+        np.testing.assert_allclose(similarity.toarray(), expected, rtol=1e-5)
+
+        columns, scores = top_k_per_row(sparse.csr_matrix(expected), 3)
+        for row in range(30):
+            best = sorted(range(30), key=lambda column: (-expected[row, column], column))[:3]
+            best = [column for column in best if expected[row, column] > 0]
+            self.assertEqual(columns[row, :len(best)].tolist(), best)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from drinks import Drink
+from suggest_index import SuggestIndex, suggest_key
+
+
+def drink(id, name, *ingredients):
+    return Drink(id, name, ingredients=[(ingredient, '') for ingredient in ingredients])
+
+
+class SuggestIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = SuggestIndex()
+        self.index.sync([
+            drink('1', 'Margarita', 'Tequila', 'Triple sec', 'Lime juice'),
+            drink('2', 'White Russian', 'Vodka', 'Coffee liqueur', 'Light cream'),
+            drink('3', 'Mojito', 'Light rum', 'Lime', 'Mint'),
+            drink('4', 'Piña Colada', 'Light rum', 'Coconut cream', 'Pineapple'),
+        ], version='v1')
+
+    def names(self, query, **kwargs):
+        return [suggestion.name for suggestion in self.index.suggest(query, **kwargs)]
+
+    def test_whole_name_prefixes_come_before_later_words(self):
+        self.assertEqual(self.names('li'), ['Light cream', 'Light rum', 'Lime', 'Lime juice', 'Coffee liqueur'])
+        self.assertEqual(self.names('cream'), ['Coconut cream', 'Light cream'])
+
+    def test_drinks_carry_their_id_and_type_filters(self):
+        suggestion = self.index.suggest('marg')[0]
+        self.assertEqual((suggestion.name, suggestion.type, suggestion.id), ('Margarita', 'drink', '1'))
+        self.assertEqual(self.names('m', type='ingredient'), ['Mint'])
+
+    def test_typos_fall_back_to_trigrams(self):
+        self.assertEqual(self.names('margirata')[0], 'Margarita')
+        self.assertEqual(self.names('wite russain')[0], 'White Russian')
+        self.assertEqual(self.names('xyzzy'), [])
+
+    def test_accents_and_spacing_are_ignored(self):
+        self.assertEqual(suggest_key('  Piña   Colada '), 'pina colada')
+        self.assertEqual(self.names('pina c'), ['Piña Colada'])
+
+    def test_limit_and_empty_query(self):
+        self.assertEqual(len(self.index.suggest('l', limit=2)), 2)
+        self.assertEqual(self.index.suggest('   '), [])
+        self.assertEqual(self.index.loaded_version, 'v1')
+
+    def test_refresh_only_rebuilds_for_a_new_catalog_version(self):
+        class Backend:
+            version = 'v1'
+            loads = 0
+
+            def catalog_version(self):
+                return self.version
+
+            def all_drinks(self):
+                self.loads += 1
+                return [drink('5', 'Negroni', 'Gin', 'Campari')]
+
+        backend = Backend()
+        self.index.refresh(backend)
+        self.assertEqual((backend.loads, self.names('neg')), (0, []))
+        backend.version = 'v2'
+        self.index.refresh(backend)
+        self.assertEqual((backend.loads, self.names('neg')), (1, ['Negroni']))
+
+        # With a refresh thread running, a request never loads the index itself
+        empty = SuggestIndex()
+        empty._thread = type('Thread', (), {'is_alive': lambda self: True})()
+        self.assertEqual(len(empty.ready(backend)), 0)
+        self.assertEqual(backend.loads, 1)
+        empty._thread = None
+        self.assertEqual(len(empty.ready(backend)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
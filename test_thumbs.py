@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from catalog import CatalogClient
+from fake_cocktaildb import FakeCocktailDB
+from thumbs import ThumbnailCache, ThumbnailError
+
+
+class ThumbnailCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.upstream = FakeCocktailDB(seed=1).start()
+        self.addCleanup(self.upstream.stop)
+        self.directory = tempfile.mkdtemp(prefix='thumbs-')
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.cache = ThumbnailCache(self.directory)
+        self.images = self.upstream.url.replace('/api/json/v1/1', '/images/media/drink')
+
+    def test_identical_images_are_stored_once(self):
+        path, digest = self.cache.get('1', 'small', f'{self.images}/a.jpg')
+        # Another drink pointing at the same picture shares the file
+        self.assertEqual(self.cache.get('2', 'small', f'{self.images}/a.jpg'), (path, digest))
+        self.assertEqual(self.cache.stats()['images'], 1)
+
+        self.assertEqual(self.cache.cached('1', 'small'), (path, digest))
+        self.assertIsNone(self.cache.cached('1', 'medium'))
+
+    def test_least_recently_served_images_are_evicted(self):
+        self.cache.max_bytes = 2000
+        old, _ = self.cache.get('1', 'medium', f'{self.images}/a.jpg')
+        os.utime(old, (time.time() - 3600, time.time() - 3600))
+        self.cache.get('2', 'medium', f'{self.images}/b.jpg')
+        self.cache.get('3', 'medium', f'{self.images}/c.jpg')
+
+        self.assertFalse(os.path.exists(old))
+        self.assertLessEqual(self.cache.stats()['bytes'], 2000)
+        # Its ref now misses, so the next request fetches it again
+        self.assertIsNone(self.cache.cached('1', 'medium'))
+
+    def test_the_cap_holds_across_processes(self):
+        # Another worker's cache over the same directory
+        other = ThumbnailCache(self.directory)
+        self.cache.max_bytes = other.max_bytes = 3000
+        self.cache.get('1', 'medium', f'{self.images}/a.jpg')
+        other.get('2', 'medium', f'{self.images}/b.jpg')
+        # Only the two caches' images together pass the cap
+        self.cache.get('3', 'medium', f'{self.images}/c.jpg')
+
+        self.assertLessEqual(self.cache.stats()['bytes'], 3000)
+
+    def test_upstream_errors_are_raised(self):
+        self.upstream.error_rate = 1
+        self.cache.session = CatalogClient._make_session(retries=0)
+        with self.assertRaises(ThumbnailError):
+            self.cache.get('1', 'small', f'{self.images}/a.jpg')
+        self.assertEqual(self.cache.stats()['images'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
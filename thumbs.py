@@ -0,0 +1,175 @@
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+from catalog import CatalogClient, SingleFlight
+from metrics import timed
+
+# The variants CocktailDB serves for every thumbnail, by the suffix added to its URL
+THUMB_SIZES = {
+    'small': '/preview',   # 100px
+    'medium': '/medium',   # 350px
+    'full': '',
+}
+
+# Hits only refresh a file's age this often, so serving a thumbnail stays a stat and a sendfile
+TOUCH_INTERVAL = 60 * 60
+
+
+class ThumbnailError(Exception):
+    """Raised when a thumbnail can't be fetched from upstream"""
+
+
+class ThumbnailCache:
+    """Size-capped, content-addressed disk cache of drink thumbnails
+
+    Images are stored once under the SHA-256 of their bytes
+    (blobs/ab/abcd….jpg); small ref files map a drink and size to the
+    digest, so every process on the machine shares one copy. When the
+    blobs outgrow THUMB_CACHE_MAX_BYTES the least recently served ones
+    are deleted until the cache is back under 90% of the cap; refs to a
+    deleted blob are refetched on their next request. The running total
+    is kept in a file every process updates under a lock, so the cap
+    holds for all of them together.
+    """
+
+    def __init__(self, directory=None, max_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.session = CatalogClient._make_session()
+        self.timeout = (3.05, 10)
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the cache from the app's config"""
+        app.config.setdefault('THUMB_CACHE_DIR', os.path.join(app.instance_path, 'thumbs'))
+        app.config.setdefault('THUMB_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+        app.config.setdefault('THUMB_FETCH_TIMEOUT', 10)
+        app.config.setdefault('THUMB_MAX_AGE', 365 * 24 * 60 * 60)
+        self.directory = app.config['THUMB_CACHE_DIR']
+        self.max_bytes = app.config['THUMB_CACHE_MAX_BYTES']
+        self.timeout = (3.05, app.config['THUMB_FETCH_TIMEOUT'])
+        app.extensions['thumb_cache'] = self
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, 'blobs', digest[:2], f'{digest}.jpg')
+
+    def _ref_path(self, drink_id, size):
+        return os.path.join(self.directory, 'refs', size, drink_id)
+
+    def cached(self, drink_id, size):
+        """Return (path, digest) of a cached thumbnail, or None"""
+        try:
+            with open(self._ref_path(drink_id, size)) as f:
+                digest = f.read().strip()
+            path = self._blob_path(digest)
+            modified = os.stat(path).st_mtime
+        except (FileNotFoundError, ValueError):
+            return None
+
+        # The file's mtime is its last use, which eviction goes by
+        now = time.time()
+        if now - modified > TOUCH_INTERVAL:
+            try:
+                os.utime(path, (now, now))
+            except FileNotFoundError:
+                return None
+        return path, digest
+
+    def get(self, drink_id, size, thumb_url):
+        """Return (path, digest) of a thumbnail, fetching it from upstream the first time"""
+        found = self.cached(drink_id, size)
+        if found is not None:
+            return found
+        # Concurrent first requests for one image share a single download
+        return self.flights.do((drink_id, size), lambda: self._fetch(drink_id, size, thumb_url + THUMB_SIZES[size]))
+
+    def _fetch(self, drink_id, size, url):
+        try:
+            with timed('upstream'):
+                response = self.session.get(url, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise ThumbnailError(f"Could not fetch {url}: {e}") from e
+        if response.status_code != 200 or not response.content:
+            raise ThumbnailError(f"{url} returned status {response.status_code}")
+
+        content = response.content
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            self._write(path, content)
+            self._added(len(content))
+        self._write(self._ref_path(drink_id, size), digest.encode('ascii'))
+        return path, digest
+
+    @staticmethod
+    def _write(path, content):
+        """Write a file atomically, so readers never see half of it"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _blobs(self):
+        """Return (mtime, size, path) of every stored image"""
+        blobs = []
+        for root, dirs, files in os.walk(os.path.join(self.directory, 'blobs')):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, path))
+        return blobs
+
+    def _added(self, size):
+        """Add a new image to the total shared by every process, evicting once it passes the cap"""
+        fd = os.open(os.path.join(self.directory, 'total_bytes'), os.O_RDWR | os.O_CREAT)
+        with self._lock, os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                total = int(f.read()) + size
+            except ValueError:
+                # No total yet; the new image is on disk already, so the scan counts it
+                total = sum(blob_size for mtime, blob_size, path in self._blobs())
+            if total > self.max_bytes:
+                total = self._evict()
+            f.seek(0)
+            f.truncate()
+            f.write(str(total))
+
+    def _evict(self):
+        """Delete the least recently served images until under 90% of the cap; returns the new total"""
+        blobs = sorted(self._blobs())
+        total = sum(size for mtime, size, path in blobs)
+        for mtime, size, path in blobs:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def stats(self):
+        """Return how many images are stored and their total size"""
+        blobs = self._blobs()
+        return {'images': len(blobs), 'bytes': sum(size for mtime, size, path in blobs), 'max_bytes': self.max_bytes}
+
+
+thumb_cache = ThumbnailCache()
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import session
+
+from models import db, User
+
+# Session key holding when the logged-in user's row last changed
+SESSION_STAMP_KEY = 'user_stamp'
+
+
+class UserCache:
+    """Per-process cache of logged-in users so most requests skip the users table
+
+    Cached users are kept detached and merged into each request's session
+    without a SELECT. An entry is only used while it is younger than the
+    TTL and newer than the stamp the user's session carries; routes that
+    change the user call mark_changed(), which drops this process's entry
+    and moves the stamp forward so every other process reloads too.
+    Changes made from another session are picked up within the TTL.
+    """
+
+    def __init__(self, ttl=60, maxsize=10000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configure the cache from the app's config"""
+        app.config.setdefault('USER_CACHE_TTL', 60)
+        app.config.setdefault('USER_CACHE_SIZE', 10000)
+        self.ttl = app.config['USER_CACHE_TTL']
+        self.maxsize = app.config['USER_CACHE_SIZE']
+        self.clear()
+
+    def load(self, user_id):
+        """Return the user for a request, from the cache when it is still valid"""
+        now = time.time()
+        stamp = session.get(SESSION_STAMP_KEY, 0)
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                user, loaded_at = entry
+                if loaded_at > stamp and now - loaded_at < self.ttl:
+                    self._entries.move_to_end(user_id)
+                    return db.session.merge(user, load=False)
+                del self._entries[user_id]
+
+        user = User.query.get(user_id)
+        if user is None:
+            return None
+
+        # Cache a detached copy and hand the request its own attached one
+        db.session.expunge(user)
+        with self._lock:
+            self._entries[user_id] = (user, now)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return db.session.merge(user, load=False)
+
+    def invalidate(self, user_id):
+        """Drop a user from this process's cache"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def mark_changed(self, user_id):
+        """Call after committing a change to a user so no process serves the old row"""
+        self.invalidate(user_id)
+        session[SESSION_STAMP_KEY] = time.time()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_cache = UserCache()